@@ -1,608 +1,75 @@
-import re
-import unicodedata
+import gzip
+import io
 import json
-import os
-from threading import Lock
-from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, Tuple
 
 import streamlit as st
 
-
-# =========================================================
-# PTC – STAMMDATEN
-# =========================================================
-STUDIO = {
-    "name": "PTC Fitnessstudio Hildesheim",
-    "phone_display": "05121 2819760",
-    "phone_tel": "tel:+4951212819760",
-    "address": "Rudolf-Diesel-Straße 8, 31137 Hildesheim",
-    "parking": "Direkt am Studio stehen ausreichend kostenlose Parkplätze zur Verfügung.",
-    "opening_hours": (
-        "Montag, Mittwoch, Freitag: 08:00–20:00 Uhr\n"
-        "Dienstag & Donnerstag: 09:00–20:00 Uhr\n"
-        "Samstag: 10:00–14:00 Uhr\n"
-        "Sonntag: 11:00–15:00 Uhr"
-    ),
-}
-
-PROBETRAINING = {
-    "duration": "in der Regel 60 Minuten",
-    "included": "mit persönlicher Betreuung",
-    "options": "je nach Wunsch Geräte-Training und/oder Kurse",
-    "price": "kostenlos",
-}
-
-COURSE_PLAN = {
-    "Montag": [
-        ("16:45–17:15", "Vibrationstraining"),
-        ("17:15–17:45", "Fitness-Dance"),
-        ("17:45–18:15", "Bauch, Beine, Po"),
-        ("18:15–18:45", "Jumping"),
-    ],
-    "Dienstag": [
-        ("11:30–12:00", "Vibrationstraining"),
-    ],
-    "Mittwoch": [
-        ("13:30–14:00", "Vibrationstraining"),
-        ("16:15–16:45", "Vibrationstraining"),
-        ("16:45–17:45", "Jumping"),
-        ("17:45–18:15", "Bauch, Beine, Po"),
-    ],
-    "Freitag": [
-        ("15:30–16:00", "Plattenkurs"),
-    ],
-}
-
-FEATURES = [
-    "Vibrationstraining",
-    "Körperanalyse",
-    "Freihantelbereich",
-    "Kurse",
-    "persönliche Betreuung",
-    "ruhige Atmosphäre",
-    "Wellness (Infrarot & Massagesessel)",
-    "Duschen, Umkleiden & Spinde/Schließfächer",
-]
-
-
-# =========================================================
-# Helfer: Textbausteine
-# =========================================================
-def cta_short() -> str:
-    return f"📞 Telefon: {STUDIO['phone_display']} ({STUDIO['phone_tel']})"
-
-
-def cta_full() -> str:
-    return (
-        f"📞 Telefon: {STUDIO['phone_display']} ({STUDIO['phone_tel']})\n"
-        f"📍 Adresse: {STUDIO['address']}\n"
-        f"🕒 Öffnungszeiten:\n{STUDIO['opening_hours']}\n"
-        f"🚗 Parken: {STUDIO['parking']}"
-    )
-
-
-def probetraining_block() -> str:
-    return (
-        "Kostenloses Probetraining:\n"
-        f"• Dauer: {PROBETRAINING['duration']}\n"
-        f"• Betreuung: {PROBETRAINING['included']}\n"
-        f"• Inhalt: {PROBETRAINING['options']}\n"
-        f"• Kosten: {PROBETRAINING['price']}"
-    )
-
-
-def course_plan_text() -> str:
-    lines = []
-    for day, items in COURSE_PLAN.items():
-        for time, title in items:
-            lines.append(f"• {day}: {time} {title}")
-    return "\n".join(lines)
-
-
-# =========================================================
-# Normalisierung & Matching
-# =========================================================
-def normalize(text: str) -> str:
-    text = text.strip().lower()
-    text = unicodedata.normalize("NFKD", text)
-    text = "".join(ch for ch in text if not unicodedata.combining(ch))
-    text = re.sub(r"[^\w\s€]", " ", text)  # € behalten
-    text = re.sub(r"\s+", " ", text)
-    return text
-
-
-def matches_any(text: str, patterns: List[str]) -> bool:
-    for p in patterns:
-        try:
-            if re.search(p, text):
-                return True
-        except re.error as e:
-            st.error(f"Regex-Fehler im Pattern:\n{p}\n\n{e}")
-            return False
-    return False
-
-
-# =========================================================
-# Session-Memory
-# =========================================================
-def init_memory() -> None:
-    if "memory" not in st.session_state:
-        st.session_state.memory = {"goal": None}
-
-
-def set_goal(goal: Optional[str]) -> None:
-    st.session_state.memory["goal"] = goal
-
-
-def get_goal() -> Optional[str]:
-    return st.session_state.memory.get("goal")
-
-
-def goal_phrase() -> str:
-    g = get_goal()
-    return f"Da Ihr Ziel „{g}“ ist, " if g else ""
-
-
-# =========================================================
-# Analytics (Session)
-# =========================================================
-def init_stats() -> None:
-    if "stats" not in st.session_state:
-        st.session_state.stats = {"intents": {}, "fallback": 0}
-
-
-# =========================================================
-# GLOBAL STATS (für alle Nutzer) – einfache Gesamtauswertung
-# =========================================================
-STATS_FILE = "ptc_global_stats.json"
-
-
-def _load_global_stats() -> Dict[str, object]:
-    if os.path.exists(STATS_FILE):
-        try:
-            with open(STATS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            if "intents" not in data or "fallback" not in data:
-                raise ValueError("Invalid stats shape")
-            return data
-        except Exception:
-            pass
-    return {"intents": {}, "fallback": 0, "updated_at": None}
-
-
-def _save_global_stats(data: Dict[str, object]) -> None:
-    data["updated_at"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
-    tmp = STATS_FILE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, STATS_FILE)
-
-
-@st.cache_resource
-def get_global_stats_store() -> Dict[str, object]:
-    return {"lock": Lock(), "data": _load_global_stats()}
-
-
-def inc_global_intent(name: str) -> None:
-    store = get_global_stats_store()
-    with store["lock"]:
-        intents = store["data"]["intents"]
-        intents[name] = int(intents.get(name, 0)) + 1
-        _save_global_stats(store["data"])
-
-
-def inc_global_fallback() -> None:
-    store = get_global_stats_store()
-    with store["lock"]:
-        store["data"]["fallback"] = int(store["data"].get("fallback", 0)) + 1
-        _save_global_stats(store["data"])
-
-
-# =========================================================
-# LOGGING – ALLE FRAGEN (global)
-# =========================================================
-QUESTIONS_LOG = "ptc_questions_log.jsonl"
-
-
-def sanitize_for_log(text: str) -> str:
-    """
-    Minimales Hardening:
-    - Länge begrenzen (verhindert Abuse)
-    - offensichtliche Emails/Telefonnummern grob maskieren
-    """
-    t = (text or "").strip()
-    t = t[:800]  # Limit
-    t = re.sub(r"[\w\.-]+@[\w\.-]+\.\w+", "[email]", t)
-    t = re.sub(r"\b(\+?\d[\d\s\-\/]{7,}\d)\b", "[telefon]", t)
-    return t
-
-
-@st.cache_resource
-def get_log_lock() -> Lock:
-    return Lock()
-
-
-def log_question(raw_text: str, intent: str, goal: Optional[str]) -> None:
-    entry = {
-        "ts": datetime.utcnow().isoformat(timespec="seconds") + "Z",
-        "intent": intent,
-        "goal": goal,
-        "text": sanitize_for_log(raw_text),
-    }
-    lock = get_log_lock()
-    with lock:
-        with open(QUESTIONS_LOG, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-
-
-def read_questions_log(limit: int = 200) -> List[Dict[str, object]]:
-    if not os.path.exists(QUESTIONS_LOG):
-        return []
-    rows: List[Dict[str, object]] = []
-    with open(QUESTIONS_LOG, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                rows.append(json.loads(line))
-            except Exception:
-                continue
-    # letzte zuerst
-    return rows[-limit:][::-1]
-
-
-# =========================================================
-# Ziel-Erkennung
-# =========================================================
-GOAL_PATTERNS = [
-    ("abnehmen", [r"\babnehmen\b", r"\bgewicht\b", r"\bfett\b", r"\bfigur\b", r"\bkalorien\b"]),
-    ("muskelaufbau", [r"\bmuskel\b", r"\bkraft\b", r"\baufbau\b", r"\bhypertroph\b"]),
-    ("rücken stärken", [r"\bruck(en)?\b", r"\bhaltung\b", r"\bverspann"]),
-    ("allgemeine fitness", [r"\bfitter\b", r"\bausdauer\b", r"\bkondition\b", r"\bfit\b", r"\bgesund(heit)?\b"]),
-]
-
-
-def infer_goal(text_norm: str) -> Optional[str]:
-    for goal, pats in GOAL_PATTERNS:
-        if matches_any(text_norm, pats):
-            return goal
-    return None
-
-
-def recommend_for_goal(goal: str) -> List[str]:
-    if goal == "abnehmen":
-        return ["Jumping", "Bauch, Beine, Po", "Fitness-Dance"]
-    if goal == "muskelaufbau":
-        return ["Freihantelbereich (Technik & Progression mit Betreuung)", "Körperanalyse zur Verlaufskontrolle"]
-    if goal == "rücken stärken":
-        return ["Vibrationstraining (ruhiger Einstieg)", "Geräte-Training mit Fokus auf saubere Ausführung (angepasst)"]
-    if goal == "allgemeine fitness":
-        return ["Fitness-Dance", "Jumping", "Vibrationstraining"]
-    return []
-
-
-# =========================================================
-# Antwort-Handler
-# =========================================================
-def answer_unsicherheit(_t: str) -> str:
-    return (
-        "Das ist überhaupt kein Problem.\n\n"
-        "Wir legen großen Wert auf einen ruhigen, gut betreuten Einstieg und passen das Training individuell an – ohne Überforderung.\n\n"
-        "Ein persönliches Beratungsgespräch oder ein kostenloses Probetraining ist dafür ideal.\n\n"
-        f"{cta_short()}"
-    )
-
-
-def answer_orientierung(_t: str) -> str:
-    return (
-        "Das geht vielen so – und ist überhaupt kein Problem.\n\n"
-        "Wir unterstützen Sie dabei, einen passenden Einstieg zu finden: ruhig, strukturiert und mit persönlicher Betreuung.\n\n"
-        "Am besten eignet sich dafür ein persönliches Beratungsgespräch oder ein kostenloses Probetraining.\n\n"
-        f"{cta_short()}"
-    )
-
-
-def answer_preise(t: str) -> str:
-    goal = infer_goal(t) or get_goal()
-    if goal:
-        set_goal(goal)
-
-    parts = [
-        "Die Mitgliedsbeiträge können je nach Laufzeit und Trainingsumfang variieren.",
-        "Am sinnvollsten ist ein kurzes persönliches Beratungsgespräch oder ein kostenloses Probetraining, "
-        "damit wir gemeinsam das passende Angebot für Sie finden.",
-    ]
-    if goal:
-        parts.append(f"{goal_phrase()}können wir im Probetraining/Beratungsgespräch genau passend starten.")
-
-    parts.append(probetraining_block())
-    parts.append("Für die Anmeldung melden Sie sich am besten kurz telefonisch.")
-    parts.append(cta_full())
-    return "\n\n".join(parts)
-
-
-def answer_medizin(_t: str) -> str:
-    return (
-        "Bei Beschwerden ist ein gut betreuter Einstieg besonders wichtig.\n\n"
-        "Hinweis: Ich kann keine medizinische Einschätzung geben. Wenn Sie akute oder starke Beschwerden haben, "
-        "lassen Sie das bitte ärztlich abklären.\n\n"
-        "Am besten eignet sich dafür ein persönliches Beratungsgespräch oder ein kostenloses Probetraining – "
-        "dann können wir in Ruhe besprechen, wie ein sinnvoller Einstieg aussehen kann.\n\n"
-        f"{cta_short()}"
-    )
-
-
-def answer_infos(_t: str) -> str:
-    return (
-        "Gern – hier die wichtigsten Infos:\n\n"
-        f"📍 Adresse: {STUDIO['address']}\n\n"
-        f"🕒 Öffnungszeiten:\n{STUDIO['opening_hours']}\n\n"
-        f"🚗 Parken: {STUDIO['parking']}\n\n"
-        "Wenn Sie möchten, können Sie direkt ein persönliches Beratungsgespräch oder ein kostenloses Probetraining vereinbaren.\n\n"
-        f"{cta_short()}"
-    )
-
-
-def answer_probetraining(t: str) -> str:
-    goal = infer_goal(t) or get_goal()
-    if goal:
-        set_goal(goal)
-
-    parts = [
-        "Sehr gern – ein kostenloses Probetraining ist ideal, um unser Studio kennenzulernen.",
-        probetraining_block(),
-        "Wenn Sie möchten, kann das Probetraining auch als kurzes Beratungsgespräch genutzt werden, um den passenden Start zu planen.",
-        "Für die Anmeldung melden Sie sich am besten kurz telefonisch.",
-        cta_full(),
-    ]
-    return "\n\n".join(parts)
-
-
-def answer_features(_t: str) -> str:
-    return (
-        "Gern – hier ein Überblick über unsere Ausstattung/Angebote:\n\n"
-        "• " + "\n• ".join(FEATURES) + "\n\n"
-        "Wenn Sie möchten, können Sie das bei einem persönlichen Beratungsgespräch oder einem kostenlosen Probetraining in Ruhe kennenlernen.\n\n"
-        f"{cta_short()}"
-    )
-
-
-def answer_kurse(t: str) -> str:
-    goal = infer_goal(t) or get_goal()
-    if goal:
-        set_goal(goal)
-
-    parts = [
-        "Gern – hier unser aktueller Kursplan:",
-        course_plan_text(),
-    ]
-    rec = recommend_for_goal(goal) if goal else []
-    if rec:
-        parts.append(f"{goal_phrase()}würden sich z. B. diese Optionen anbieten: " + ", ".join(rec) + ".")
-    parts += [
-        "Wenn Sie möchten, können Sie Kurse auch im Rahmen eines kostenlosen Probetrainings ausprobieren.",
-        "Für die Anmeldung melden Sie sich am besten kurz telefonisch.",
-        cta_short(),
-    ]
-    return "\n\n".join(parts)
-
-
-def answer_facilities(_t: str) -> str:
-    return (
-        "Gern – bei uns gibt es:\n\n"
-        "• Duschen\n"
-        "• Umkleiden\n"
-        "• Spinde/Schließfächer\n"
-        "• Getränke (vor Ort verfügbar)\n\n"
-        "Wenn Sie möchten, können Sie das alles bei einem persönlichen Beratungsgespräch oder einem kostenlosen Probetraining in Ruhe kennenlernen.\n\n"
-        f"{cta_short()}"
-    )
-
-
-def answer_wellness(_t: str) -> str:
-    return (
-        "Gern – bei uns gibt es Wellness-Angebote wie:\n\n"
-        "• Infrarot\n"
-        "• Massagesessel\n\n"
-        "Wenn Sie möchten, erklären wir Ihnen im persönlichen Beratungsgespräch oder beim kostenlosen Probetraining, wie Sie das sinnvoll nutzen können.\n\n"
-        f"{cta_short()}"
-    )
-
-
-def answer_payment(_t: str) -> str:
-    return (
-        "Hinweis zur Zahlung: Aktuell bieten wir keine Kartenzahlung an.\n\n"
-        "Wenn Sie dazu Fragen haben oder ein kostenloses Probetraining / Beratungsgespräch vereinbaren möchten, melden Sie sich am besten kurz telefonisch.\n\n"
-        f"{cta_short()}"
-    )
-
-
-def answer_age(_t: str) -> str:
-    return (
-        "Zum Mindestalter: Das ist bei uns nach Absprache möglich.\n\n"
-        "Am besten klären wir das kurz telefonisch – dann können wir direkt sagen, was in Ihrem Fall passt.\n\n"
-        f"{cta_short()}"
-    )
-
-
-def answer_accessibility(_t: str) -> str:
-    return (
-        "Hinweis zur Barrierefreiheit: Aktuell ist das Studio nicht barrierefrei.\n\n"
-        "Wenn Sie mir kurz sagen, was genau Sie benötigen (z. B. Stufen, Zugang, Begleitung), klären wir das gern telefonisch und finden eine passende Lösung.\n\n"
-        f"{cta_short()}"
-    )
-
-
-def answer_default(_t: str) -> str:
-    return (
-        "Gern helfe ich Ihnen weiter. Geht es bei Ihnen eher um Probetraining/Beratung, Kurse, Öffnungszeiten/Anfahrt oder Mitgliedschaft?\n\n"
-        f"{cta_short()}"
-    )
-
-
-# =========================================================
-# INTENTS (Reihenfolge = Priorität)
-# =========================================================
-INTENTS: List[Dict[str, object]] = [
-    {
-        "name": "medizin_beschwerden",
-        "patterns": [
-            r"\bruckenschmerz(en)?\b", r"\bruck(en)?\b", r"\brücken\b", r"\brückenschmerz(en)?\b",
-            r"\bschmerz(en)?\b", r"\bbeschwerden\b", r"\bverletzung\b", r"\bbandscheibe\b",
-            r"\bphysio\b", r"\barzt\b", r"\boperation\b", r"\bkrankheit\b", r"\bblutdruck\b", r"\bherz\b",
-        ],
-        "handler": answer_medizin,
-    },
-    {
-        "name": "preise_kosten",
-        "patterns": [
-            r"\bpreis(e)?\b", r"\bkosten\b", r"\bbeitrag\b", r"\bmitglied(schaft)?\b", r"\babo\b",
-            r"\bvertrag\b", r"\btarif\b", r"wie viel", r"wieviel", r"monat", r"monatlich", r"pro monat",
-            r"euro", r"€",
-            r"\bkündigen\b", r"\bkuendigen\b", r"kündigungsfrist", r"kuendigungsfrist",
-            r"\bstudent\b", r"\bstudenten\b", r"\bazubi\b",
-        ],
-        "handler": answer_preise,
-    },
-    {
-        "name": "duschen_umkleide_spinde_getraenke",
-        "patterns": [
-            r"\bdusch(e|en)\b", r"\bduschen vorhanden\b", r"\bgibt es duschen\b", r"\bduschmoglichkeit\b", r"\bduschmöglichkeit\b",
-            r"\bumkleide\b", r"\bumkleiden\b", r"\bumziehen\b",
-            r"\bspind(e)?\b", r"\bschliessfach\b", r"\bschließfach\b", r"\bschliessfaecher\b", r"\bschließfächer\b",
-            r"\babschliessbar\b", r"\babschließbar\b",
-            r"\bgetrank(e)?\b", r"\bgetränk(e)?\b", r"\bwasser\b", r"\btrinken\b",
-        ],
-        "handler": answer_facilities,
-    },
-    {
-        "name": "wellness_infrarot_massagesessel",
-        "patterns": [
-            r"\bwellness\b", r"\binfrarot\b", r"\binfrarotkabine\b",
-            r"\bmassage\b", r"\bmassagesessel\b", r"\bmassagestuhl\b",
-        ],
-        "handler": answer_wellness,
-    },
-    {
-        "name": "zahlung_kartenzahlung",
-        "patterns": [
-            r"\bkartenzahlung\b", r"\bec\b", r"\bgirocard\b", r"\bvisa\b", r"\bmastercard\b",
-            r"\bapple pay\b", r"\bgoogle pay\b", r"\bkontaktlos\b", r"\b(nur )?bar\b",
-            r"zahlungsmoglichkeiten", r"zahlungsmöglichkeiten",
-        ],
-        "handler": answer_payment,
-    },
-    {
-        "name": "mindestalter_nach_absprache",
-        "patterns": [
-            r"\bmindestalter\b", r"ab wieviel jahren", r"ab wie viel jahren",
-            r"\bjugend\b", r"\bjugendliche\b", r"\bschüler\b", r"\bschueler\b", r"\bnach absprache\b",
-        ],
-        "handler": answer_age,
-    },
-    {
-        "name": "barrierefreiheit",
-        "patterns": [
-            r"\bbarrierefrei\b", r"\brollstuhl\b", r"\baufzug\b", r"\bstufen\b", r"\btreppe\b",
-        ],
-        "handler": answer_accessibility,
-    },
-    {
-        "name": "einstieg_unsicherheit",
-        "patterns": [
-            r"lange(r)? keinen sport", r"lange(r)? nicht trainiert", r"lange(r)? keinen sport gemacht",
-            r"unsportlich", r"anfanger", r"anfaenger", r"neuling", r"wieder anfangen", r"wieder starten", r"lange pause",
-        ],
-        "handler": answer_unsicherheit,
-    },
-    {
-        "name": "orientierung",
-        "patterns": [
-            r"weiß nicht wo ich anfangen soll", r"weiss nicht wo ich anfangen soll",
-            r"wo anfangen", r"wie anfangen", r"wie starte ich", r"keine ahnung", r"unsicher wie anfangen",
-        ],
-        "handler": answer_orientierung,
-    },
-    {
-        "name": "probetraining_beratung",
-        "patterns": [
-            r"\bprobetraining\b", r"\bprobe\b", r"\btesten\b", r"\bkennenlernen\b",
-            r"\bberatung\b", r"\bberatungsgespraech\b", r"\bberatungsgespräch\b",
-        ],
-        "handler": answer_probetraining,
-    },
-    {
-        "name": "infos_anfahrt_parken_zeiten",
-        "patterns": [
-            r"\boffnungszeit(en)?\b", r"\böffnungszeit(en)?\b", r"\bgeoffnet\b", r"\bgeöffnet\b",
-            r"\badresse\b", r"\banfahrt\b", r"\bwo\b", r"\bparken\b", r"\bparkplatz\b", r"\bsonntag\b", r"\bsamstag\b",
-        ],
-        "handler": answer_infos,
-    },
-    {
-        "name": "kurse",
-        "patterns": [
-            r"\bkurse?\b", r"\bjumping\b", r"\bfitt?ness[- ]dance\b", r"\bbauch\b", r"\bbeine\b", r"\bpo\b",
-            r"\bvibration\b", r"\bplattenkurs\b",
-        ],
-        "handler": answer_kurse,
-    },
-    {
-        "name": "ausstattung",
-        "patterns": [
-            r"\bausstattung\b", r"\bgera(te|ete)\b", r"\bgeräte\b", r"\bmaschinen\b", r"\bfrei?hantel\b",
-            r"\bkorperanalyse\b", r"\bkörperanalyse\b", r"\bvibration\b", r"\bwellness\b", r"\binfrarot\b", r"\bmassagesessel\b",
-        ],
-        "handler": answer_features,
-    },
-]
-
-
-def route_and_answer(user_text: str) -> str:
-    t_norm = normalize(user_text)
-
-    g = infer_goal(t_norm)
-    if g:
-        set_goal(g)
-
-    # Intent finden
-    for intent in INTENTS:
-        patterns = intent.get("patterns", [])
-        if isinstance(patterns, list) and matches_any(t_norm, patterns):
-            name = str(intent.get("name", "unknown"))
-
-            # Session-Stats
-            stats = st.session_state.stats["intents"]
-            stats[name] = stats.get(name, 0) + 1
-
-            # Global-Stats
-            inc_global_intent(name)
-
-            # ALLE FRAGEN loggen (mit Intent)
-            log_question(raw_text=user_text, intent=name, goal=get_goal())
-
-            handler = intent.get("handler")
-            if callable(handler):
-                return handler(t_norm)
-
-    # Fallback
-    st.session_state.stats["fallback"] += 1
-    inc_global_fallback()
-
-    # ALLE FRAGEN loggen (Fallback)
-    log_question(raw_text=user_text, intent="fallback", goal=get_goal())
-
-    return answer_default(t_norm)
+from ptc_core import (
+    CHAT_RENDER_WINDOW,
+    ChatSession,
+    KnowledgeError,
+    get_rate_limiter,
+    get_response_cache,
+    knowledge_status,
+    route_and_answer,
+    session_memory_report,
+    start_knowledge_watcher,
+)
+from ptc_analytics import ROLLUPS_FILE, SEARCH_DIR, get_rollups, get_search_index, rebuild_fallback_phrases
+from ptc_metrics import start_exporter, summary as metrics_summary
+from ptc_tenants import DEFAULT_TENANT, TENANT_PARAM, TenantError, get_tenants
+
+
+def get_session(tenant: str) -> ChatSession:
+    # eigene Session pro Studio: das gemerkte Ziel gilt nicht studioübergreifend
+    key = "session" if tenant == DEFAULT_TENANT else f"session_{tenant}"
+    if key not in st.session_state:
+        st.session_state[key] = ChatSession()
+    return st.session_state[key]
+
+
+def client_ip() -> Optional[str]:
+    """IP des Browsers, soweit Streamlit sie kennt (st.context.ip_address; lokal None)."""
+    ip = getattr(getattr(st, "context", None), "ip_address", None)
+    return ip if isinstance(ip, str) and ip else None
+
+
+def current_tenant() -> str:
+    """Studio aus ?studio=<id> oder dem Host-Namen (siehe ptc_tenants); unbekannt -> Hinweis und Stopp."""
+    headers = getattr(getattr(st, "context", None), "headers", None)
+    host = headers.get("host") if headers is not None else None
+    try:
+        return get_tenants().resolve(st.query_params.get(TENANT_PARAM), host if isinstance(host, str) else None)
+    except TenantError:
+        st.error("Dieses Studio ist nicht bekannt.")
+    except KnowledgeError as e:
+        st.error(f"Studio-Konfiguration ungültig: {e}")
+    st.stop()
 
 
 # =========================================================
 # STREAMLIT UI
 # =========================================================
 st.set_page_config(page_title="PTC Online-Beratung", page_icon="💬", layout="centered")
+start_exporter()  # Prometheus-Datei/-Endpunkt, einmal pro Prozess
+start_knowledge_watcher()  # ptc_knowledge.json im Hintergrund neu laden
+
+tenant = current_tenant()
+try:
+    knowledge = get_tenants().knowledge(tenant)
+except (TenantError, KnowledgeError) as e:
+    st.error(f"Studio-Konfiguration ungültig: {e}")
+    st.stop()
+storage = get_tenants().storage(tenant)
+studio = knowledge.data["studio"]
 
 # --- Modern App Look (PTC-Rot) ---
+# CSS und Header bewusst ohne st.cache_*: Streamlit entfernt jedes Element, das
+# ein Lauf nicht erneut ausgibt, der Aufruf bleibt also ohnehin pro Lauf. Sparen
+# ließe sich nur der Aufbau des Strings (< 1 µs, ein Cache-Lookup kostet mehr);
+# beide Elemente zusammen machen ~1 ms von ~20 ms Skriptzeit pro Lauf aus.
+# Dass eine Nachricht nur einen Lauf kostet, prüft load_test.py --mode apptest.
 st.markdown("""
 <style>
 .block-container { max-width: 980px; padding-top: 1.2rem; padding-bottom: 2.2rem; }
@@ -650,7 +117,7 @@ st.markdown(f"""
     Online-Beratung
   </div>
   <div style="font-size:14px; color:#555;">
-    {STUDIO["name"]} · Schnell Antworten zu Probetraining, Kursen, Öffnungszeiten & Mitgliedschaft
+    {studio["name"]} · Schnell Antworten zu Probetraining, Kursen, Öffnungszeiten & Mitgliedschaft
   </div>
   <div class="ptc-accent"></div>
 </div>
@@ -663,11 +130,15 @@ with st.expander("Datenschutz-Hinweis", expanded=False):
         "Ich gebe keine medizinischen Einschätzungen, sondern allgemeine Hinweise zum Studiostart."
     )
 
-if "chat" not in st.session_state:
-    st.session_state.chat = []
+session = get_session(tenant)
 
-init_memory()
-init_stats()
+# Eingabe zuerst verarbeiten: st.chat_input bleibt trotzdem unten fixiert, und
+# Ziel-Hinweis, Admin-Zahlen und Verlauf zeigen die Antwort schon in diesem
+# Lauf – ohne zweiten Skriptlauf per st.rerun().
+user_input = st.chat_input("Ihre Frage (z.B. Probetraining, Kurse, Öffnungszeiten, Mitgliedschaft)")
+if user_input:
+    session.history.append(False, user_input)
+    session.history.append(True, route_and_answer(user_input, session, storage, client_ip(), knowledge))
 
 # --- Actionbar als Card ---
 with st.container(border=True):
@@ -675,27 +146,88 @@ with st.container(border=True):
 
     with col1:
         if st.button("Neues Gespräch"):
-            st.session_state.chat = []
-            st.session_state.memory = {"goal": None}
-            st.session_state.stats = {"intents": {}, "fallback": 0}
-            st.rerun()
+            session.reset()
+            st.session_state.chat_window = CHAT_RENDER_WINDOW
 
     with col2:
-        st.link_button("📞 Anrufen", STUDIO["phone_tel"])
+        st.link_button("📞 Anrufen", studio["phone_tel"])
 
     with col3:
-        g = get_goal()
+        g = session.goal
         if g:
             st.info(f"Merke ich mir: Ziel = {g}")
 
 # =========================================================
 # ADMIN-BEREICH (nur über ?admin=1)
 # =========================================================
-admin = st.query_params.get("admin") == "1"
-if admin:
+# Als Fragment: Seitenwechsel, Filter und Export im Admin-Bereich führen nur
+# diesen Teil erneut aus, nicht die ganze Seite samt Chat-Verlauf.
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+
+# st.download_button hält die Datei bis zum Download im Speicher des Servers –
+# der Export wird daher in Teile von etwa EXPORT_PART_BYTES geschnitten (je
+# eine eigene gzip-Datei aus ganzen Zeilen, ältere Einträge zuerst). Pro Klick
+# entsteht nur der gewählte Teil; davor liegende werden komprimiert und
+# verworfen, danach wird abgebrochen. Ohne Teile:
+# ptc_storage.iter_questions_log_export.
+EXPORT_PART_BYTES = 5 * 1024 * 1024  # gzip-komprimiert
+
+
+class _ExportPart:
+    """Ziel für gzip.GzipFile: behält nur die Bytes des gewünschten Teils, zählt den Rest."""
+
+    def __init__(self, wanted: int):
+        self.wanted = wanted
+        self.part = 0
+        self.size = 0  # Bytes im aktuellen Teil
+        self.data = io.BytesIO()
+
+    def write(self, b) -> int:
+        if self.part == self.wanted:
+            self.data.write(b)
+        self.size += len(b)
+        return len(b)
+
+    def flush(self) -> None:
+        pass
+
+
+def write_export(chunks, part: int) -> Tuple[bytes, bool]:
+    """Teil `part` (ab 0) der JSONL-Chunks, gzip-komprimiert; True, wenn weitere Teile folgen."""
+    sink = _ExportPart(part)
+    gz = gzip.GzipFile(fileobj=sink, mode="wb")
+    carry = b""
+    for chunk in chunks:
+        data = carry + chunk
+        cut = data.rfind(b"\n") + 1  # Teile enden an Zeilengrenzen
+        if cut and sink.size >= EXPORT_PART_BYTES:
+            gz.close()
+            if sink.part == part:
+                return sink.data.getvalue(), True
+            sink.part += 1
+            sink.size = 0
+            gz = gzip.GzipFile(fileobj=sink, mode="wb")
+        gz.write(data[:cut])
+        carry = data[cut:]
+    gz.write(carry)
+    gz.close()
+    return sink.data.getvalue(), False
+
+
+@_fragment
+def admin_panel(tenant: str) -> None:
+    tenants = get_tenants()
+    storage = tenants.storage(tenant)
+    current = tenants.knowledge(tenant)
+    if tenant == DEFAULT_TENANT:
+        kb = knowledge_status()
+    else:
+        kb = {"version": current.version, "source": current.source, "error": tenants.errors.get(tenant)}
+    if kb["error"]:
+        st.error(f"Wissensbasis nicht übernommen (aktiv bleibt {kb['version']}): {kb['error']}")
+
     with st.expander("📈 Gesamt-Statistik (alle Nutzer) – Admin", expanded=True):
-        store = get_global_stats_store()
-        data = store["data"]
+        data = storage.stats_snapshot()
 
         intents = data.get("intents", {})
         fallback = data.get("fallback", 0)
@@ -712,18 +244,196 @@ if admin:
         st.write(f"❓ Fallback (gesamt): {fallback}")
         if updated_at:
             st.caption(f"Letztes Update: {updated_at}")
+        routes = current.routes if current.routes is not None else get_response_cache().routes
+        st.caption(
+            f"Routing-Cache: {routes.hits} Treffer / {routes.misses} Fehl / "
+            f"{routes.evictions} verdrängt ({len(routes)} Einträge) · "
+            f"Antwort-Vorlagen: {len(current.templates)} · Wissensbasis {kb['version']} ({kb['source']})"
+        )
 
         st.download_button(
             "📥 Gesamt-Stats als JSON",
             data=json.dumps(data, ensure_ascii=False, indent=2),
-            file_name="ptc_global_stats.json",
+            file_name=f"ptc_global_stats{'_' + tenant if tenant else ''}.json",
             mime="application/json",
         )
 
+    with st.expander("📊 Trends – Admin", expanded=False):
+        rollups = get_rollups(tenants.data_path(tenant, ROLLUPS_FILE))
+        new_rows = rollups.refresh(storage)
+        tcol1, tcol2 = st.columns(2)
+        with tcol1:
+            st.write("**Top-Intents (letzte 7 Tage):**")
+            top = rollups.top_intents(days=7)
+            if top:
+                for k, v in top:
+                    st.write(f"• {k}: {v}")
+            else:
+                st.write("Noch keine Daten.")
+        with tcol2:
+            st.write("**Fallback-Quote pro Stunde (UTC):**")
+            st.table([
+                {"Stunde": hour[11:] + ":00", "Anfragen": total, "Fallback": fb, "Quote": f"{rate:.0%}"}
+                for hour, total, fb, rate in rollups.fallback_rate_by_hour(hours=24)
+                if total
+            ])
+        st.caption(f"{new_rows} neue Log-Einträge verarbeitet.")
+
+    with st.expander("🔍 Fallback-Phrasen – Admin", expanded=False):
+        phrases = storage.phrases
+        if phrases is None:
+            st.write("Für dieses Backend nicht verfügbar.")
+        else:
+            if st.button("Aus Fragen-Log neu aufbauen"):
+                st.caption(f"{rebuild_fallback_phrases(storage)} Log-Einträge gelesen.")
+            index = get_search_index(tenants.data_path(tenant, SEARCH_DIR))
+            index.refresh(storage)
+            st.caption(
+                f"{phrases.fallbacks} Fallback-Fragen ausgewertet · Zähler sind Obergrenzen, "
+                "„±“ = maximaler Überzählfehler · Intents = erkannte Fragen mit derselben Phrase"
+            )
+            for n, tab in enumerate(st.tabs(["1 Wort", "2 Wörter", "3 Wörter"][:phrases.max_n]), start=1):
+                with tab:
+                    top = phrases.top(n, limit=25)
+                    if not top:
+                        st.write("Noch keine Daten.")
+                        continue
+                    st.table([
+                        {
+                            "Phrase": r["phrase"],
+                            "Anzahl": r["count"],
+                            "±": r["error"],
+                            "Intents": ", ".join(
+                                f"{name} ({c})" for name, c in index.intent_counts(storage, r["phrase"], limit=3)
+                            ) or "-",
+                        }
+                        for r in top
+                    ])
+
+    with st.expander("🏢 Studios – Admin", expanded=False):
+        ts = tenants.stats()
+        st.write(
+            f"Aktiv: {tenant or 'Basis-Studio'} · im Speicher: {ts['cached']}/{ts['capacity']} · "
+            f"Treffer {ts['hits']} / Fehl {ts['misses']} · gebaut {ts['builds']} · verdrängt {ts['evictions']} · "
+            f"Storages: {ts['storages']}"
+        )
+        available = tenants.available()
+        st.caption("Studios: " + (", ".join(available) if available else "keine (nur Basis-Studio)"))
+        if ts["errors"]:
+            st.table([{"Studio": tid, "Fehler": err} for tid, err in sorted(ts["errors"].items())])
+
+    with st.expander("🧠 Sessions & Speicher – Admin", expanded=False):
+        mem = session_memory_report(top=10)
+        st.write(f"Aktive Sessions: {mem['sessions']} · Verläufe gesamt: {mem['bytes'] / 1024:.1f} KB")
+        if mem["top"]:
+            st.table([
+                {
+                    "Session": r["session"],
+                    "Nachrichten": r["messages"],
+                    "KB": f"{r['bytes'] / 1024:.1f}",
+                    "verworfen": r["dropped"],
+                }
+                for r in mem["top"]
+            ])
+
+    with st.expander("🚦 Rate-Limit – Admin", expanded=False):
+        rl = get_rate_limiter()
+        rs = rl.stats(top=10)
+        if not rs["enabled"]:
+            st.write("Rate-Limit ist ausgeschaltet.")
+        st.write(
+            f"Abgelehnt: {rs['limited_session']} pro Session · {rs['limited_client']} pro IP · "
+            f"IP-Buckets: {rs['clients']} (verdrängt: {rs['evicted']})"
+        )
+        st.caption(
+            f"Session: {rl.session_burst:.0f} am Stück, dann {rl.session_rate * 60:.0f}/min · "
+            f"IP: {rl.client_burst:.0f} am Stück, dann {rl.client_rate * 60:.0f}/min"
+        )
+        if rs["top_clients"]:
+            st.table([{"IP": ip, "abgelehnt": n} for ip, n in rs["top_clients"]])
+
+    with st.expander("⏱️ Latenzen – Admin", expanded=False):
+        rows = metrics_summary()
+        stage_rows = [r for r in rows if r["family"] in ("ptc_stage_seconds", "ptc_handler_seconds")]
+        if stage_rows:
+            st.write("**Stufen & Handler (µs, Buckets = obere Grenze):**")
+            st.table([
+                {
+                    "Stufe": r["label"] if r["family"] == "ptc_stage_seconds" else f"handler:{r['label']}",
+                    "Anzahl": r["count"],
+                    "Ø": f"{r['mean_us']:.1f}",
+                    "p50": f"{r['p50_us']:.0f}",
+                    "p95": f"{r['p95_us']:.0f}",
+                    "p99": f"{r['p99_us']:.0f}",
+                    "max": f"{r['max_us']:.0f}",
+                }
+                for r in stage_rows
+            ])
+        locks: dict = {}
+        for r in rows:
+            if r["family"] in ("ptc_lock_wait_seconds", "ptc_lock_hold_seconds"):
+                locks.setdefault(r["label"], {})["wait" if "wait" in r["family"] else "hold"] = r
+        if locks:
+            st.write("**Locks – Warten vs. Halten (µs):**")
+            st.table([
+                {
+                    "Lock": name,
+                    "Anzahl": lk["wait"]["count"] if "wait" in lk else 0,
+                    "Warten Ø": f"{lk['wait']['mean_us']:.1f}" if "wait" in lk else "-",
+                    "Warten p99": f"{lk['wait']['p99_us']:.0f}" if "wait" in lk else "-",
+                    "Warten max": f"{lk['wait']['max_us']:.0f}" if "wait" in lk else "-",
+                    "Halten Ø": f"{lk['hold']['mean_us']:.1f}" if "hold" in lk else "-",
+                    "Halten p99": f"{lk['hold']['p99_us']:.0f}" if "hold" in lk else "-",
+                }
+                for name, lk in sorted(locks.items())
+            ])
+        if not stage_rows and not locks:
+            st.write("Noch keine Messwerte.")
+
     with st.expander("🧾 Fragen-Log (alle Anfragen) – Admin", expanded=True):
-        rows = read_questions_log(limit=300)
+        if storage.writer is not None:
+            c = storage.writer.counters
+            avg_ms = c["flush_ms_total"] / c["batches"] if c["batches"] else 0.0
+            st.caption(
+                f"Backend {storage.name} · Queue {storage.writer.depth()} · geschrieben {int(c['written'])} "
+                f"· verworfen {int(c['dropped'])} · Fehler {int(c['errors'])} "
+                f"· Flush Ø {avg_ms:.2f} ms / max {c['flush_ms_max']:.2f} ms"
+            )
+        router = current.router
+        query = st.text_input("Volltextsuche (Wörter, \"Phrase\")", value="")
+        scol1, scol2 = st.columns(2)
+        with scol1:
+            search_intent = st.selectbox("Intent", ["alle"] + router.intent_names + ["fallback"], key="search_intent")
+        with scol2:
+            search_goal = st.selectbox("Ziel", ["alle"] + router.goal_names, key="search_goal")
+        fcol1, fcol2 = st.columns([1, 2])
+        with fcol1:
+            page = int(st.number_input("Seite (0 = neueste)", min_value=0, value=0, step=1))
+        with fcol2:
+            date_range = st.date_input("Zeitraum (optional)", value=())
+        has_range = isinstance(date_range, (list, tuple)) and len(date_range) == 2
+        if query.strip() or search_intent != "alle" or search_goal != "alle":
+            index = get_search_index(tenants.data_path(tenant, SEARCH_DIR))
+            index.refresh(storage)
+            total, rows = index.search(
+                storage,
+                query,
+                intent=None if search_intent == "alle" else search_intent,
+                goal=None if search_goal == "alle" else search_goal,
+                ts_from=f"{date_range[0].isoformat()}T00:00:00Z" if has_range else None,
+                ts_to=f"{date_range[1].isoformat()}T23:59:59Z" if has_range else None,
+                page=page,
+                size=50,
+            )
+            st.caption(f"{total} Treffer · Seite {page + 1} von {max(1, -(-total // 50))} · Index: {index.docs} Einträge")
+        elif has_range:
+            rows = storage.read_between(
+                f"{date_range[0].isoformat()}T00:00:00Z", f"{date_range[1].isoformat()}T23:59:59Z", 300
+            )
+        else:
+            rows = storage.read_page(page, 300)
         if not rows:
-            st.write("Noch keine geloggten Fragen.")
+            st.write("Keine passenden Fragen." if query.strip() else "Noch keine geloggten Fragen.")
         else:
             st.caption("Neueste Einträge zuerst. Emails/Telefonnummern werden im Log grob maskiert.")
             for r in rows:
@@ -738,31 +448,53 @@ if admin:
                 st.write(text)
                 st.write("---")
 
-        # Download des kompletten Logs
-        if os.path.exists(QUESTIONS_LOG):
-            with open(QUESTIONS_LOG, "r", encoding="utf-8") as f:
-                log_data = f.read()
-            st.download_button(
-                "📥 Fragen-Log als JSONL",
-                data=log_data,
-                file_name="ptc_questions_log.jsonl",
-                mime="application/jsonl",
+        # Export (gestreamt aus Segmenten + aktivem Log, gzip-komprimiert)
+        st.write("**Export**")
+        ecol1, ecol2 = st.columns([2, 1])
+        with ecol1:
+            export_intent = st.selectbox("Intent-Filter", ["alle"] + router.intent_names + ["fallback"])
+        with ecol2:
+            if storage.name == "jsonl":
+                st.caption(f"Segmente: {storage.log_segments()}")
+            export_part = int(st.number_input(
+                f"Teil (je ~{EXPORT_PART_BYTES // (1024 * 1024)} MB)", min_value=1, value=1, step=1
+            ))
+        if st.button("Export erstellen"):
+            ts_from = ts_to = None
+            if has_range:
+                ts_from = f"{date_range[0].isoformat()}T00:00:00Z"
+                ts_to = f"{date_range[1].isoformat()}T23:59:59Z"
+            payload, more = write_export(
+                storage.iter_export(None if export_intent == "alle" else export_intent, ts_from, ts_to),
+                export_part - 1,
             )
-
-# Chat-Verlauf
-for msg in st.session_state.chat:
-    with st.chat_message("assistant" if msg["role"] == "assistant" else "user"):
-        st.write(msg["content"])
-
-# Input
-user_input = st.chat_input("Ihre Frage (z.B. Probetraining, Kurse, Öffnungszeiten, Mitgliedschaft)")
-if user_input:
-    st.session_state.chat.append({"role": "user", "content": user_input})
-
-    answer = route_and_answer(user_input)
-    st.session_state.chat.append({"role": "assistant", "content": answer})
-
-    st.rerun()
+            if not payload:
+                st.info(f"Teil {export_part} enthält keine Einträge mehr.")
+            else:
+                if more:
+                    st.info(f"Es gibt weitere Einträge – für die nächsten Teil {export_part + 1} wählen.")
+                st.download_button(
+                    f"📥 Fragen-Log als JSONL (gzip), Teil {export_part}",
+                    data=payload,
+                    file_name=f"ptc_questions_log{'_' + tenant if tenant else ''}_{export_part}.jsonl.gz",
+                    mime="application/gzip",
+                )
+
+if st.query_params.get("admin") == "1":
+    admin_panel(tenant)
+
+# Chat-Verlauf (nur die letzten Nachrichten voll rendern, ältere auf Anfrage)
+history = session.history
+window = st.session_state.get("chat_window", CHAT_RENDER_WINDOW)
+hidden = len(history) - window
+if hidden > 0 and st.button(f"⬆️ Frühere Nachrichten laden ({hidden})"):
+    window += CHAT_RENDER_WINDOW
+    st.session_state.chat_window = window
+if history.dropped:
+    st.caption(f"{history.dropped} ältere Nachrichten sind nicht mehr gespeichert.")
+for msg in history.window(window):
+    with st.chat_message(msg.role):
+        st.write(msg.text)
 
 st.markdown("---")
-st.markdown(f"**Direkter Kontakt:** [{STUDIO['phone_display']}]({STUDIO['phone_tel']})")
+st.markdown(f"**Direkter Kontakt:** [{studio['phone_display']}]({studio['phone_tel']})")
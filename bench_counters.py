@@ -0,0 +1,133 @@
+"""
+Benchmark für die prozessübergreifenden Intent-Zähler (SharedStatsStore).
+
+Startet P Prozesse (z. B. 1, 2, 4, 8) auf dieselbe Zählertabelle; jeder
+zählt N-mal über die Intent-Namen aus INTENTS plus "fallback" hoch. Gemessen
+werden CPU-ns pro Inkrement (Median über die Prozesse) und ob die Summe nach dem
+Schließen exakt P * N ist – im Shared Memory und im Snapshot auf der Platte.
+Zum Vergleich läuft derselbe Loop einmal gegen den Lock-basierten
+GlobalStatsStore (nur ein Prozess, zählt nicht prozessübergreifend).
+Exit-Code 1, wenn eine Summe nicht stimmt.
+
+    python bench_counters.py [--procs 1,2,4,8] [--incs 200000] [--out report.json]
+"""
+import argparse
+import atexit
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import ptc_storage
+from ptc_core import INTENTS
+
+BENCH_PROCS = "1,2,4,8"
+BENCH_INCS = 200_000
+
+
+def _names() -> List[str]:
+    return [intent["name"] for intent in INTENTS] + ["fallback"]
+
+
+def _count(stats, names: List[str], n: int) -> float:
+    """Zählt n-mal hoch und liefert CPU-ns pro Inkrement (unabhängig vom Zeitscheiben-Teilen)."""
+    seq = [names[i % len(names)] for i in range(n)]
+    inc_intent, inc_fallback = stats.inc_intent, stats.inc_fallback
+    t0 = time.process_time_ns()
+    for name in seq:
+        if name == "fallback":
+            inc_fallback()
+        else:
+            inc_intent(name)
+    return (time.process_time_ns() - t0) / n
+
+
+def _worker(n: int, start, out) -> None:
+    stats = ptc_storage.SharedStatsStore()
+    names = _names()
+    start.wait()
+    out.put(_count(stats, names, n))
+    stats.close()
+    atexit.unregister(stats.close)
+
+
+def run_shared(procs: int, n: int) -> Dict[str, object]:
+    ctx = multiprocessing.get_context("fork")
+    start, out = ctx.Event(), ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(n, start, out)) for _ in range(procs)]
+    for w in workers:
+        w.start()
+    time.sleep(0.2)  # alle Prozesse angemeldet, dann gleichzeitig los
+    start.set()
+    ns = [out.get() for _ in workers]
+    for w in workers:
+        w.join()
+    data = ptc_storage._load_global_stats()
+    on_disk = sum(int(v) for v in dict(data["intents"]).values()) + int(data["fallback"])
+    return {
+        "procs": procs,
+        "ns_per_inc": round(statistics.median(ns), 1),
+        "ns_per_inc_max": round(max(ns), 1),
+        "expected": procs * n,
+        "on_disk": on_disk,
+        "ok": on_disk == procs * n,
+    }
+
+
+def run_benchmark(procs: List[int], n: int) -> Dict[str, object]:
+    cwd = os.getcwd()
+    runs = []
+    baseline = 0.0
+    for p in procs:
+        workdir = tempfile.mkdtemp(prefix="ptc_counters_")
+        try:
+            os.chdir(workdir)
+            runs.append(run_shared(p, n))
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    workdir = tempfile.mkdtemp(prefix="ptc_counters_")
+    try:
+        os.chdir(workdir)
+        stats = ptc_storage.GlobalStatsStore()
+        try:
+            baseline = _count(stats, _names(), n)
+        finally:
+            stats.close()
+            atexit.unregister(stats.close)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"cpus": os.cpu_count(), "incs_per_proc": n, "global_store_ns_per_inc": round(baseline, 1), "runs": runs}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--procs", default=BENCH_PROCS, help="kommagetrennt, z. B. 1,2,4,8")
+    ap.add_argument("--incs", type=int, default=BENCH_INCS, help="Inkremente pro Prozess")
+    ap.add_argument("--out", help="JSON-Bericht in diese Datei schreiben")
+    args = ap.parse_args()
+    if ptc_storage.shared_memory is None:
+        print("FEHLER: multiprocessing.shared_memory/fcntl nicht verfügbar")
+        return 1
+
+    report = run_benchmark([int(x) for x in args.procs.split(",")], args.incs)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+
+    print(f"GlobalStatsStore (1 Prozess, Lock): {report['global_store_ns_per_inc']:.1f} ns/Inkrement")
+    print(f"{'Prozesse':<10}{'ns/inc':>10}{'max':>10}{'Summe':>14}  ok")
+    for r in report["runs"]:
+        print(f"{r['procs']:<10}{r['ns_per_inc']:>10.1f}{r['ns_per_inc_max']:>10.1f}{r['on_disk']:>14,}  {r['ok']}")
+    return 0 if all(r["ok"] for r in report["runs"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Äquivalenz-Check und Mikro-Benchmark für normalize().
+
+Vergleicht den Tabellen-Schnellpfad (ptc_core.normalize) mit der
+Referenz-Implementierung (ptc_core.normalize_full) über einen gefuzzten
+Korpus aus deutschen Chat-Fragen, Sonderzeichen und beliebigem Unicode und
+misst anschließend beide Varianten. Exit-Code 1 bei Abweichungen.
+
+    python bench_normalize.py [--texts 200000]
+"""
+import argparse
+import random
+import sys
+import timeit
+from typing import List
+
+from ptc_core import normalize, normalize_full
+
+SEED = 4711
+WORDS = [
+    "Probetraining", "Öffnungszeiten", "Kurse", "Rückenschmerzen", "Preise", "Mitgliedschaft",
+    "kündigen", "Schließfach", "Getränke", "Größe", "Straße", "Fitness-Dance", "Bauch, Beine, Po",
+    "Was", "kostet", "das", "im", "Monat?", "gibt’s", "„Jumping“", "€", "30€", "20 Euro",
+    "ÄÖÜ", "äöü", "ß", "ẞ", "café", "Zoë", "São", "naïve", "…", "–", "—", "«ja»", "‚x‘",
+    "mail@beispiel.de", "+49 5121 123456", "#", "!!", "???", "(1)", "[2]", "a_b", "ﬁ", "²", "½",
+]
+SPACES = [" ", " ", " ", "  ", "\t", "\n", " ", " ", " ", ""]
+EXOTIC = ["Σ", "ΣΑΣ", "日本", "́", "é", "​", "🙂", "İ", "ǅ", "ẞ", "Ω", "ﬀ"]
+
+
+def build_corpus(n: int) -> List[str]:
+    rnd = random.Random(SEED)
+    alphabet = [chr(c) for c in range(0x250)] + [chr(c) for c in range(0x2000, 0x2070)] + EXOTIC
+    corpus = []
+    for i in range(n):
+        if i % 4 == 3:
+            corpus.append("".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40))))
+            continue
+        parts = []
+        for _ in range(rnd.randint(1, 14)):
+            parts.append(rnd.choice(EXOTIC if rnd.random() < 0.03 else WORDS))
+            parts.append(rnd.choice(SPACES))
+        corpus.append("".join(parts))
+    return corpus
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--texts", type=int, default=200_000, help="Anzahl gefuzzter Texte")
+    n = ap.parse_args().texts
+    corpus = build_corpus(n)
+
+    mismatches = [t for t in corpus if normalize(t) != normalize_full(t)]
+    print(f"Äquivalenz: {n - len(mismatches)}/{n} identisch")
+    for t in mismatches[:10]:
+        print(f"  {t!r}: {normalize(t)!r} != {normalize_full(t)!r}")
+
+    sample = [t for t in corpus[:20_000] if t.isascii() or t.isprintable()]
+    for name, fn in (("normalize_full", normalize_full), ("normalize", normalize)):
+        secs = min(timeit.repeat(lambda: [fn(t) for t in sample], number=1, repeat=5))
+        print(f"{name:>15}: {secs / len(sample) * 1e6:6.2f} µs/Text")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Golden-Korpus und Durchsatz-Benchmark für die PII-Maskierung (ptc_pii).
+
+1. Golden-Korpus: feste Eingaben mit erwarteter Ausgabe je Kategorie, dazu
+   Negativfälle, die NICHT maskiert werden dürfen (Preise, Uhrzeiten,
+   Kursnamen); maskierte Texte müssen beim zweiten Durchlauf gleich
+   bleiben. Exit-Code 1 bei Abweichungen.
+2. Benchmark: Fragen-Korpus aus bench_routing.py, jede zehnte Frage mit
+   eingestreuten Kontaktdaten; gemessen werden µs/Text und MB/s für die
+   alte Maskierung (zwei re.sub) und sanitize_for_log() mit ptc_pii.
+
+    python bench_pii.py [--texts N] [--out report.json]
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import timeit
+from typing import Dict, List, Tuple
+
+from bench_routing import build_corpus
+from ptc_pii import HEALTH_INTENTS, PII_CATEGORIES, sanitize_for_log, scrub
+
+BENCH_TEXTS = 20_000
+SEED = 4711
+
+GOLDEN: List[Tuple[str, str]] = [
+    # email
+    ("Meine Mail ist max.mustermann@gmail.com", "Meine Mail ist [email]"),
+    ("schreibt an info+ptc@fit-studio.example.de bitte", "schreibt an [email] bitte"),
+    # telefon
+    ("ruf an: +49 5121 2819760", "ruf an: [telefon]"),
+    ("Tel. 05121/2819760 oder 0171 1234567", "Tel. [telefon] oder [telefon]"),
+    # iban
+    ("IBAN DE89 3704 0044 0532 0130 00 bitte abbuchen", "IBAN [iban] bitte abbuchen"),
+    ("iban de89370400440532013000", "iban [iban]"),
+    # datum
+    ("Ich bin am 12.03.1985 geboren", "Ich bin am [datum] geboren"),
+    ("Jahrgang 1985, geb. 1990", "[datum], [datum]"),
+    ("geboren am 3. März 1985", "geboren am [datum]"),
+    ("Termin 2024-05-17?", "Termin [datum]?"),
+    # adresse
+    ("Ich wohne in der Hauptstraße 12a, 31134 Hildesheim", "Ich wohne in der [adresse]"),
+    ("Lindenweg 5 ist meine Adresse", "[adresse] ist meine Adresse"),
+    ("Goethestr. 7", "[adresse]"),
+    # name
+    ("Hallo, ich heiße Anna Schmidt", "Hallo, ich heiße [name]"),
+    ("Mein Name ist jonas und ich will trainieren", "Mein Name ist [name] und ich will trainieren"),
+    ("Name: Petra Lange", "Name: [name]"),
+    ("Frau Müller fragt nach dem Kurs", "Frau [name] fragt nach dem Kurs"),
+    ("Viele Grüße, Petra", "Viele Grüße, [name]"),
+    ("Herr Dr. Müller hat mich überwiesen", "Herr Dr. [name] hat mich überwiesen"),
+    ("mein Name ist Dr. Müller", "mein Name ist Dr. [name]"),
+    ("Frau Prof. Dr. Anna Schmidt", "Frau Prof. Dr. [name]"),
+    # gesundheit
+    ("ich habe Rückenschmerzen seit der Operation", "ich habe [gesundheit] seit der [gesundheit]"),
+    ("Bandscheibenvorfall, darf ich Kreuzheben?", "[gesundheit], darf ich Kreuzheben?"),
+    ("Ich bin schwanger und habe Diabetes", "Ich bin [gesundheit] und habe [gesundheit]"),
+    ("nach meiner Reha wieder einsteigen", "nach meiner [gesundheit] wieder einsteigen"),
+    ("Kniearthrose links, geht Beinpresse?", "[gesundheit] links, geht Beinpresse?"),
+    ("ich war beim Arzt wegen meinem Herz", "ich war beim [gesundheit] wegen meinem [gesundheit]"),
+    ("ich gehe zur Physio", "ich gehe zur [gesundheit]"),
+    ("mein Rücken tut weh", "mein [gesundheit] tut weh"),
+    ("Herz OP letztes Jahr", "[gesundheit] [gesundheit] letztes Jahr"),
+    ("bin krankgeschrieben, Abo pausieren?", "bin [gesundheit], Abo pausieren?"),
+    # Negativfälle
+    ("Was kostet das Abo? 30€ im Monat", "Was kostet das Abo? 30€ im Monat"),
+    ("bring 2 Freunde mit, 3 mal pro Woche training", "bring 2 Freunde mit, 3 mal pro Woche training"),
+    ("Kurs um 18:30 am 24.12.?", "Kurs um 18:30 am 24.12.?"),
+    ("Öffnungszeiten im Juni 2025", "Öffnungszeiten im Juni 2025"),
+    ("Ich bin Anfänger und möchte abnehmen", "Ich bin Anfänger und möchte abnehmen"),
+    ("Rückenkurs dienstags 9-12 und 14-18 Uhr", "Rückenkurs dienstags 9-12 und 14-18 Uhr"),
+    ("Grüße aus Hildesheim", "Grüße aus Hildesheim"),
+    ("Herzlich willkommen, optimal für Kniebeugen", "Herzlich willkommen, optimal für Kniebeugen"),
+    ("Preis 1.299,00 € für 12 Monate", "Preis 1.299,00 € für 12 Monate"),
+]
+
+PII_SNIPPETS = [
+    "Meine Mail: lisa.meyer@web.de", "Tel 0171 2345678", "ich heiße Tom Becker",
+    "geb. 12.04.1991", "Wohne Lindenweg 5, 31134 Hildesheim", "habe Kniearthrose",
+    "IBAN DE02 1203 0000 0000 2020 51", "Viele Grüße, Sabine",
+]
+
+
+def _legacy_sanitize(text: str) -> str:
+    """Maskierung vor ptc_pii: nur E-Mails und Telefonnummern."""
+    t = (text or "").strip()
+    t = t[:800]
+    t = re.sub(r"[\w\.-]+@[\w\.-]+\.\w+", "[email]", t)
+    t = re.sub(r"\b(\+?\d[\d\s\-\/]{7,}\d)\b", "[telefon]", t)
+    return t
+
+
+def check_golden() -> List[str]:
+    errors = []
+    for text, expected in GOLDEN:
+        got = sanitize_for_log(text)
+        if got != expected:
+            errors.append(f"{text!r}: {got!r} != {expected!r}")
+        elif sanitize_for_log(got) != got:  # scrub_log.py darf mehrfach laufen
+            errors.append(f"{text!r}: nicht idempotent ({sanitize_for_log(got)!r})")
+    for intent in HEALTH_INTENTS:  # Gesundheitsfragen landen nie im Klartext im Log
+        got = sanitize_for_log("Was kostet das Abo?", intent)
+        if got != "[gesundheit]":
+            errors.append(f"Intent {intent!r}: {got!r} != '[gesundheit]'")
+    return errors
+
+
+def build_pii_corpus(n: int) -> List[str]:
+    rnd = random.Random(SEED)
+    corpus = build_corpus(n)
+    for i in range(0, n, 10):
+        corpus[i] = f"{corpus[i]} {rnd.choice(PII_SNIPPETS)}"
+    return corpus
+
+
+def run_benchmark(n: int) -> Dict[str, object]:
+    corpus = build_pii_corpus(n)
+    mb = sum(len(t.encode("utf-8")) for t in corpus) / 1e6
+    sanitize_for_log("warm-up")  # Muster kompilieren, nicht mitmessen
+
+    timings = {}
+    for name, fn in (("legacy", _legacy_sanitize), ("ptc_pii", sanitize_for_log)):
+        secs = min(timeit.repeat(lambda: [fn(t) for t in corpus], number=1, repeat=5))
+        timings[name] = {"us_per_text": round(secs / n * 1e6, 2), "mb_per_s": round(mb / secs, 1)}
+
+    hits: Dict[str, int] = {c: 0 for c in PII_CATEGORIES}
+    for t in corpus:
+        for category, k in scrub(t)[1].items():
+            hits[category] += k
+    return {"texts": n, "mb": round(mb, 2), "timings": timings, "hits": hits}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--texts", type=int, default=BENCH_TEXTS, help="Anzahl Texte im Benchmark")
+    ap.add_argument("--out", help="JSON-Bericht in diese Datei schreiben")
+    args = ap.parse_args()
+
+    errors = check_golden()
+    print(f"Golden-Korpus: {len(GOLDEN) - len(errors)}/{len(GOLDEN)} korrekt")
+    for e in errors:
+        print(f"  {e}")
+
+    report = run_benchmark(args.texts)
+    report["golden_errors"] = errors
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+
+    print(f"Korpus: {report['texts']:,} Texte, {report['mb']} MB")
+    for name, t in report["timings"].items():
+        print(f"{name:>10}: {t['us_per_text']:6.2f} µs/Text  {t['mb_per_s']:6.1f} MB/s")
+    print("Treffer:", ", ".join(f"{c}={k}" for c, k in report["hits"].items()))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
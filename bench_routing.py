@@ -0,0 +1,308 @@
+"""
+Benchmark-Suite für die Routing-Pipeline.
+
+Erzeugt einen synthetischen Korpus deutscher Chat-Fragen (alle Intents aus
+INTENTS, alle Ziele aus GOAL_PATTERNS, Fallbacks, lange 800-Zeichen-Texte)
+und misst die Stufen von route_and_answer einzeln:
+
+    rate_limit (Token-Buckets, nie voll), normalize, infer_goal, route
+    (Intent-Matching ohne Cache), render (Handler), sanitize_for_log,
+    stats_inc, log_submit, route_and_answer (ohne Rate-Limit)
+
+Ergebnis als JSON mit p50/p95/p99/mean (µs) und ops/sec pro Stufe. Im
+Gate-Modus wird gegen eine gespeicherte Baseline verglichen; Exit-Code 1,
+wenn eine Stufe um mehr als den Schwellwert langsamer geworden ist.
+
+    python bench_routing.py                                  # Bericht ausgeben
+    python bench_routing.py --out bench.json                 # Bericht speichern
+    python bench_routing.py --save-baseline                  # Baseline schreiben
+    python bench_routing.py --gate [--threshold 0.25]        # gegen Baseline prüfen
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import ptc_core
+import ptc_storage
+from ptc_core import (
+    GOAL_PATTERNS,
+    INTENTS,
+    ChatSession,
+    _expand_pattern,
+    answer_default,
+    get_intent_router,
+    infer_goal,
+    normalize,
+    route_and_answer,
+)
+
+BENCH_BASELINE = "bench_routing_baseline.json"
+BENCH_QUERIES = 5000
+BENCH_ROUNDS = 3
+BENCH_THRESHOLD = 0.25     # erlaubte Verschlechterung je Stufe (0.25 = +25 %)
+BENCH_GATE_METRIC = "p50"  # p50 ist auf geteilten CI-Maschinen am stabilsten
+BENCH_SEED = 1337
+LONG_TEXT_LEN = 800
+
+INTENT_FRAMES = [
+    "{kw}?",
+    "Hallo, wie ist das bei euch mit {kw}?",
+    "Ich hätte eine Frage zu {kw}.",
+    "Gibt es bei euch {kw}? Danke!",
+    "Moin! {kw} – was muss ich da wissen?",
+    "Kurze Frage: {kw}",
+    "{kw}??? wäre super wenn ihr mir das sagen könntet",
+]
+GOAL_FRAMES = [
+    "Ich möchte {kw}, {intent}",
+    "Mein Ziel: mehr {kw}. {intent}",
+    "{intent} Es geht mir vor allem um {kw}.",
+]
+FALLBACK_QUESTIONS = [
+    "Hallo",
+    "Danke!",
+    "Wie heißt ihr Hund?",
+    "Könnt ihr mir einen Tipp für ein Restaurant geben?",
+    "Was haltet ihr von Proteinpulver?",
+    "Ist das hier ein Chatbot?",
+    "ok",
+    "👍",
+    "Schreibt ihr auch auf Englisch? Do you speak English?",
+    "asdf jklö",
+]
+FILLER = (
+    "Ich war früher mal im Verein, dann kam die Arbeit dazwischen und jetzt "
+    "suche ich wieder etwas in der Nähe, das nicht zu voll ist und wo man "
+    "auch mal nachfragen kann, ohne komisch angeschaut zu werden. "
+)
+
+
+def _keywords(patterns: List[str]) -> List[str]:
+    out: List[str] = []
+    for p in patterns:
+        literals = _expand_pattern(p.replace(r"\b", ""))
+        out += [lit for lit in literals or [] if lit.strip()]
+    return out
+
+
+def build_corpus(n: int, seed: int = BENCH_SEED) -> List[str]:
+    """Deterministischer Korpus: ~70 % Intents, ~15 % mit Ziel, ~10 % Fallback, ~5 % lang."""
+    rnd = random.Random(seed)
+    intent_kws = [_keywords(list(i["patterns"])) for i in INTENTS]
+    intent_kws = [kws for kws in intent_kws if kws]
+    goal_kws = [kws for kws in (_keywords(pats) for _, pats in GOAL_PATTERNS) if kws]
+
+    def intent_question() -> str:
+        kw = rnd.choice(rnd.choice(intent_kws))
+        if rnd.random() < 0.3:
+            kw = kw.capitalize()
+        return rnd.choice(INTENT_FRAMES).format(kw=kw)
+
+    corpus: List[str] = []
+    # jede Intent- und Ziel-Gruppe mindestens einmal
+    for kws in intent_kws:
+        corpus.append(rnd.choice(INTENT_FRAMES).format(kw=kws[0]))
+    for kws in goal_kws:
+        corpus.append(rnd.choice(GOAL_FRAMES).format(kw=kws[0], intent=intent_question()))
+    while len(corpus) < n:
+        r = rnd.random()
+        if r < 0.70:
+            corpus.append(intent_question())
+        elif r < 0.85:
+            kw = rnd.choice(rnd.choice(goal_kws))
+            corpus.append(rnd.choice(GOAL_FRAMES).format(kw=kw, intent=intent_question()))
+        elif r < 0.95:
+            corpus.append(rnd.choice(FALLBACK_QUESTIONS))
+        else:
+            text = intent_question() + " " + FILLER * (LONG_TEXT_LEN // len(FILLER) + 1)
+            corpus.append(text[:LONG_TEXT_LEN])
+    rnd.shuffle(corpus)
+    return corpus[:n]
+
+
+# =========================================================
+# Messung
+# =========================================================
+def _percentile(sorted_ns: List[int], q: float) -> float:
+    k = min(len(sorted_ns) - 1, max(0, int(round(q * (len(sorted_ns) - 1)))))
+    return sorted_ns[k] / 1000.0
+
+
+def _time_stage(fn: Callable[[object], object], inputs: List[object], rounds: int) -> Dict[str, float]:
+    clock = time.perf_counter_ns
+    for x in inputs[:200]:
+        fn(x)  # Aufwärmen
+    samples: List[int] = []
+    total = 0
+    for _ in range(rounds):
+        for x in inputs:
+            t0 = clock()
+            fn(x)
+            dt = clock() - t0
+            samples.append(dt)
+            total += dt
+    samples.sort()
+    return {
+        "n": len(samples),
+        "p50_us": round(_percentile(samples, 0.50), 3),
+        "p95_us": round(_percentile(samples, 0.95), 3),
+        "p99_us": round(_percentile(samples, 0.99), 3),
+        "mean_us": round(total / len(samples) / 1000.0, 3),
+        "ops_per_sec": round(len(samples) / (total / 1e9), 1) if total else 0.0,
+    }
+
+
+def run_benchmark(n: int = BENCH_QUERIES, rounds: int = BENCH_ROUNDS) -> Dict[str, object]:
+    corpus = build_corpus(n)
+    norms = [normalize(t) for t in corpus]
+    router = get_intent_router()
+    routed = [router.route(t) for t in norms]
+    handlers = [INTENTS[idx]["handler"] if idx is not None else answer_default for idx, _ in routed]
+    render_inputs = list(zip(handlers, (g for _, g in routed)))
+    data = ptc_core.get_knowledge().data
+    intent_names = [str(INTENTS[idx]["name"]) if idx is not None else "fallback" for idx, _ in routed]
+
+    stages: Dict[str, Dict[str, float]] = {}
+    # eigener Limiter mit riesigen Buckets: misst den Normalfall (durchgelassen)
+    limiter = ptc_core.RateLimiter(
+        enabled=True, session_per_min=1e9, session_burst=10**9, client_per_min=1e9, client_burst=10**9
+    )
+    sessions = [ChatSession() for _ in range(64)]
+    clients = [(sessions[i % 64], f"10.0.{i // 256 % 256}.{i % 256}") for i in range(len(corpus))]
+    stages["rate_limit"] = _time_stage(lambda sc: limiter.allow(sc[0], sc[1]), clients, rounds)
+    stages["normalize"] = _time_stage(normalize, corpus, rounds)
+    stages["infer_goal"] = _time_stage(infer_goal, norms, rounds)
+    stages["route"] = _time_stage(router.route, norms, rounds)
+    stages["render"] = _time_stage(lambda hg: hg[0](hg[1], data), render_inputs, rounds)
+    stages["sanitize_for_log"] = _time_stage(ptc_storage.sanitize_for_log, corpus, rounds)
+
+    # Stats/Log schreiben in ein Wegwerf-Verzeichnis (relative Pfade der Module)
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="ptc_bench_")
+    try:
+        os.chdir(workdir)
+        stats = ptc_storage.new_stats_store()
+        logger = ptc_storage.QuestionLogger(maxsize=len(corpus) * (rounds + 1) + 1000)
+        try:
+            stages["stats_inc"] = _time_stage(
+                lambda name: stats.inc_fallback() if name == "fallback" else stats.inc_intent(name),
+                intent_names,
+                rounds,
+            )
+            items = list(zip(corpus, intent_names))
+            stages["log_submit"] = _time_stage(lambda it: logger.submit(it[0], it[1], None), items, rounds)
+            t0 = time.perf_counter()
+            logger.flush()
+            drain_s = time.perf_counter() - t0
+        finally:
+            for closer in (logger.close, stats.close):
+                closer()
+                atexit.unregister(closer)  # sonst schreibt atexit später ins Aufrufer-Verzeichnis
+        written = int(logger.counters["written"])
+        stages["log_submit"]["drain_ms"] = round(drain_s * 1000.0, 1)
+        stages["log_submit"]["written_per_sec"] = round(
+            written / max(logger.counters["flush_ms_total"] / 1000.0, 1e-9), 1
+        )
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    session = ChatSession()
+    ptc_core.get_response_cache().routes.clear()
+    limiter = ptc_core.get_rate_limiter()
+    limit_enabled, limiter.enabled = limiter.enabled, False  # eine Session -> wäre sonst sofort gedrosselt
+    try:
+        stages["route_and_answer"] = _time_stage(lambda t: route_and_answer(t, session), corpus, rounds)
+    finally:
+        limiter.enabled = limit_enabled
+
+    coverage: Dict[str, int] = {}
+    for name in intent_names:
+        coverage[name] = coverage.get(name, 0) + 1
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "queries": len(corpus),
+            "rounds": rounds,
+            "data_version": ptc_core.DATA_VERSION,
+            "goals": sum(1 for _, g in routed if g),
+            "long_inputs": sum(1 for t in corpus if len(t) >= LONG_TEXT_LEN),
+        },
+        "coverage": dict(sorted(coverage.items())),
+        "stages": stages,
+    }
+
+
+def compare(
+    report: Dict[str, object], baseline: Dict[str, object],
+    threshold: float = BENCH_THRESHOLD, metric: str = BENCH_GATE_METRIC,
+) -> List[Tuple[str, float, float, Optional[float]]]:
+    """(Stufe, Baseline, aktuell, Faktor) je Stufe; Faktor None = Stufe fehlt in der Baseline."""
+    key = metric + "_us"
+    rows = []
+    for stage, cur in report["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base or not base.get(key):
+            rows.append((stage, 0.0, cur[key], None))
+            continue
+        rows.append((stage, base[key], cur[key], cur[key] / base[key]))
+    return rows
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--queries", type=int, default=BENCH_QUERIES)
+    ap.add_argument("--rounds", type=int, default=BENCH_ROUNDS)
+    ap.add_argument("--out", help="JSON-Bericht in diese Datei schreiben")
+    ap.add_argument("--baseline", default=BENCH_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true", help="Ergebnis als neue Baseline speichern")
+    ap.add_argument("--gate", action="store_true", help="gegen die Baseline prüfen (Exit 1 bei Regression)")
+    ap.add_argument("--threshold", type=float, default=BENCH_THRESHOLD)
+    ap.add_argument("--metric", choices=("p50", "p95", "p99", "mean"), default=BENCH_GATE_METRIC)
+    args = ap.parse_args()
+
+    report = run_benchmark(args.queries, args.rounds)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Baseline gespeichert: {args.baseline}")
+
+    print(f"{'Stufe':<18}{'p50 µs':>10}{'p95 µs':>10}{'p99 µs':>10}{'ops/s':>14}")
+    for stage, r in report["stages"].items():
+        print(f"{stage:<18}{r['p50_us']:>10.2f}{r['p95_us']:>10.2f}{r['p99_us']:>10.2f}{r['ops_per_sec']:>14,.0f}")
+
+    if not args.gate:
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"FEHLER: keine Baseline unter {args.baseline} (erst --save-baseline)")
+        return 1
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    failed = False
+    print(f"\nGate ({args.metric}, Schwelle +{args.threshold:.0%}):")
+    for stage, base, cur, factor in compare(report, baseline, args.threshold, args.metric):
+        if factor is None:
+            print(f"  {stage:<18} neu, keine Baseline")
+            continue
+        bad = factor > 1.0 + args.threshold
+        failed |= bad
+        print(f"  {stage:<18}{base:>10.2f} -> {cur:>8.2f} µs  ({factor - 1.0:+.0%}){'  REGRESSION' if bad else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Benchmark für den Mandantenbetrieb (ptc_tenants).
+
+Legt in einem Temp-Verzeichnis N Studios an: jedes mit eigenem Namen,
+eigener Telefonnummer und eigenem Kursplan, jedes zehnte zusätzlich mit
+einem eigenen Intent-Pattern. Gemessen werden
+- Speicher pro weiterem Studio (tracemalloc) – mit geteilten Patterns, mit
+  eigenen Patterns und zum Vergleich ohne geteilte Regel-Indizes,
+- ms für einen kalten Aufbau und µs für einen Zugriff aus dem LRU-Cache.
+Geprüft wird, dass kalte Studios und ihre Storages aus dem LRU fallen, jede
+Antwort die Telefonnummer ihres Studios enthält und eigene Patterns nur im
+eigenen Studio greifen. Exit-Code 1 bei Fehlern.
+
+    python bench_tenants.py [--tenants 200] [--out report.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+import ptc_core
+import ptc_storage
+from ptc_core import KNOWLEDGE_FILE, ChatSession, get_knowledge, handle_message
+from ptc_tenants import TenantRegistry
+
+BENCH_TENANTS = 200
+OWN_PATTERNS_EVERY = 10
+CUSTOM_WORD = "aquaspinning"
+
+
+def _phone(i: int) -> str:
+    return f"0511 {100000 + i}"
+
+
+def write_tenants(path: str, n: int) -> List[str]:
+    with open(KNOWLEDGE_FILE, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    ids = []
+    for i in range(n):
+        tid = f"studio-{i:04d}"
+        overlay: Dict[str, object] = {
+            "studio": {
+                "name": f"PTC Studio {i}",
+                "phone_display": _phone(i),
+                "phone_tel": f"tel:+49511{100000 + i}",
+            },
+            "course_plan": {"Montag": [["18:00", f"Zumba {i}"]], "Mittwoch": [["19:00", "Yoga"]]},
+        }
+        if i % OWN_PATTERNS_EVERY == 0:
+            intents = json.loads(json.dumps(base["intents"]))
+            intents[0]["patterns"] = intents[0]["patterns"] + [rf"\b{CUSTOM_WORD}{i}\b"]
+            overlay["intents"] = intents
+        with open(os.path.join(path, tid + ".json"), "w", encoding="utf-8") as f:
+            json.dump(overlay, f, ensure_ascii=False)
+        ids.append(tid)
+    return ids
+
+
+def _bytes_per_tenant(reg: TenantRegistry, ids: List[str], unshared: bool = False) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for tid in ids:
+        if unshared:
+            ptc_core._RULE_INDEXES.clear()
+        reg.knowledge(tid)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(ids) if ids else 0.0
+
+
+def run_benchmark(n: int) -> Dict[str, object]:
+    tmp = tempfile.mkdtemp(prefix="ptc_tenants_")
+    try:
+        ids = write_tenants(tmp, n)
+        get_knowledge()  # Basis-Studio wie im Betrieb schon geladen
+        own = [t for i, t in enumerate(ids) if i % OWN_PATTERNS_EVERY == 0]
+        shared = [t for i, t in enumerate(ids) if i % OWN_PATTERNS_EVERY != 0]
+        errors: List[str] = []
+
+        reg = TenantRegistry(path=tmp, maxsize=n, data_dir=os.path.join(tmp, "data"))
+        reg.knowledge(own[0])
+        cold = []
+        for tid in shared[:50]:
+            t0 = time.perf_counter()
+            reg.knowledge(tid)
+            cold.append((time.perf_counter() - t0) * 1000)
+        mem_shared = _bytes_per_tenant(reg, shared[50:])
+        mem_own = _bytes_per_tenant(reg, own[1:])
+        hot_t0 = time.perf_counter()
+        for _ in range(20):
+            for tid in ids:
+                reg.knowledge(tid)
+        hot_us = (time.perf_counter() - hot_t0) / (20 * n) * 1e6
+
+        indexes = len(ptc_core._RULE_INDEXES)
+        fresh = TenantRegistry(path=tmp, maxsize=n, data_dir=os.path.join(tmp, "data"))
+        mem_unshared = _bytes_per_tenant(fresh, shared[50:], unshared=True)
+        del fresh
+
+        # Isolation: Telefonnummer und eigene Patterns
+        base_intent = get_knowledge().intents[0]["name"]
+        for i, tid in enumerate(ids[:3 * OWN_PATTERNS_EVERY]):
+            kb = reg.knowledge(tid)
+            reply = handle_message("Wie ist eure Telefonnummer?", ChatSession(), knowledge=kb)
+            if _phone(i) not in reply.text:
+                errors.append(f"{tid}: Antwort ohne eigene Telefonnummer")
+            custom = handle_message(f"gibt es {CUSTOM_WORD}{i}?", ChatSession(), knowledge=kb).intent
+            if (custom == base_intent) != (i % OWN_PATTERNS_EVERY == 0):
+                errors.append(f"{tid}: eigenes Pattern -> {custom}")
+        if handle_message(f"gibt es {CUSTOM_WORD}0?", ChatSession()).intent == base_intent:
+            errors.append("Basis-Studio: Pattern eines Mandanten greift")
+
+        # LRU: nur die zuletzt benutzten bleiben
+        small = TenantRegistry(path=tmp, maxsize=8, data_dir=os.path.join(tmp, "data"))
+        for tid in ids[:20]:
+            small.knowledge(tid)
+        small.knowledge(ids[19])
+        st = small.stats()
+        if st["cached"] != 8 or st["evictions"] != 12 or st["hits"] != 1:
+            errors.append(f"LRU: {st}")
+        first = small.storage(ids[0])
+        for tid in ids[1:20]:
+            small.storage(tid)
+        st = small.stats()
+        if st["storages"] != 8 or st["storage_evictions"] != 12 or first.writer._thread.is_alive():
+            errors.append(f"LRU (Storages): {st}")
+        for storage in small.storages():
+            ptc_storage.close_storage(storage)
+
+        return {
+            "tenants": n,
+            "bytes_per_tenant": {
+                "shared_patterns": round(mem_shared),
+                "own_patterns": round(mem_own),
+                "unshared_indexes": round(mem_unshared),
+            },
+            "cold_build_ms": round(statistics.median(cold), 2),
+            "hot_get_us": round(hot_us, 2),
+            "shared_rule_indexes": indexes,
+            "errors": errors,
+        }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tenants", type=int, default=BENCH_TENANTS)
+    ap.add_argument("--out", help="JSON-Bericht in diese Datei schreiben")
+    args = ap.parse_args()
+    if args.tenants < 100:
+        ap.error("--tenants: mindestens 100")
+
+    report = run_benchmark(args.tenants)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+
+    mem = report["bytes_per_tenant"]
+    print(f"{report['tenants']} Studios, {report['shared_rule_indexes']} kompilierte Regel-Indizes")
+    print(f"Speicher/Studio: {mem['shared_patterns'] / 1024:.1f} KB (geteilte Patterns) · "
+          f"{mem['own_patterns'] / 1024:.1f} KB (eigene Patterns) · "
+          f"{mem['unshared_indexes'] / 1024:.1f} KB (ohne Teilen)")
+    print(f"Kalter Aufbau: {report['cold_build_ms']:.2f} ms · Zugriff aus dem Cache: {report['hot_get_us']:.2f} µs")
+    for e in report["errors"]:
+        print(f"  FEHLER {e}")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
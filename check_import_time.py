@@ -0,0 +1,64 @@
+"""
+Import-Zeit-Budget für den Routing-Kern.
+
+Startet einen frischen Interpreter mit `python -X importtime`, misst die
+kumulierte Importzeit von ptc_core und prüft, dass dabei kein Streamlit
+mitgeladen wird. Exit-Code 1 bei Überschreitung (für CI/Pre-Commit).
+
+    python check_import_time.py [--budget 80]
+"""
+import argparse
+import subprocess
+import sys
+from typing import List, Tuple
+
+IMPORT_BUDGET_MS = 80.0
+MODULE = "ptc_core"
+FORBIDDEN = ("streamlit",)
+
+
+def measure(module: str = MODULE) -> Tuple[float, List[str]]:
+    """Liefert (kumulierte Importzeit in ms, geladene Top-Level-Pakete)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative_us = None
+    packages = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # Kopfzeile
+        packages.append(name.strip().split(".")[0])
+        if name.strip() == module and not name.startswith("  "):
+            cumulative_us = int(cumulative)
+    if cumulative_us is None:
+        raise RuntimeError(f"{module} nicht in der -X importtime-Ausgabe gefunden")
+    return cumulative_us / 1000.0, packages
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--budget", type=float, default=IMPORT_BUDGET_MS, help="Budget in ms")
+    budget = ap.parse_args().budget
+    # bestes von drei Läufen, damit ein kalter Dateisystem-Cache nicht zählt
+    runs = [measure() for _ in range(3)]
+    ms = min(r[0] for r in runs)
+    loaded = set(runs[0][1])
+    bad = [p for p in FORBIDDEN if p in loaded]
+    print(f"{MODULE}: {ms:.1f} ms (Budget {budget:.0f} ms)")
+    if bad:
+        print(f"FEHLER: {MODULE} lädt {', '.join(bad)}")
+        return 1
+    if ms > budget:
+        print("FEHLER: Import-Zeit-Budget überschritten")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Äquivalenz-Check für die vorgerenderten Antworten (ANTWORT-VORLAGEN in ptc_core).
+
+Rendert für die Wissensbasis und jedes Studio aus tenants/ jeden Intent und
+den Fallback für jedes Ziel (None + goal_patterns) direkt über den Handler
+und vergleicht das Ergebnis mit der Vorlage im Snapshot. Danach laufen
+Beispiel-Gespräche (Ziel nennen, dann Frage) einmal über die Vorlagen und
+einmal über einen Snapshot ohne Vorlagen, der jede Antwort pro Nachricht
+rendert. Exit-Code 1 bei Abweichungen oder fehlenden Vorlagen.
+
+    python check_templates.py [--no-tenants]
+"""
+import argparse
+import sys
+from typing import List, Optional, Tuple
+
+from ptc_core import ChatSession, Knowledge, answer_default, get_knowledge, handle_message
+from ptc_tenants import get_tenants
+
+# eine Frage pro Intent der Standard-Wissensbasis, dazu zwei ohne Treffer
+QUESTIONS = [
+    "Ich habe Rückenschmerzen, darf ich trainieren?",
+    "Was kostet die Mitgliedschaft im Monat?",
+    "Gibt es Duschen und Spinde?",
+    "Habt ihr eine Infrarotkabine oder Massagesessel?",
+    "Geht Kartenzahlung oder Apple Pay?",
+    "Gibt es ein Mindestalter für Jugendliche?",
+    "Ist das Studio barrierefrei?",
+    "Ich habe lange keinen Sport gemacht",
+    "Ich weiß nicht, wo ich anfangen soll",
+    "Kann ich ein Probetraining machen?",
+    "Wo kann ich parken und wann habt ihr offen?",
+    "Welche Kurse gibt es am Montag?",
+    "Welche Geräte habt ihr?",
+    "Wie wird das Wetter morgen?",
+    "",
+]
+
+
+def check_templates(kb: Knowledge) -> List[str]:
+    """Vorlage gegen direkt gerenderte Antwort für jedes (Intent, Ziel)."""
+    errors = []
+    goals: List[Optional[str]] = [None] + [g for g, _ in kb.data["goal_patterns"]]
+    handlers: List[Tuple[str, object]] = [
+        (str(i.get("name", "unknown")), i.get("handler")) for i in kb.intents if callable(i.get("handler"))
+    ]
+    handlers.append(("fallback", answer_default))
+    for name, handler in handlers:
+        for goal in goals:
+            expected = kb.render(handler, goal)
+            got = kb.templates.get((name, goal))
+            if got is None:
+                errors.append(f"{name}/{goal}: keine Vorlage")
+            elif got != expected:
+                errors.append(f"{name}/{goal}: Vorlage weicht ab: {got[:60]!r} != {expected[:60]!r}")
+    return errors
+
+
+def check_conversations(kb: Knowledge) -> List[str]:
+    """Gleiche Gespräche über die Vorlagen und über Rendern pro Nachricht."""
+    errors = []
+    bare = Knowledge(kb.version, kb.intents, kb.router, {}, kb.source, kb.data, kb.routes)
+    openers = [""] + [f"Ich möchte {g}" for g, _ in kb.data["goal_patterns"]]
+    for opener in openers:
+        for question in QUESTIONS:
+            fast, slow = ChatSession(), ChatSession()
+            for text in ([opener] if opener else []) + [question]:
+                a = handle_message(text, fast, knowledge=kb)
+                b = handle_message(text, slow, knowledge=bare)
+                if (a.intent, a.goal, a.text) != (b.intent, b.goal, b.text):
+                    errors.append(f"{opener!r} -> {text!r}: {a.intent}/{a.goal} != {b.intent}/{b.goal}")
+    return errors
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--no-tenants", action="store_true", help="nur die Wissensbasis prüfen, keine Studios")
+    args = ap.parse_args()
+
+    snapshots = [("Wissensbasis", get_knowledge())]
+    if not args.no_tenants:
+        tenants = get_tenants()
+        snapshots += [(f"Studio {tid}", tenants.knowledge(tid)) for tid in tenants.available()]
+
+    failed = 0
+    for label, kb in snapshots:
+        errors = check_templates(kb) + check_conversations(kb)
+        print(f"{label}: {len(kb.templates)} Vorlagen, {len(errors)} Abweichungen")
+        for e in errors[:10]:
+            print(f"  FEHLER {e}")
+        failed += bool(errors)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
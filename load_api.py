@@ -0,0 +1,194 @@
+"""
+Lastgenerator für die JSON-API (ptc_api.py).
+
+Öffnet N Keep-Alive-Verbindungen (je eine Session, asyncio) und schickt
+Fragen aus dem Korpus von bench_routing.py so schnell wie möglich an
+POST /ask. Gemessen werden Durchsatz (Anfragen/s) und Latenz
+(p50/p95/p99/max) über die Messdauer nach einer Aufwärmphase.
+
+Mit --spawn startet das Skript den Server selbst in einem Wegwerf-
+Verzeichnis, einmal pro Eintrag in --workers (z. B. "1,4"); ohne --spawn
+wird --url angesprochen (dort mit --no-rate-limit starten, sonst zählen
+429-Antworten als Fehler). Client und Server teilen sich auf einer Maschine
+die CPU – die Zahlen sind eine Untergrenze. Exit-Code 1 bei Fehlern.
+
+    python load_api.py --spawn --workers 1,4 --connections 32 --duration 10 [--out report.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from bench_routing import _percentile, build_corpus
+
+LOAD_CONNECTIONS = 32
+LOAD_DURATION = 10.0       # Sekunden Messung
+LOAD_WARMUP = 2.0          # Sekunden vorab, nicht gemessen
+API_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ptc_api.py")
+
+
+def _request(host: str, text: str, session: str) -> bytes:
+    body = json.dumps({"session": session, "text": text}, ensure_ascii=False).encode("utf-8")
+    return (
+        f"POST /ask HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode("latin-1") + body
+
+
+async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def _connection(
+    host: str, port: int, requests: List[bytes], t_start: float, t_end: float, out: List[int], errors: List[str]
+) -> None:
+    clock = time.perf_counter_ns
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError as e:
+        errors.append(repr(e))
+        return
+    try:
+        i = 0
+        while True:
+            now = time.perf_counter()
+            if now >= t_end:
+                break
+            t0 = clock()
+            writer.write(requests[i % len(requests)])
+            status, _ = await _read_response(reader)
+            if now >= t_start:
+                out.append(clock() - t0)
+            if status != 200:
+                errors.append(f"HTTP {status}")
+            i += 1
+    except (OSError, asyncio.IncompleteReadError) as e:
+        errors.append(repr(e))
+    finally:
+        writer.close()
+
+
+async def _run(host: str, port: int, connections: int, duration: float, warmup: float) -> Dict[str, object]:
+    corpus = build_corpus(max(connections * 50, 1000))
+    per_conn = len(corpus) // connections
+    latencies: List[List[int]] = [[] for _ in range(connections)]
+    errors: List[str] = []
+    t_start = time.perf_counter() + warmup
+    t_end = t_start + duration
+    await asyncio.gather(*(
+        _connection(
+            host, port,
+            [_request(host, q, f"load-{i}") for q in corpus[i * per_conn:(i + 1) * per_conn]],
+            t_start, t_end, latencies[i], errors,
+        )
+        for i in range(connections)
+    ))
+    samples = sorted(ns for per in latencies for ns in per)
+    latency: Dict[str, object] = {"n": len(samples)}
+    if samples:
+        latency.update({
+            "p50_ms": round(_percentile(samples, 0.50) / 1000.0, 3),
+            "p95_ms": round(_percentile(samples, 0.95) / 1000.0, 3),
+            "p99_ms": round(_percentile(samples, 0.99) / 1000.0, 3),
+            "max_ms": round(samples[-1] / 1e6, 3),
+        })
+    return {
+        "connections": connections,
+        "duration_s": duration,
+        "requests_per_s": round(len(samples) / duration, 1),
+        "latency": latency,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+    }
+
+
+# =========================================================
+# Server starten (--spawn)
+# =========================================================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1.0) as s:
+                s.sendall(b"GET /health HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+                if s.recv(64).startswith(b"HTTP/1.1 200"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("API-Server ist nicht gestartet")
+
+
+def run_spawned(workers: int, backend: str, connections: int, duration: float, warmup: float) -> Dict[str, object]:
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix="ptc_api_load_")
+    proc: Optional[subprocess.Popen] = None
+    try:
+        proc = subprocess.Popen(
+            # misst den Durchsatz, nicht das Rate-Limit (alle Verbindungen kommen von einer IP)
+            [sys.executable, API_FILE, "--port", str(port), "--workers", str(workers), "--backend", backend,
+             "--no-rate-limit"],
+            cwd=workdir, stdout=subprocess.DEVNULL,
+        )
+        _wait_ready(port)
+        report = asyncio.run(_run("127.0.0.1", port, connections, duration, warmup))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return dict({"workers": workers, "backend": backend}, **report)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="127.0.0.1:8765", help="host:port eines laufenden Servers")
+    ap.add_argument("--spawn", action="store_true", help="Server selbst starten (pro --workers-Eintrag)")
+    ap.add_argument("--workers", default="1", help="kommagetrennt, nur mit --spawn, z. B. 1,4")
+    ap.add_argument("--backend", choices=("jsonl", "sqlite"), help="mit --spawn; Standard: jsonl bzw. sqlite ab 2 Workern")
+    ap.add_argument("--connections", type=int, default=LOAD_CONNECTIONS)
+    ap.add_argument("--duration", type=float, default=LOAD_DURATION)
+    ap.add_argument("--warmup", type=float, default=LOAD_WARMUP)
+    ap.add_argument("--out", help="JSON-Bericht in diese Datei schreiben")
+    args = ap.parse_args()
+
+    runs = []
+    if args.spawn:
+        for w in (int(x) for x in args.workers.split(",")):
+            backend = args.backend or ("sqlite" if w > 1 else "jsonl")
+            runs.append(run_spawned(w, backend, args.connections, args.duration, args.warmup))
+    else:
+        host, _, port = args.url.rpartition(":")
+        runs.append(asyncio.run(_run(host or "127.0.0.1", int(port), args.connections, args.duration, args.warmup)))
+
+    text = json.dumps({"cpus": os.cpu_count(), "runs": runs}, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return 1 if any(r["errors"] for r in runs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,353 @@
+"""
+Lasttest: N parallele Chat-Sessions gegen den Routing-Kern oder app.py.
+
+Spielt den Fragen-Korpus aus bench_routing.py über N Threads ab (so wie
+Streamlit Sessions in Threads eines Prozesses ausführt) und misst:
+
+- Latenz pro Nachricht (p50/p95/p99/max) und Durchsatz
+- Warte- und Haltezeit der Stats- und Writer-Locks
+- Konsistenz am Ende: keine verlorenen Zähler (Speicher und Platte) und
+  keine abgeschnittenen/kaputten JSONL-Zeilen im Fragen-Log
+
+Modi:
+    core     handle_message() mit dem echten Storage-Backend (Standard)
+    apptest  app.py über streamlit.testing.v1.AppTest, inkl. Script-Rerun
+             (Skriptläufe nacheinander, siehe _APPTEST_LOCK); prüft zusätzlich,
+             dass eine Nachricht nicht mehr als einen Skriptlauf kostet
+             (APPTEST_MAX_RUNS_PER_MESSAGE)
+
+Alle Dateien landen in einem Wegwerf-Verzeichnis. Exit-Code 1, wenn die
+Konsistenzprüfung (bzw. im Modus apptest die Laufprüfung) fehlschlägt.
+
+    python load_test.py --sessions 32 --messages 200 [--backend sqlite] [--out report.json]
+"""
+import argparse
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from threading import Barrier, Lock, Thread
+from typing import Dict, List, Optional
+
+import ptc_storage
+from bench_routing import _percentile, build_corpus
+from ptc_core import ChatSession, get_rate_limiter, handle_message
+
+LOAD_SESSIONS = 16
+LOAD_MESSAGES = 100          # Nachrichten pro Session
+LOAD_THINK_MS = 0.0          # Pause zwischen zwei Nachrichten einer Session
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+class _TimedLock:
+    """Lock-Wrapper, der Warte- und Haltezeit aufsummiert (Werte in ns)."""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._t_acquired = 0
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_ns = 0
+        self.wait_max_ns = 0
+        self.hold_ns = 0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        t0 = time.perf_counter_ns()
+        ok = self._lock.acquire(blocking, timeout)
+        if ok:
+            now = time.perf_counter_ns()
+            # ab hier halten wir den Lock -> Zähler ohne weitere Synchronisation
+            waited = now - t0
+            self.acquisitions += 1
+            self.wait_ns += waited
+            self.wait_max_ns = max(self.wait_max_ns, waited)
+            if waited > 50_000:
+                self.contended += 1
+            self._t_acquired = now
+        return ok
+
+    def release(self) -> None:
+        self.hold_ns += time.perf_counter_ns() - self._t_acquired
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    def report(self) -> Dict[str, float]:
+        n = max(self.acquisitions, 1)
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "wait_ms_total": round(self.wait_ns / 1e6, 3),
+            "wait_us_mean": round(self.wait_ns / n / 1000.0, 3),
+            "wait_ms_max": round(self.wait_max_ns / 1e6, 3),
+            "hold_ms_total": round(self.hold_ns / 1e6, 3),
+            "hold_us_mean": round(self.hold_ns / n / 1000.0, 3),
+        }
+
+
+def _instrument(storage: ptc_storage.StorageBackend) -> Dict[str, _TimedLock]:
+    locks: Dict[str, _TimedLock] = {}
+    stats = getattr(storage, "stats", None)
+    if stats is not None and hasattr(stats, "lock"):  # SharedStatsStore zählt ohne Lock
+        stats.lock = locks["stats"] = _TimedLock(stats.lock)
+    if storage.writer is not None:
+        storage.writer.lock = locks["writer"] = _TimedLock(storage.writer.lock)
+    return locks
+
+
+# =========================================================
+# Sessions
+# =========================================================
+def _core_session(storage, questions: List[str], think_s: float, out: List[int]) -> None:
+    session = ChatSession()
+    clock = time.perf_counter_ns
+    for q in questions:
+        t0 = clock()
+        handle_message(q, session, storage)
+        out.append(clock() - t0)
+        if think_s:
+            time.sleep(think_s)
+
+
+# AppTest legt pro run() eine prozessweite Streamlit-Runtime an und räumt sie
+# wieder ab – gleichzeitige Läufe in Threads scheitern mit "Runtime hasn't been
+# created!". Die Sessions wechseln sich daher ab; gemessen wird nur der Lauf.
+_APPTEST_LOCK = Lock()
+
+# Pro Nachricht genau ein Skriptlauf (Antwort im selben Lauf, kein st.rerun()):
+# eine Nachricht darf höchstens so viel kosten wie dieses Vielfache eines
+# Laufs ohne Eingabe, sonst schlägt der Lasttest fehl.
+APPTEST_RERUNS = 20                  # Läufe ohne Eingabe pro Session, nach den Nachrichten
+APPTEST_MAX_RUNS_PER_MESSAGE = 1.5
+
+
+@contextmanager
+def _shared_script_cache():
+    """
+    Ein ScriptCache für alle AppTest-Läufe, wie ihn die Streamlit-Runtime im
+    Server teilt. AppTest legt sonst pro Lauf einen neuen an und übersetzt
+    app.py jedes Mal neu (AST-Umbau für "Magic" + compile) – das wären ~25 ms
+    pro Lauf, die im Server nur einmal anfallen.
+    """
+    from streamlit.testing.v1 import local_script_runner
+
+    factory = getattr(local_script_runner, "ScriptCache", None)
+    if factory is None:  # ältere Streamlit-Versionen: nicht teilbar, dann eben ohne
+        yield
+        return
+    shared = factory()
+    local_script_runner.ScriptCache = lambda: shared
+    try:
+        yield
+    finally:
+        local_script_runner.ScriptCache = factory
+
+
+def _apptest_session(
+    storage, questions: List[str], think_s: float, out: List[int], reruns: Optional[List[int]] = None
+) -> None:
+    from streamlit.testing.v1 import AppTest
+
+    with _APPTEST_LOCK:
+        at = AppTest.from_file(APP_FILE, default_timeout=60)
+        at.run()
+    clock = time.perf_counter_ns
+    for q in questions:
+        with _APPTEST_LOCK:
+            t0 = clock()
+            at.chat_input[0].set_value(q).run()
+            out.append(clock() - t0)
+        if at.exception:
+            raise RuntimeError(f"app.py-Fehler: {at.exception[0].value}")
+        if think_s:
+            time.sleep(think_s)
+    for _ in range(APPTEST_RERUNS if reruns is not None else 0):
+        with _APPTEST_LOCK:
+            t0 = clock()
+            at.run()
+            reruns.append(clock() - t0)
+
+
+# =========================================================
+# Konsistenz
+# =========================================================
+def _count_log_lines(storage: ptc_storage.StorageBackend) -> Dict[str, int]:
+    if isinstance(storage, ptc_storage.SQLiteStorage):
+        return {"lines": sum(1 for _ in storage.iter_since({})), "torn": 0}
+    lines = torn = 0
+    sources = [ptc_storage._iter_segment_lines(e) for e in ptc_storage.load_log_manifest()]
+    if os.path.exists(ptc_storage.QUESTIONS_LOG):
+        sources.append(open(ptc_storage.QUESTIONS_LOG, "rb"))
+    for src in sources:
+        for line in src:
+            lines += 1
+            if not line.endswith(b"\n") or ptc_storage._parse_log_line(line) is None:
+                torn += 1
+        if hasattr(src, "close"):
+            src.close()
+    return {"lines": lines, "torn": torn}
+
+
+def _stats_total(data: Dict[str, object]) -> int:
+    return sum(int(v) for v in dict(data.get("intents", {})).values()) + int(data.get("fallback", 0))
+
+
+def check_consistency(storage: ptc_storage.StorageBackend, sent: int) -> Dict[str, object]:
+    """Schließt das Backend und vergleicht Zähler/Log mit der Anzahl gesendeter Nachrichten."""
+    writer = storage.writer
+    writer.flush()
+    in_memory = _stats_total(storage.stats_snapshot())
+    stats = getattr(storage, "stats", None)
+    closers = [writer.close] + ([stats.close] if stats is not None else [])
+    for closer in closers:
+        closer()
+        atexit.unregister(closer)
+
+    # frisch von der Platte: Snapshot + Journal bzw. SQLite-Zähler
+    on_disk = _stats_total(ptc_storage._load_global_stats() if stats is not None else storage.stats_snapshot())
+    log = _count_log_lines(storage)
+    dropped = int(writer.counters["dropped"])
+    errors = int(writer.counters["errors"])
+    result = {
+        "sent": sent,
+        "stats_in_memory": in_memory,
+        "stats_on_disk": on_disk,
+        "log_lines": log["lines"],
+        "log_torn_lines": log["torn"],
+        "log_dropped": dropped,
+        "writer_errors": errors,
+    }
+    result["ok"] = (
+        in_memory == sent and on_disk == sent and log["torn"] == 0
+        and errors == 0 and log["lines"] + dropped == sent
+    )
+    return result
+
+
+# =========================================================
+# Lauf
+# =========================================================
+def run_load_test(
+    sessions: int = LOAD_SESSIONS,
+    messages: int = LOAD_MESSAGES,
+    mode: str = "core",
+    backend: str = ptc_storage.STORAGE_BACKEND,
+    think_ms: float = LOAD_THINK_MS,
+) -> Dict[str, object]:
+    if mode == "apptest":
+        import streamlit.testing.v1  # noqa: F401  (früh scheitern statt in jedem Thread)
+    corpus = build_corpus(sessions * messages)
+    target = _apptest_session if mode == "apptest" else _core_session
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="ptc_load_")
+    limiter = get_rate_limiter()
+    limit_enabled, limiter.enabled = limiter.enabled, False  # gemessen wird die Pipeline, nicht das Limit
+    try:
+        os.chdir(workdir)
+        if backend == "sqlite":
+            storage: ptc_storage.StorageBackend = ptc_storage.SQLiteStorage(ptc_storage.SQLITE_PATH)
+        else:
+            storage = ptc_storage.JsonlStorage()
+        ptc_storage._storage = storage  # app.py holt das Backend über get_storage()
+        locks = _instrument(storage)
+
+        latencies: List[List[int]] = [[] for _ in range(sessions)]
+        reruns: List[List[int]] = [[] for _ in range(sessions)]
+        errors: List[str] = []
+        err_lock = Lock()
+        start = Barrier(sessions + 1)
+
+        def worker(i: int) -> None:
+            extra = {"reruns": reruns[i]} if mode == "apptest" else {}
+            start.wait()
+            try:
+                target(storage, corpus[i * messages:(i + 1) * messages], think_ms / 1000.0, latencies[i], **extra)
+            except Exception as e:
+                with err_lock:
+                    errors.append(f"Session {i}: {e!r}")
+
+        threads = [Thread(target=worker, args=(i,), name=f"load-session-{i}") for i in range(sessions)]
+        with _shared_script_cache() if mode == "apptest" else nullcontext():
+            for t in threads:
+                t.start()
+            start.wait()
+            t0 = time.perf_counter()
+            for t in threads:
+                t.join()
+            wall_s = time.perf_counter() - t0
+        queue_depth = storage.writer.depth()
+
+        sent = sum(len(x) for x in latencies)
+        consistency = check_consistency(storage, sent)
+    finally:
+        ptc_storage._storage = None
+        limiter.enabled = limit_enabled
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    samples = sorted(ns for per_session in latencies for ns in per_session)
+    latency = {"n": len(samples)}
+    if samples:
+        latency.update({
+            "p50_ms": round(_percentile(samples, 0.50) / 1000.0, 3),
+            "p95_ms": round(_percentile(samples, 0.95) / 1000.0, 3),
+            "p99_ms": round(_percentile(samples, 0.99) / 1000.0, 3),
+            "max_ms": round(samples[-1] / 1e6, 3),
+        })
+    report: Dict[str, object] = {
+        "meta": {
+            "mode": mode,
+            "backend": storage.name,
+            "sessions": sessions,
+            "messages_per_session": messages,
+            "think_ms": think_ms,
+        },
+        "wall_s": round(wall_s, 3),
+        "throughput_msgs_per_s": round(sent / wall_s, 1) if wall_s else 0.0,
+        "latency": latency,
+        "locks": {name: lock.report() for name, lock in locks.items()},
+        "writer": dict(storage.writer.counters, queue_depth_end=queue_depth),
+        "consistency": consistency,
+        "errors": errors,
+    }
+    rerun_samples = sorted(ns for per_session in reruns for ns in per_session)
+    if samples and rerun_samples:
+        rerun_p50 = _percentile(rerun_samples, 0.50)
+        runs = _percentile(samples, 0.50) / rerun_p50 if rerun_p50 else 0.0
+        report["apptest"] = {
+            "rerun_p50_ms": round(rerun_p50 / 1000.0, 3),
+            "runs_per_message": round(runs, 2),
+            "ok": runs <= APPTEST_MAX_RUNS_PER_MESSAGE,
+        }
+    return report
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=LOAD_SESSIONS)
+    ap.add_argument("--messages", type=int, default=LOAD_MESSAGES, help="Nachrichten pro Session")
+    ap.add_argument("--mode", choices=("core", "apptest"), default="core")
+    ap.add_argument("--backend", choices=("jsonl", "sqlite"), default=ptc_storage.STORAGE_BACKEND)
+    ap.add_argument("--think-ms", type=float, default=LOAD_THINK_MS)
+    ap.add_argument("--out", help="JSON-Bericht in diese Datei schreiben")
+    args = ap.parse_args()
+
+    report = run_load_test(args.sessions, args.messages, args.mode, args.backend, args.think_ms)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    ok = report["consistency"]["ok"] and not report["errors"] and report.get("apptest", {}).get("ok", True)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,663 @@
+"""
+PTC Online-Beratung – Auswertungen über das Fragen-Log.
+"""
+import os
+import re
+import json
+import shutil
+import mmap
+import heapq
+import struct
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import groupby
+from threading import Lock, Thread
+from typing import Optional, List, Dict, Tuple, Set, BinaryIO, Iterable, Iterator
+
+from ptc_core import IntentRouter, LRUCache, normalize
+from ptc_storage import FallbackPhrases, StorageBackend
+
+
+# =========================================================
+# TRENDS – stündliche/tägliche Rollups (inkrementell)
+# =========================================================
+ROLLUPS_FILE = "ptc_rollups.json"
+ROLLUP_KEEP_HOURS = 24 * 14
+ROLLUP_KEEP_DAYS = 400
+
+
+def _empty_bucket() -> Dict[str, object]:
+    return {"total": 0, "fallback": 0, "intents": {}, "goals": {}}
+
+
+class IntentRollups:
+    """
+    Stündliche und tägliche Zählungen (Intents, Ziele, Fallback), die nur
+    neue Log-Einträge ab dem gespeicherten Cursor verarbeiten. Ohne Datei
+    (Kaltstart) wird das vorhandene Log einmal gestreamt.
+    """
+
+    def __init__(self, path: str = ROLLUPS_FILE):
+        self.path = path
+        self.lock = Lock()
+        self.state: Dict[str, object] = {"backend": None, "cursor": {}, "hourly": {}, "daily": {}}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict) and {"cursor", "hourly", "daily"} <= set(loaded):
+                self.state = loaded
+        except Exception:
+            pass
+
+    def add(self, row: Dict[str, object]) -> None:
+        ts = str(row.get("ts", ""))
+        if len(ts) < 13:
+            return
+        intent = str(row.get("intent", ""))
+        goal = row.get("goal")
+        for key, buckets in ((ts[:13], self.state["hourly"]), (ts[:10], self.state["daily"])):
+            b = buckets.get(key)
+            if b is None:
+                b = buckets[key] = _empty_bucket()
+            b["total"] += 1
+            if intent == "fallback":
+                b["fallback"] += 1
+            else:
+                b["intents"][intent] = b["intents"].get(intent, 0) + 1
+            if goal:
+                b["goals"][goal] = b["goals"].get(goal, 0) + 1
+
+    def refresh(self, storage: StorageBackend) -> int:
+        """Verarbeitet neue Einträge und speichert den Stand; liefert deren Anzahl."""
+        with self.lock:
+            if self.state.get("backend") != storage.name:
+                self.state = {"backend": storage.name, "cursor": {}, "hourly": {}, "daily": {}}
+            n = 0
+            for row in storage.iter_since(self.state["cursor"]):
+                self.add(row)
+                n += 1
+            if n:
+                self._prune()
+                self._save()
+            return n
+
+    def _prune(self) -> None:
+        for buckets, keep in ((self.state["hourly"], ROLLUP_KEEP_HOURS), (self.state["daily"], ROLLUP_KEEP_DAYS)):
+            if len(buckets) > keep:
+                for key in sorted(buckets)[:-keep]:
+                    del buckets[key]
+
+    def _save(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def top_intents(self, days: int = 7) -> List[Tuple[str, int]]:
+        today = datetime.utcnow().date()
+        totals: Dict[str, int] = {}
+        daily = self.state["daily"]
+        for d in range(days):
+            b = daily.get((today - timedelta(days=d)).isoformat())
+            if b:
+                for name, n in b["intents"].items():
+                    totals[name] = totals.get(name, 0) + n
+        return sorted(totals.items(), key=lambda x: x[1], reverse=True)
+
+    def fallback_rate_by_hour(self, hours: int = 24) -> List[Tuple[str, int, int, float]]:
+        """(Stunde, Anfragen, Fallbacks, Quote) für die letzten `hours` Stunden, neueste zuerst."""
+        now = datetime.utcnow()
+        hourly = self.state["hourly"]
+        out = []
+        for h in range(hours):
+            key = (now - timedelta(hours=h)).strftime("%Y-%m-%dT%H")
+            b = hourly.get(key) or _empty_bucket()
+            total, fb = int(b["total"]), int(b["fallback"])
+            out.append((key, total, fb, fb / total if total else 0.0))
+        return out
+
+
+# eine Instanz pro Datei/Verzeichnis (je Mandant eigene, siehe ptc_tenants)
+_rollups: Dict[str, IntentRollups] = {}
+_rollups_lock = Lock()
+
+
+def get_rollups(path: str = ROLLUPS_FILE) -> IntentRollups:
+    rollups = _rollups.get(path)
+    if rollups is None:
+        with _rollups_lock:
+            rollups = _rollups.get(path)
+            if rollups is None:
+                rollups = _rollups[path] = IntentRollups(path)
+    return rollups
+
+
+# =========================================================
+# FALLBACK-PHRASEN – Neuaufbau aus dem Log
+# =========================================================
+def rebuild_fallback_phrases(storage: StorageBackend) -> int:
+    """
+    Baut die Heavy-Hitter (ptc_storage.FallbackPhrases) in einem Durchlauf über
+    das ganze Log neu auf und ersetzt damit den Live-Stand; liefert die Zahl der
+    gelesenen Einträge.
+    """
+    fresh = FallbackPhrases()
+    n = 0
+    for row in storage.iter_since({}):
+        n += 1
+        if row.get("intent") == "fallback":
+            fresh.observe_text(str(row.get("text", "")))
+    if storage.phrases is not None:
+        storage.phrases.replace(fresh)
+    return n
+
+
+# =========================================================
+# VOLLTEXTSUCHE – invertierter Index über das Fragen-Log
+# =========================================================
+# Wie die Rollups inkrementell ab Cursor (storage.iter_since). refresh()
+# schreibt pro SEARCH_SEGMENT_DOCS neuen Einträgen ein unveränderliches
+# Segment; Postings sind aufsteigende Doc-IDs, delta- und varint-kodiert.
+# Terme = Tokens von normalize() (wie im Routing) plus Bigramme für Phrasen;
+# Intent/Ziel stehen als Pseudo-Terme im Index.
+#
+# Segment-Datei: [Term, Postings]… | Tabelle (_SEG_ENTRY, nach Term-Bytes
+# sortiert) | Fußzeile (_SEG_FOOTER). Segmente werden per mmap gelesen und
+# per Binärsuche in der Tabelle nachgeschlagen, liegen also nie ganz im
+# Speicher. Sind es mehr als SEARCH_MAX_SEGMENTS, führt ein Hintergrund-Thread
+# jeweils die SEARCH_MERGE_FACTOR benachbarten Segmente mit den wenigsten
+# Bytes zusammen (gestreamt, Postings werden nur an den Nahtstellen neu
+# kodiert); eine Anfrage wartet nie auf das Zusammenführen.
+#
+# docs.bin (feste Datensätze) hält pro Eintrag ts, Intent, Ziel und die
+# Position im Log ("ref" aus iter_since) – die Fragetexte einer
+# Ergebnisseite liest storage.read_refs() direkt aus dem Log, auch aus
+# rotierten, komprimierten Segmenten. Der Index kopiert also keine Texte.
+SEARCH_DIR = "ptc_search"
+SEARCH_SEGMENT_DOCS = 100_000    # Einträge pro Segment beim refresh() (begrenzt den Speicher)
+SEARCH_MAX_SEGMENTS = 8          # darüber wird im Hintergrund zusammengeführt
+SEARCH_MERGE_FACTOR = 4          # so viele benachbarte Segmente pro Zusammenführung
+SEARCH_POSTINGS_CACHE = 256      # dekodierte Posting-Listen (und geprüfte Phrasen) im Speicher
+_SEARCH_FORMAT = 2
+_DOC_REC = struct.Struct("<20sHHQ")  # ts, Intent-Nr., Ziel-Nr. (0 = keins), ref im Log
+_SEG_ENTRY = struct.Struct("<QIIQ")  # Offset, Term-Länge, Postings-Länge, letzte Doc-ID
+_SEG_FOOTER = struct.Struct("<8sQQ")  # Magic, Anzahl Terme, Offset der Tabelle
+_SEG_MAGIC = b"PTCSEG01"
+_INTENT_TERM = "\x00i:"
+_GOAL_TERM = "\x00g:"
+_QUERY_PART = re.compile(r'"([^"]*)"|„([^“]*)“|(\S+)')
+
+
+def _encode_postings(doc_ids: List[int]) -> bytes:
+    out = bytearray()
+    prev = 0
+    for d in doc_ids:
+        v = d - prev
+        prev = d
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+    return bytes(out)
+
+
+def _decode_postings(buf: bytes) -> List[int]:
+    out: List[int] = []
+    doc = val = shift = 0
+    append = out.append
+    for b in buf:
+        if b < 0x80:
+            doc += val | (b << shift)
+            append(doc)
+            val = shift = 0
+        else:
+            val |= (b & 0x7F) << shift
+            shift += 7
+    return out
+
+
+def _concat_postings(parts: List[Tuple[bytes, int]]) -> Tuple[bytes, int]:
+    """
+    Hängt Posting-Listen aufeinanderfolgender Segmente aneinander: jede
+    beginnt mit ihrer absoluten ersten Doc-ID, nur die wird als Delta zur
+    letzten Doc-ID des Vorgängers neu kodiert.
+    """
+    out = bytearray(parts[0][0])
+    prev = parts[0][1]
+    for buf, last in parts[1:]:
+        first = shift = n = 0
+        while True:
+            b = buf[n]
+            n += 1
+            first |= (b & 0x7F) << shift
+            shift += 7
+            if b < 0x80:
+                break
+        out += _encode_postings([first - prev])
+        out += buf[n:]
+        prev = last
+    return bytes(out), prev
+
+
+def _intersect(small: List[int], large: List[int]) -> List[int]:
+    """Schnittmenge zweier aufsteigender Listen; sucht per bisect statt ein Set zu bauen."""
+    out: List[int] = []
+    pos, n = 0, len(large)
+    for d in small:
+        pos = bisect_left(large, d, pos)
+        if pos == n:
+            break
+        if large[pos] == d:
+            out.append(d)
+    return out
+
+
+def _doc_terms(tokens: List[str]) -> Set[str]:
+    terms = set(tokens)
+    terms.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return terms
+
+
+def _write_segment_file(path: str, items: Iterable[Tuple[bytes, bytes, int]]) -> None:
+    """Schreibt (Term, Postings, letzte Doc-ID) – aufsteigend nach Term – gestreamt als Segment."""
+    table = bytearray()
+    off = n = 0
+    with open(path + ".tmp", "wb") as f:
+        for term, postings, last in items:
+            f.write(term)
+            f.write(postings)
+            table += _SEG_ENTRY.pack(off, len(term), len(postings), last)
+            off += len(term) + len(postings)
+            n += 1
+        f.write(table)
+        f.write(_SEG_FOOTER.pack(_SEG_MAGIC, n, off))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class _SearchSegment:
+    """Ein Segment per mmap; Terme werden per Binärsuche in der Tabelle gefunden."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n, self.table = _SEG_FOOTER.unpack_from(self.mm, len(self.mm) - _SEG_FOOTER.size)
+        if magic != _SEG_MAGIC:
+            self.mm.close()
+            raise ValueError(f"{path}: kein Suchindex-Segment")
+
+    def _entry(self, i: int) -> Tuple[int, int, int, int]:
+        return _SEG_ENTRY.unpack_from(self.mm, self.table + i * _SEG_ENTRY.size)
+
+    def postings(self, term: bytes) -> bytes:
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off, tlen, plen, _ = self._entry(mid)
+            key = self.mm[off:off + tlen]
+            if key < term:
+                lo = mid + 1
+            elif key > term:
+                hi = mid
+            else:
+                return self.mm[off + tlen:off + tlen + plen]
+        return b""
+
+    def __iter__(self) -> Iterator[Tuple[bytes, bytes, int]]:
+        for i in range(self.n):
+            off, tlen, plen, last = self._entry(i)
+            yield self.mm[off:off + tlen], self.mm[off + tlen:off + tlen + plen], last
+
+    @property
+    def size(self) -> int:
+        return len(self.mm)
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+class LogSearchIndex:
+    """Persistenter, inkrementeller Volltextindex (siehe oben); `search()` liefert Seiten, neueste zuerst."""
+
+    def __init__(self, path: str = SEARCH_DIR):
+        self.path = path
+        self.lock = Lock()
+        self.meta: Dict[str, object] = self._empty_meta(None)
+        self._segments: List[_SearchSegment] = []
+        self._postings = LRUCache(SEARCH_POSTINGS_CACHE)
+        self._merger: Optional[Thread] = None
+        self.merge_errors = 0
+        segments: List[_SearchSegment] = []
+        try:
+            with open(self._file("meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format") != _SEARCH_FORMAT:
+                raise ValueError("altes Format")
+            for name in meta["segments"]:
+                segments.append(_SearchSegment(self._file(name)))
+            self.meta, self._segments = meta, segments
+        except Exception:
+            for seg in segments:
+                seg.close()
+            return  # fehlt, veraltet oder kaputt -> beim nächsten refresh() neu aufbauen
+        # Reste eines abgebrochenen refresh() bzw. einer abgebrochenen Zusammenführung
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp") or (name.startswith("seg_") and name not in meta["segments"]):
+                try:
+                    os.remove(self._file(name))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _empty_meta(backend: Optional[str]) -> Dict[str, object]:
+        return {"format": _SEARCH_FORMAT, "backend": backend, "cursor": {}, "docs": 0, "seq": 0,
+                "segments": [], "intents": [""], "goals": [""]}
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _save_meta(self) -> None:
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self._file("meta.json"))
+
+    def _next_name(self) -> str:
+        self.meta["seq"] = int(self.meta["seq"]) + 1
+        return f"seg_{self.meta['seq']:06d}.seg"
+
+    def _flush(self, batch: Dict[str, List[int]]) -> str:
+        name = self._next_name()
+        items = sorted((t.encode("utf-8"), ids) for t, ids in batch.items())
+        _write_segment_file(self._file(name), ((t, _encode_postings(ids), ids[-1]) for t, ids in items))
+        batch.clear()
+        return name
+
+    def _code(self, table: str, value: Optional[str]) -> int:
+        names: List[str] = self.meta[table]
+        if not value:
+            return 0
+        try:
+            return names.index(value)
+        except ValueError:
+            names.append(value)
+            return len(names) - 1
+
+    def refresh(self, storage: StorageBackend) -> int:
+        """
+        Indexiert neue Log-Einträge (ein Segment pro SEARCH_SEGMENT_DOCS);
+        liefert deren Anzahl. Zu viele Segmente werden danach im Hintergrund
+        zusammengeführt.
+        """
+        with self.lock:
+            if self.meta.get("backend") != storage.name:
+                self._reset(storage.name)
+            os.makedirs(self.path, exist_ok=True)
+            cursor = dict(self.meta["cursor"])
+            first = doc = int(self.meta["docs"])
+            batch: Dict[str, List[int]] = {}
+            written: List[str] = []
+            try:
+                with open(self._file("docs.bin"), "ab") as fd:
+                    fd.truncate(first * _DOC_REC.size)  # Reste eines abgebrochenen refresh()
+                    for row in storage.iter_since(cursor):
+                        text = str(row.get("text", ""))
+                        intent, goal = str(row.get("intent", "")), row.get("goal")
+                        fd.write(_DOC_REC.pack(
+                            str(row.get("ts", "")).encode("ascii", "replace")[:20],
+                            self._code("intents", intent), self._code("goals", goal), int(row["ref"]),
+                        ))
+                        terms = _doc_terms(IntentRouter.tokenize(normalize(text)))
+                        terms.add(_INTENT_TERM + intent)
+                        if goal:
+                            terms.add(_GOAL_TERM + str(goal))
+                        for t in terms:
+                            ids = batch.get(t)
+                            if ids is None:
+                                batch[t] = [doc]
+                            else:
+                                ids.append(doc)
+                        doc += 1
+                        if (doc - first) % SEARCH_SEGMENT_DOCS == 0:
+                            written.append(self._flush(batch))
+                    if doc == first:
+                        return 0
+                    if batch:
+                        written.append(self._flush(batch))
+                    fd.flush()
+                    os.fsync(fd.fileno())
+                segments = [_SearchSegment(self._file(name)) for name in written]
+            except BaseException:
+                for name in written:  # noch nicht im Manifest
+                    try:
+                        os.remove(self._file(name))
+                    except OSError:
+                        pass
+                raise
+
+            self.meta["segments"].extend(written)
+            self._segments.extend(segments)
+            self.meta.update(cursor=cursor, docs=doc)
+            self._save_meta()
+            self._postings.clear()
+            if len(self._segments) > SEARCH_MAX_SEGMENTS and (self._merger is None or not self._merger.is_alive()):
+                self._merger = Thread(target=self._merge_loop, name="ptc-search-merge", daemon=True)
+                self._merger.start()
+            return doc - first
+
+    def _reset(self, backend: Optional[str]) -> None:
+        for seg in self._segments:
+            seg.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.meta, self._segments = self._empty_meta(backend), []
+        self._postings.clear()
+
+    # ---- Zusammenführen (Hintergrund) ---------------------------------
+    def _merge_loop(self) -> None:
+        try:
+            while self._merge_step():
+                pass
+        except Exception:
+            self.merge_errors += 1  # nächster Versuch nach dem nächsten refresh(); der Index bleibt gültig
+
+    def _merge_step(self) -> bool:
+        """Führt die SEARCH_MERGE_FACTOR benachbarten Segmente mit den wenigsten Bytes zusammen."""
+        with self.lock:
+            if len(self._segments) <= SEARCH_MAX_SEGMENTS:
+                return False
+            k = min(SEARCH_MERGE_FACTOR, len(self._segments))
+            sizes = [seg.size for seg in self._segments]
+            start = min(range(len(sizes) - k + 1), key=lambda i: sum(sizes[i:i + k]))
+            window = self._segments[start:start + k]
+            names = self.meta["segments"][start:start + k]
+            name = self._next_name()
+
+        # ohne Lock: Segmente sind unveränderlich, refresh() hängt nur hinten an
+        def entries(i: int, seg: _SearchSegment) -> Iterator[Tuple[bytes, int, bytes, int]]:
+            for term, buf, last in seg:
+                yield term, i, buf, last  # i: bei gleichem Term in Segment- (= Doc-)Reihenfolge
+
+        def merged() -> Iterator[Tuple[bytes, bytes, int]]:
+            streams = [entries(i, seg) for i, seg in enumerate(window)]
+            for term, group in groupby(heapq.merge(*streams), key=lambda e: e[0]):
+                buf, last = _concat_postings([(e[2], e[3]) for e in group])
+                yield term, buf, last
+
+        _write_segment_file(self._file(name), merged())
+        segment = _SearchSegment(self._file(name))
+
+        with self.lock:
+            current = self.meta["segments"]
+            if current[start:start + k] != names:  # inzwischen zurückgesetzt
+                segment.close()
+                os.remove(self._file(name))
+                return False
+            current[start:start + k] = [name]
+            self._segments[start:start + k] = [segment]
+            self._save_meta()
+            for seg, old in zip(window, names):
+                seg.close()
+                try:
+                    os.remove(self._file(old))
+                except OSError:
+                    pass
+        return True
+
+    def wait_merged(self, timeout: Optional[float] = None) -> None:
+        """Wartet auf eine laufende Zusammenführung (Skripte, Benchmarks)."""
+        merger = self._merger
+        if merger is not None:
+            merger.join(timeout)
+
+    # ---- Abfragen ------------------------------------------------------
+    def _doc_ids(self, term: str) -> List[int]:
+        ids = self._postings.get(term)
+        if ids is None:
+            ids = []
+            key = term.encode("utf-8")
+            for seg in self._segments:  # Segmente liegen in Doc-Reihenfolge vor, jedes beginnt absolut
+                buf = seg.postings(key)
+                if buf:
+                    ids.extend(_decode_postings(buf))
+            self._postings.put(term, ids)
+        return ids
+
+    def _read_doc(self, fd: BinaryIO, doc: int) -> Tuple[str, int, int, int]:
+        fd.seek(doc * _DOC_REC.size)
+        ts, intent, goal, ref = _DOC_REC.unpack(fd.read(_DOC_REC.size))
+        return ts.rstrip(b"\x00").decode("ascii", "replace"), intent, goal, ref
+
+    def _doc_range(self, fd: BinaryIO, ts_from: Optional[str], ts_to: Optional[str]) -> Tuple[int, int]:
+        """[lo, hi) der Docs mit ts_from <= ts <= ts_to (Log ist nach ts aufsteigend)."""
+        n = int(self.meta["docs"])
+
+        def bisect(key: str, right: bool) -> int:
+            lo, hi = 0, n
+            while lo < hi:
+                mid = (lo + hi) // 2
+                ts = self._read_doc(fd, mid)[0]
+                if ts < key or (right and ts.startswith(key)):
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+        return (bisect(ts_from, False) if ts_from else 0), (bisect(ts_to, True) if ts_to else n)
+
+    def _texts(self, storage: StorageBackend, fd: BinaryIO, docs: List[int]) -> List[str]:
+        """Fragetexte der Docs, gesammelt aus dem Log gelesen."""
+        rows = storage.read_refs([self._read_doc(fd, d)[3] for d in docs])
+        return [str(row.get("text", "")) if row else "" for row in rows]
+
+    def _phrase_ids(self, storage: StorageBackend, tokens: List[str], fd: BinaryIO) -> List[int]:
+        """Docs mit der Phrase: Bigramme grenzen ein, geprüft wird am normalisierten Text."""
+        key = "\x00p:" + " ".join(tokens)
+        ids = self._postings.get(key)
+        if ids is None:
+            lists = sorted((self._doc_ids(f"{a} {b}") for a, b in zip(tokens, tokens[1:])), key=len)
+            ids = lists[0]
+            for other in lists[1:]:
+                ids = _intersect(ids, other)
+            needle = f" {' '.join(tokens)} "
+            texts = self._texts(storage, fd, ids)
+            ids = [d for d, text in zip(ids, texts) if needle in f" {' '.join(IntentRouter.tokenize(normalize(text)))} "]
+            self._postings.put(key, ids)
+        return ids
+
+    def intent_counts(self, storage: StorageBackend, phrase: str, limit: int = 5) -> List[Tuple[str, int]]:
+        """Wie oft `phrase` in erkannten Fragen vorkommt, pro Intent (häufigste zuerst)."""
+        tokens = IntentRouter.tokenize(normalize(phrase))
+        if not tokens:
+            return []
+        with self.lock:
+            if not self.meta["docs"]:
+                return []
+            if len(tokens) <= 2:
+                ids = self._doc_ids(" ".join(tokens))
+            else:
+                with open(self._file("docs.bin"), "rb") as fd:
+                    ids = self._phrase_ids(storage, tokens, fd)
+            counts = []
+            for name in self.meta["intents"][1:]:
+                if name == "fallback":
+                    continue
+                other = self._doc_ids(_INTENT_TERM + name)
+                n = len(_intersect(ids, other) if len(ids) <= len(other) else _intersect(other, ids))
+                if n:
+                    counts.append((name, n))
+        counts.sort(key=lambda kv: -kv[1])
+        return counts[:limit]
+
+    def search(
+        self,
+        storage: StorageBackend,
+        query: str,
+        intent: Optional[str] = None,
+        goal: Optional[str] = None,
+        ts_from: Optional[str] = None,
+        ts_to: Optional[str] = None,
+        page: int = 0,
+        size: int = 50,
+    ) -> Tuple[int, List[Dict[str, object]]]:
+        """
+        Wörter werden UND-verknüpft, "Phrase" bzw. „Phrase“ muss zusammenhängend
+        vorkommen. Liefert (Trefferzahl, Einträge der Seite – neueste zuerst);
+        die Texte kommen aus `storage` (dasselbe wie bei refresh()).
+        """
+        terms: List[str] = []
+        phrases: List[List[str]] = []
+        for m in _QUERY_PART.finditer(query):
+            tokens = IntentRouter.tokenize(normalize(next(g for g in m.groups() if g is not None)))
+            if m.group(3) is not None or len(tokens) == 1:
+                terms.extend(tokens)
+            elif len(tokens) == 2:
+                terms.append(" ".join(tokens))
+            elif tokens:
+                phrases.append(tokens)
+        if intent:
+            terms.append(_INTENT_TERM + intent)
+        if goal:
+            terms.append(_GOAL_TERM + goal)
+
+        with self.lock:
+            if not self.meta["docs"]:
+                return 0, []
+            with open(self._file("docs.bin"), "rb") as fd:
+                lo, hi = self._doc_range(fd, ts_from, ts_to)
+                lists = [self._doc_ids(t) for t in terms] + [self._phrase_ids(storage, p, fd) for p in phrases]
+                if lists:
+                    lists.sort(key=len)
+                    hits = lists[0][bisect_left(lists[0], lo):bisect_left(lists[0], hi)]
+                    for ids in lists[1:]:
+                        hits = _intersect(hits, ids)
+                    total = len(hits)
+                    page_ids = hits[::-1][page * size:(page + 1) * size]
+                else:
+                    total = hi - lo
+                    page_ids = list(range(hi - 1 - page * size, max(hi - 1 - (page + 1) * size, lo - 1), -1))
+
+                rows = []
+                intents, goals = self.meta["intents"], self.meta["goals"]
+                for doc, text in zip(page_ids, self._texts(storage, fd, page_ids)):
+                    ts, i, g, _ = self._read_doc(fd, doc)
+                    rows.append({"ts": ts, "intent": intents[i], "goal": goals[g] or None, "text": text})
+                return total, rows
+
+    @property
+    def docs(self) -> int:
+        return int(self.meta["docs"])
+
+
+_search_indexes: Dict[str, LogSearchIndex] = {}
+
+
+def get_search_index(path: str = SEARCH_DIR) -> LogSearchIndex:
+    index = _search_indexes.get(path)
+    if index is None:
+        with _rollups_lock:
+            index = _search_indexes.get(path)
+            if index is None:
+                index = _search_indexes[path] = LogSearchIndex(path)
+    return index
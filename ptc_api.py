@@ -0,0 +1,443 @@
+"""
+PTC Online-Beratung – JSON-API ohne Streamlit (asyncio, nur Standardbibliothek).
+
+    POST /ask      {"session": "abc", "text": "Was kostet das?"}
+                -> {"session": "abc", "studio": "", "intent": "preise_kosten", "goal": null, "answer": "..."}
+    GET  /health   Sessions, Queue-Tiefe, Version der Wissensbasis, Mandanten-Cache
+    GET  /metrics  Latenz-Histogramme (Prometheus-Textformat)
+
+Ohne "session" wird eine neue Session-ID vergeben und zurückgegeben. Das
+gemerkte Ziel liegt pro Session in einem TTL-Speicher im Prozess. Das Studio
+(Mandant, siehe ptc_tenants) kommt aus "studio" im Body, ?studio=<id> oder
+dem Host-Header; unbekannte Studios -> 404. Über dem Rate-Limit (pro Session
+und pro Client-IP, siehe ptc_core; --no-rate-limit schaltet es ab) antwortet
+/ask mit 429 und einem festen Text.
+Kommt die Verbindung von einem Proxy (Loopback oder --trusted-proxy), gilt die
+Client-IP aus X-Forwarded-For (die hinterste, die kein vertrauenswürdiger
+Proxy ist); ohne den Header zählt nur die Session. Anderen Gegenübern wird der
+Header nicht geglaubt. Die Buckets gelten pro Worker-Prozess. Zähler,
+Fragen-Log und Fallback-Phrasen gehen über eine Queue an einen Thread – der
+Event-Loop wartet nie auf Storage-Locks oder die Platte.
+
+Mit --workers N teilen sich N Prozesse einen Listen-Socket (Pre-Fork). Jeder
+Prozess hat seinen eigenen Session-Speicher: eine Session muss auf einer
+Keep-Alive-Verbindung bleiben oder vom Proxy sticky geroutet werden. Mehrere
+Prozesse brauchen das SQLite-Backend.
+
+    python ptc_api.py [--port 8765] [--workers 4 --backend sqlite] [--trusted-proxy 10.0.0.0/8]
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import multiprocessing
+import signal
+import socket
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from queue import SimpleQueue
+from threading import Thread
+from typing import Optional, List, Dict, Tuple, Union
+from urllib.parse import parse_qs
+
+import ptc_storage
+from ptc_core import (
+    RATE_LIMITED_INTENT,
+    ChatSession,
+    KnowledgeError,
+    get_knowledge,
+    get_rate_limiter,
+    handle_message,
+    start_knowledge_watcher,
+)
+from ptc_metrics import render_prometheus
+from ptc_tenants import TENANT_PARAM, TenantError, get_tenants
+
+
+# =========================================================
+# KONFIG
+# =========================================================
+API_HOST = "127.0.0.1"
+API_PORT = 8765
+API_SESSION_TTL = 30 * 60        # Sekunden ohne Nachricht, danach ist das Ziel vergessen
+API_MAX_SESSIONS = 50_000        # darüber fallen die am längsten inaktiven heraus
+API_MAX_BODY = 16 * 1024         # Bytes pro Anfrage
+API_MAX_TEXT = 2000              # Zeichen pro Frage
+API_MAX_SESSION_ID = 128
+API_KEEPALIVE_TIMEOUT = 30.0     # Sekunden Leerlauf bzw. für einen Body, bis die Verbindung geschlossen wird
+API_CLIENT_IP_HEADER = "x-forwarded-for"
+API_TRUSTED_PROXIES: Tuple[str, ...] = ()  # Netze der Reverse-Proxys; Loopback gilt immer als Proxy
+
+
+# =========================================================
+# Sessions (TTL, nur im Event-Loop benutzt -> ohne Lock)
+# =========================================================
+class SessionStore:
+    """Sessions in Reihenfolge der letzten Nutzung; abgelaufene fallen vorne heraus."""
+
+    def __init__(self, ttl: float = API_SESSION_TTL, max_sessions: int = API_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._items: "OrderedDict[str, Tuple[float, ChatSession]]" = OrderedDict()
+        self.expired = 0
+
+    def get(self, sid: str) -> ChatSession:
+        now = time.monotonic()
+        items = self._items
+        # vorne liegen die am längsten ungenutzten Sessions
+        while items:
+            seen, _ = next(iter(items.values()))
+            if now - seen < self.ttl:
+                break
+            items.popitem(last=False)
+            self.expired += 1
+        item = items.pop(sid, None)
+        session = item[1] if item is not None else ChatSession()
+        items[sid] = (now, session)
+        if len(items) > self.max_sessions:
+            items.popitem(last=False)
+            self.expired += 1
+        return session
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# =========================================================
+# Stats/Log außerhalb des Event-Loops
+# =========================================================
+class _StorageSink:
+    """Reiht Aufrufe für ein Storage-Backend in eine (geteilte) Queue ein."""
+
+    def __init__(self, storage: ptc_storage.StorageBackend, queue: SimpleQueue):
+        self.storage = storage
+        self.queue = queue
+
+    def inc_intent(self, name: str) -> None:
+        self.queue.put((self.storage.inc_intent, (name,)))
+
+    def inc_fallback(self) -> None:
+        self.queue.put((self.storage.inc_fallback, ()))
+
+    def log_question(self, raw_text: str, intent: str, goal: Optional[str]) -> None:
+        self.queue.put((self.storage.log_question, (raw_text, intent, goal)))
+
+
+class QueueSink(_StorageSink):
+    """StatsSink für den Event-Loop: reiht nur ein, ein Thread ruft das Storage-Backend auf."""
+
+    def __init__(self, storage: ptc_storage.StorageBackend):
+        super().__init__(storage, SimpleQueue())
+        self.errors = 0
+        self._tenants: Dict[str, _StorageSink] = {}
+        self._thread = Thread(target=self._run, name="ptc-api-sink", daemon=True)
+        self._thread.start()
+
+    def for_storage(self, tid: str, storage: ptc_storage.StorageBackend) -> _StorageSink:
+        """Sink eines Mandanten – dieselbe Queue und derselbe Thread, anderes Storage."""
+        if storage is self.storage:
+            return self
+        sink = self._tenants.get(tid)
+        if sink is None or sink.storage is not storage:
+            sink = self._tenants[tid] = _StorageSink(storage, self.queue)
+        return sink
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            fn, args = item
+            try:
+                fn(*args)
+            except Exception:
+                self.errors += 1
+
+    def close(self) -> None:
+        """Arbeitet die Queue ab und beendet den Thread."""
+        self.queue.put(None)
+        self._thread.join()
+
+
+# =========================================================
+# HTTP
+# =========================================================
+_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+}
+
+
+def _response(status: int, body: bytes, content_type: str, keep_alive: bool) -> bytes:
+    return (
+        f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    ).encode("latin-1") + body
+
+
+def _json(status: int, payload: Dict[str, object], keep_alive: bool) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _response(status, body, "application/json; charset=utf-8", keep_alive)
+
+
+def _client_ip(
+    peer: object, forwarded: Optional[str], trusted: List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]
+) -> Optional[str]:
+    """
+    IP für das Rate-Limit: die des Gegenübers, hinter einem vertrauenswürdigen
+    Proxy die hinterste nicht vertrauenswürdige aus `forwarded`
+    (X-Forwarded-For). None, wenn keine bekannt ist (z. B. lokal ohne Proxy).
+    """
+    if not isinstance(peer, tuple) or not peer:
+        return None
+    hops = [str(peer[0])] + [h.strip() for h in reversed((forwarded or "").split(",")) if h.strip()]
+    for hop in hops:
+        try:
+            addr = ipaddress.ip_address(hop)
+        except ValueError:
+            return None
+        if not (addr.is_loopback or any(addr in net for net in trusted)):
+            return str(addr)
+    return None
+
+
+class ApiServer:
+    """Verbindungs-Handler für asyncio.start_server (HTTP/1.1 mit Keep-Alive)."""
+
+    def __init__(
+        self, sink: QueueSink, sessions: Optional[SessionStore] = None, trusted_proxies: Tuple[str, ...] = ()
+    ):
+        self.sink = sink
+        self.sessions = sessions if sessions is not None else SessionStore()
+        self.trusted = [ipaddress.ip_network(n, strict=False) for n in trusted_proxies]
+        self.requests = 0
+        self._connections: Dict[asyncio.StreamWriter, "asyncio.Task"] = {}
+
+    async def ask(
+        self, body: bytes, client: Optional[str] = None, studio: Optional[str] = None, host: Optional[str] = None
+    ) -> Tuple[int, Dict[str, object]]:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return 400, {"error": "Body ist kein gültiges JSON"}
+        if not isinstance(data, dict):
+            return 400, {"error": "JSON-Objekt erwartet"}
+        text = data.get("text")
+        if not isinstance(text, str) or not text.strip():
+            return 400, {"error": "\"text\" fehlt"}
+        if len(text) > API_MAX_TEXT:
+            return 400, {"error": f"\"text\" ist länger als {API_MAX_TEXT} Zeichen"}
+        sid = data.get("session") or uuid.uuid4().hex
+        if not isinstance(sid, str) or len(sid) > API_MAX_SESSION_ID:
+            return 400, {"error": "ungültige \"session\""}
+        studio = data.get(TENANT_PARAM) or studio
+        if studio is not None and not isinstance(studio, str):
+            return 400, {"error": f"ungültiges \"{TENANT_PARAM}\""}
+
+        tenants = get_tenants()
+        try:
+            tid = tenants.resolve(studio, host)
+            kb = tenants.knowledge(tid)
+        except TenantError:
+            return 404, {"error": "unbekanntes Studio"}
+        except KnowledgeError as e:
+            return 500, {"error": f"Konfiguration des Studios ungültig: {e}"}
+        storage = tenants.opened_storage(tid)
+        if storage is None:  # erster Zugriff: SQLite öffnen, Writer starten, evtl. ein altes schließen
+            storage = await asyncio.get_running_loop().run_in_executor(None, tenants.storage, tid)
+        sink = self.sink.for_storage(tid, storage)
+        session = self.sessions.get(f"{tid}/{sid}" if tid else sid)  # Sessions pro Studio getrennt
+        reply = handle_message(text, session, sink, client, kb)
+        status = 429 if reply.intent == RATE_LIMITED_INTENT else 200
+        return status, {"session": sid, "studio": tid, "intent": reply.intent, "goal": reply.goal, "answer": reply.text}
+
+    async def route(
+        self,
+        method: str,
+        path: str,
+        body: bytes,
+        keep_alive: bool,
+        client: Optional[str] = None,
+        host: Optional[str] = None,
+    ) -> bytes:
+        path, _, query = path.partition("?")
+        if path == "/ask":
+            if method != "POST":
+                return _json(405, {"error": "nur POST"}, keep_alive)
+            studio = parse_qs(query).get(TENANT_PARAM, [None])[0] if query else None
+            status, payload = await self.ask(body, client, studio, host)
+            return _json(status, payload, keep_alive)
+        if path == "/health":
+            return _json(200, {
+                "ok": True,
+                "sessions": len(self.sessions),
+                "requests": self.requests,
+                "sink_queue": self.sink.depth(),
+                "sink_errors": self.sink.errors,
+                "knowledge": get_knowledge().version,
+                "rate_limit": get_rate_limiter().stats(top=0),
+                "tenants": get_tenants().stats(),
+            }, keep_alive)
+        if path == "/metrics":
+            body = render_prometheus().encode("utf-8")
+            return _response(200, body, "text/plain; version=0.0.4; charset=utf-8", keep_alive)
+        return _json(404, {"error": "unbekannter Pfad"}, keep_alive)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections[writer] = asyncio.current_task()
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), API_KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, path, version = lines[0].split(" ", 2)
+                except ValueError:
+                    writer.write(_json(400, {"error": "ungültige Anfragezeile"}, False))
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > API_MAX_BODY:
+                    writer.write(_json(413 if length > 0 else 400, {"error": "ungültige Content-Length"}, False))
+                    break
+                try:
+                    body = await asyncio.wait_for(reader.readexactly(length), API_KEEPALIVE_TIMEOUT) if length else b""
+                except asyncio.TimeoutError:
+                    break
+
+                self.requests += 1
+                client = _client_ip(peer, headers.get(API_CLIENT_IP_HEADER), self.trusted)
+                try:
+                    response = await self.route(method, path, body, keep_alive, client, headers.get("host"))
+                except Exception:
+                    response = _json(500, {"error": "interner Fehler"}, keep_alive)
+                writer.write(response)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def close_connections(self) -> None:
+        """Schließt offene Keep-Alive-Verbindungen; laufende Antworten werden noch fertig."""
+        tasks = list(self._connections.values())
+        for writer in list(self._connections):
+            writer.transport.close()  # Leser sieht EOF -> Handler endet regulär
+        if tasks:
+            await asyncio.wait(tasks, timeout=5.0)
+
+
+# =========================================================
+# Start
+# =========================================================
+async def _serve(sock: socket.socket, trusted_proxies: Tuple[str, ...] = API_TRUSTED_PROXIES) -> None:
+    storage = ptc_storage.get_storage()
+    sink = QueueSink(storage)
+    app = ApiServer(sink, trusted_proxies=trusted_proxies)
+    server = await asyncio.start_server(app.handle, sock=sock)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    async with server:
+        await stop.wait()
+        server.close()
+        await app.close_connections()
+    sink.close()
+    for tenant_storage in get_tenants().storages():
+        ptc_storage.close_storage(tenant_storage)
+    ptc_storage.close_storage(storage)
+
+
+def _worker(sock: socket.socket, backend: str, trusted_proxies: Tuple[str, ...]) -> None:
+    ptc_storage.STORAGE_BACKEND = backend
+    start_knowledge_watcher()
+    asyncio.run(_serve(sock, trusted_proxies))
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+def serve(
+    host: str = API_HOST,
+    port: int = API_PORT,
+    workers: int = 1,
+    backend: str = ptc_storage.STORAGE_BACKEND,
+    trusted_proxies: Tuple[str, ...] = API_TRUSTED_PROXIES,
+) -> None:
+    sock = _listen(host, port)
+    print(f"PTC-API auf http://{host}:{sock.getsockname()[1]} ({workers} Worker, Backend {backend})", flush=True)
+    if workers <= 1:
+        _worker(sock, backend, trusted_proxies)
+        return
+
+    # Pre-Fork: Wissensbasis ist schon geladen, Storage entsteht erst im Worker
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_worker, args=(sock, backend, trusted_proxies), name=f"ptc-api-{i}") for i in range(workers)]
+    for p in procs:
+        p.start()
+
+    def stop(*_args) -> None:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()  # SIGTERM -> Worker leert Queue und schließt das Storage
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for p in procs:
+        p.join()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default=API_HOST)
+    ap.add_argument("--port", type=int, default=API_PORT)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--backend", choices=("jsonl", "sqlite"), default=ptc_storage.STORAGE_BACKEND)
+    ap.add_argument("--no-rate-limit", action="store_true", help="Rate-Limit abschalten (z. B. für Lasttests)")
+    ap.add_argument("--trusted-proxy", action="append", default=list(API_TRUSTED_PROXIES), metavar="NETZ",
+                    help="Reverse-Proxy, dessen X-Forwarded-For gilt (IP oder CIDR, mehrfach möglich)")
+    args = ap.parse_args()
+    for net in args.trusted_proxy:
+        try:
+            ipaddress.ip_network(net, strict=False)
+        except ValueError:
+            ap.error(f"--trusted-proxy: ungültiges Netz {net!r}")
+    if args.workers > 1 and args.backend != "sqlite":
+        ap.error("mehrere Worker schreiben in dieselben Dateien -> --backend sqlite verwenden")
+    if args.no_rate_limit:
+        get_rate_limiter().enabled = False
+    serve(args.host, args.port, args.workers, args.backend, tuple(args.trusted_proxy))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1338 @@
+"""
+PTC Online-Beratung – Routing-Kern ohne Streamlit.
+
+Normalisierung, Ziel-Erkennung, Intent-Routing und Antworten. Der Zustand
+eines Gesprächs steckt in `ChatSession`; Zähler/Logging laufen über einen
+optionalen `sink` (z. B. ptc_storage.get_storage()). Die Streamlit-Oberfläche
+(app.py) ist nur ein Adapter darauf.
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import weakref
+import unicodedata
+from collections import OrderedDict, deque
+from itertools import islice
+from threading import Lock, Thread
+from typing import Optional, List, Dict, Tuple, NamedTuple, Protocol, Deque
+
+from ptc_metrics import Histogram, histogram, stage
+
+
+# =========================================================
+# PTC – STAMMDATEN
+# =========================================================
+# Die Stammdaten, GOAL_PATTERNS und INTENTS stehen in KNOWLEDGE_FILE und werden
+# beim Import geladen bzw. zur Laufzeit neu geladen (siehe WISSENSBASIS). Die
+# Globals spiegeln das Basis-Studio; Handler bekommen ihre Daten als Argument.
+STUDIO: Dict[str, str] = {}
+PROBETRAINING: Dict[str, str] = {}
+COURSE_PLAN: Dict[str, List[Tuple[str, str]]] = {}
+FEATURES: List[str] = []
+
+
+# =========================================================
+# Helfer: Textbausteine
+# =========================================================
+def cta_short(studio: Dict[str, str]) -> str:
+    return f"📞 Telefon: {studio['phone_display']} ({studio['phone_tel']})"
+
+
+def cta_full(studio: Dict[str, str]) -> str:
+    return (
+        f"📞 Telefon: {studio['phone_display']} ({studio['phone_tel']})\n"
+        f"📍 Adresse: {studio['address']}\n"
+        f"🕒 Öffnungszeiten:\n{studio['opening_hours']}\n"
+        f"🚗 Parken: {studio['parking']}"
+    )
+
+
+def probetraining_block(probetraining: Dict[str, str]) -> str:
+    return (
+        "Kostenloses Probetraining:\n"
+        f"• Dauer: {probetraining['duration']}\n"
+        f"• Betreuung: {probetraining['included']}\n"
+        f"• Inhalt: {probetraining['options']}\n"
+        f"• Kosten: {probetraining['price']}"
+    )
+
+
+def course_plan_text(course_plan: Dict[str, List[Tuple[str, str]]]) -> str:
+    lines = []
+    for day, items in course_plan.items():
+        for time, title in items:
+            lines.append(f"• {day}: {time} {title}")
+    return "\n".join(lines)
+
+
+# =========================================================
+# Normalisierung & Matching
+# =========================================================
+def normalize_full(text: str) -> str:
+    """Referenz-Implementierung (voller Unicode-Pfad)."""
+    text = text.strip().lower()
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s€]", " ", text)  # € behalten
+    text = re.sub(r"\s+", " ", text)
+    return text
+
+
+def _normalize_char(ch: str) -> str:
+    # normalize_full für ein einzelnes Zeichen, ohne strip(); Whitespace -> " "
+    # (\w entspricht isalnum() oder "_", \s entspricht isspace())
+    text = unicodedata.normalize("NFKD", ch.lower())
+    return "".join(
+        c if c.isalnum() or c in "_€" else " "
+        for c in text
+        if not unicodedata.combining(c)
+    )
+
+
+# Schnellpfad: ASCII, Latin-1/Latin Extended (Umlaute, ß, Akzente),
+# typografische Satzzeichen/Anführungszeichen und € werden pro Zeichen über
+# eine vorab aus normalize_full berechnete Tabelle übersetzt. Zeichen, deren
+# Kleinschreibung kontextabhängig ist (Σ) oder die nicht in der Tabelle stehen
+# (z. B. lose Kombinationszeichen), führen zum vollen Unicode-Pfad.
+_FAST_CHARS = frozenset(
+    [chr(c) for c in range(0x250)] + [chr(c) for c in range(0x2000, 0x2070)] + ["\u1e9e", "€"]
+)
+_FAST_TABLE = {ord(ch): _normalize_char(ch) for ch in _FAST_CHARS}
+_MULTI_SPACE = re.compile(" {2,}")
+
+
+def normalize(text: str) -> str:
+    text = text.strip()
+    if not text.isascii() and not _FAST_CHARS.issuperset(text):
+        return normalize_full(text)
+    text = text.translate(_FAST_TABLE)
+    if "  " in text:
+        text = _MULTI_SPACE.sub(" ", text)
+    return text
+
+
+# Ein Pattern wird – wenn möglich – in eine endliche Menge von Literalen
+# expandiert (z. B. r"\bkurse?\b" -> {"kurs", "kurse"}). Unterstützt wird nur
+# die Teilmenge, die in INTENTS/GOAL_PATTERNS vorkommt: Literale, Gruppen mit
+# "|", optionale Atome ("?") und einfache Zeichenklassen. Alles andere bleibt
+# ein normaler (vorkompilierter) Regex.
+_EXPAND_LIMIT = 64
+_REGEX_META = set(".^$*+{}\\")
+
+
+def _expand_pattern(p: str) -> Optional[List[str]]:
+    pos = 0
+
+    def parse_alt() -> Optional[List[str]]:
+        nonlocal pos
+        branches: List[str] = []
+        while True:
+            seq = parse_seq()
+            if seq is None:
+                return None
+            branches += seq
+            if pos < len(p) and p[pos] == "|":
+                pos += 1
+                continue
+            return branches
+
+    def parse_seq() -> Optional[List[str]]:
+        nonlocal pos
+        out = [""]
+        while pos < len(p) and p[pos] not in "|)":
+            ch = p[pos]
+            if ch == "(":
+                pos += 3 if p.startswith("?:", pos + 1) else 1
+                if pos < len(p) and p[pos] == "?":
+                    return None  # Lookarounds, benannte Gruppen, Flags
+                atom = parse_alt()
+                if atom is None or pos >= len(p) or p[pos] != ")":
+                    return None
+                pos += 1
+            elif ch == "[":
+                end = p.find("]", pos + 1)
+                body = p[pos + 1:end]
+                if end < 0 or not body or body[0] == "^" or "\\" in body or "-" in body[1:-1]:
+                    return None
+                atom = list(body)
+                pos = end + 1
+            elif ch == "\\":
+                nxt = p[pos + 1:pos + 2]
+                if not nxt or nxt.isalnum() or nxt == "_":
+                    return None  # \b, \w, \s, \d ... mitten im Pattern
+                atom = [nxt]
+                pos += 2
+            elif ch in _REGEX_META or ch == "?":
+                return None
+            else:
+                atom = [ch]
+                pos += 1
+
+            if pos < len(p) and p[pos] == "?":
+                pos += 1
+                atom = atom + [""]
+            out = [a + b for a in out for b in atom]
+            if len(out) > _EXPAND_LIMIT:
+                return None
+        return out
+
+    result = parse_alt()
+    if result is None or pos != len(p):
+        return None
+    return sorted(set(result))
+
+
+class _RuleIndex:
+    """
+    Index über eine geordnete Liste von Pattern-Listen (Index = Priorität).
+    - r"\b...\b"-Patterns -> Token-/Phrasen-Lookup im Dict
+    - Patterns ohne Anker -> Substring-Test mit `in`
+    - Rest -> vorkompilierte Regexe
+    `best()` liefert die kleinste passende Regel-Nummer (oder len(rules)).
+    """
+
+    def __init__(self, rules: List[List[str]], errors: List[str]):
+        self.size = len(rules)
+        self._tokens: Dict[str, int] = {}
+        self._phrases: Dict[str, List[Tuple[List[str], int]]] = {}
+        self._substrings: List[Tuple[str, int]] = []
+        self._regexes: List[Tuple["re.Pattern[str]", int]] = []
+
+        for idx, patterns in enumerate(rules):
+            for p in patterns:
+                try:
+                    compiled = re.compile(p)
+                except re.error as e:
+                    errors.append(f"Regex-Fehler im Pattern:\n{p}\n\n{e}")
+                    continue
+                if not self._add_literal(p, idx):
+                    self._regexes.append((compiled, idx))
+
+    def _add_literal(self, p: str, idx: int) -> bool:
+        if p.startswith("\\b") and p.endswith("\\b") and len(p) > 4:
+            words = _expand_pattern(p[2:-2])
+            if not words or not all(re.fullmatch(r"\w+( \w+)*", w) for w in words):
+                return False
+            for w in words:
+                first, *rest = w.split(" ")
+                if rest:
+                    self._phrases.setdefault(first, []).append((rest, idx))
+                elif idx < self._tokens.get(first, self.size):
+                    self._tokens[first] = idx
+            return True
+
+        if "\\b" not in p:
+            words = _expand_pattern(p)
+            if not words or "" in words:
+                return False
+            self._substrings += [(w, idx) for w in words]
+            self._substrings.sort(key=lambda x: x[1])
+            return True
+
+        return False
+
+    def to_json(self) -> Dict[str, object]:
+        return {
+            "size": self.size, "tokens": self._tokens, "phrases": self._phrases,
+            "substrings": self._substrings, "regexes": [(rx.pattern, r) for rx, r in self._regexes],
+        }
+
+    @classmethod
+    def from_json(cls, state: Dict[str, object]) -> "_RuleIndex":
+        """Index aus to_json() (KNOWLEDGE_CACHE); falsche Typen -> TypeError/ValueError."""
+        index = cls.__new__(cls)
+        index.size = int(state["size"])
+        index._tokens = {str(tok): int(r) for tok, r in state["tokens"].items()}
+        index._phrases = {
+            str(first): [([str(w) for w in rest], int(r)) for rest, r in entries]
+            for first, entries in state["phrases"].items()
+        }
+        index._substrings = [(str(w), int(r)) for w, r in state["substrings"]]
+        index._regexes = [(re.compile(str(p)), int(r)) for p, r in state["regexes"]]
+        return index
+
+    def best(self, text: str, tokens: List[str]) -> int:
+        best = self.size
+        lookup = self._tokens.get
+        for tok in tokens:
+            r = lookup(tok, best)
+            if r < best:
+                best = r
+
+        if self._phrases:
+            for i, tok in enumerate(tokens):
+                for rest, r in self._phrases.get(tok, ()):
+                    if r < best and tokens[i + 1:i + 1 + len(rest)] == rest:
+                        best = r
+
+        for lit, r in self._substrings:
+            if r >= best:
+                break
+            if lit in text:
+                best = r
+                break
+
+        for rx, r in self._regexes:
+            if r >= best:
+                break
+            if rx.search(text):
+                best = r
+                break
+        return best
+
+
+# Gleiche Pattern-Listen (z. B. mehrere Studios mit denselben INTENTS) teilen
+# sich einen kompilierten Index; er lebt, solange ein Router ihn benutzt.
+_RULE_INDEXES: "weakref.WeakValueDictionary[str, _RuleIndex]" = weakref.WeakValueDictionary()
+
+
+def _rules_key(rules: List[List[str]]) -> str:
+    return hashlib.sha1(json.dumps(rules, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _shared_rule_index(key: str, rules: List[List[str]], errors: List[str]) -> _RuleIndex:
+    index = _RULE_INDEXES.get(key)
+    if index is None:
+        n = len(errors)
+        index = _RuleIndex(rules, errors)
+        if len(errors) == n:  # nur fehlerfreie Indizes teilen
+            index = _RULE_INDEXES.setdefault(key, index)
+    return index
+
+
+class IntentRouter:
+    """
+    Kompiliert INTENTS und GOAL_PATTERNS einmalig und bestimmt Intent + Ziel
+    in einem Durchlauf über den normalisierten Text (Reihenfolge = Priorität,
+    identisch zum früheren `re.search` pro Pattern).
+    Ungültige Patterns werden beim Aufbau übersprungen und in `errors` gesammelt.
+    """
+
+    def __init__(self, intents: List[Dict[str, object]], goal_patterns: List[Tuple[str, List[str]]]):
+        self.errors: List[str] = []
+        self.intent_names = [str(i.get("name", "unknown")) for i in intents]
+        self.goal_names = [g for g, _ in goal_patterns]
+        intent_rules = [list(i["patterns"]) if isinstance(i.get("patterns"), list) else [] for i in intents]
+        goal_rules = [list(pats) for _, pats in goal_patterns]
+        self.keys = (_rules_key(intent_rules), _rules_key(goal_rules))
+        self._intents = _shared_rule_index(self.keys[0], intent_rules, self.errors)
+        self._goals = _shared_rule_index(self.keys[1], goal_rules, self.errors)
+
+    def to_json(self) -> Dict[str, object]:
+        return {
+            "intent_names": self.intent_names, "goal_names": self.goal_names, "keys": self.keys,
+            "intents": self._intents.to_json(), "goals": self._goals.to_json(),
+        }
+
+    @classmethod
+    def from_json(cls, state: Dict[str, object]) -> "IntentRouter":
+        """Router aus to_json() (KNOWLEDGE_CACHE); Indizes teilt er wie ein neu gebauter."""
+        router = cls.__new__(cls)
+        router.errors = []
+        router.intent_names = [str(n) for n in state["intent_names"]]
+        router.goal_names = [str(n) for n in state["goal_names"]]
+        intent_key, goal_key = (str(k) for k in state["keys"])
+        router.keys = (intent_key, goal_key)
+        for attr, key, part in (("_intents", intent_key, "intents"), ("_goals", goal_key, "goals")):
+            index = _RULE_INDEXES.get(key)
+            if index is None:
+                index = _RULE_INDEXES.setdefault(key, _RuleIndex.from_json(state[part]))
+            setattr(router, attr, index)
+        return router
+
+    @property
+    def pattern_key(self) -> str:
+        """Gleich für Router mit denselben Intent-Namen und Pattern-Listen."""
+        return hashlib.sha1("|".join([*self.keys, *self.intent_names, *self.goal_names]).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def tokenize(text_norm: str) -> List[str]:
+        # normalize() lässt nur \w, Leerzeichen und € übrig; € als eigenes Token
+        # trennt benachbarte Wörter genau wie ein r"\b...\b"-Pattern.
+        return text_norm.replace("€", " € ").split()
+
+    def route(self, text_norm: str) -> Tuple[Optional[int], Optional[str]]:
+        t0 = _clock()
+        tokens = self.tokenize(text_norm)
+        i = self._intents.best(text_norm, tokens)
+        t1 = _clock()
+        g = self._goals.best(text_norm, tokens)
+        _M_INTENT.observe(t1 - t0)
+        _M_GOAL.observe(_clock() - t1)
+        return (
+            i if i < len(self.intent_names) else None,
+            self.goal_names[g] if g < len(self.goal_names) else None,
+        )
+
+    def goal(self, text_norm: str) -> Optional[str]:
+        g = self._goals.best(text_norm, self.tokenize(text_norm))
+        return self.goal_names[g] if g < len(self.goal_names) else None
+
+
+# =========================================================
+# Session
+# =========================================================
+CHAT_MAX_MESSAGES = 200         # ältere Nachrichten fallen aus dem Verlauf
+CHAT_MAX_BYTES = 256 * 1024     # Speicherbudget des Verlaufs pro Session
+CHAT_RENDER_WINDOW = 20         # so viele Nachrichten rendert die UI vollständig
+
+
+class ChatMessage:
+    __slots__ = ("assistant", "text")
+
+    def __init__(self, assistant: bool, text: str):
+        self.assistant = assistant
+        self.text = text
+
+    @property
+    def role(self) -> str:
+        return "assistant" if self.assistant else "user"
+
+
+class ChatHistory:
+    """
+    Begrenzter Gesprächsverlauf: höchstens CHAT_MAX_MESSAGES Nachrichten und
+    CHAT_MAX_BYTES (geschätzt per sys.getsizeof); darüber fallen die ältesten
+    weg und werden in `dropped` gezählt.
+    """
+
+    def __init__(self, max_messages: int = CHAT_MAX_MESSAGES, max_bytes: int = CHAT_MAX_BYTES):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.messages: Deque[ChatMessage] = deque()
+        self.nbytes = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _size(msg: ChatMessage) -> int:
+        return sys.getsizeof(msg) + sys.getsizeof(msg.text)
+
+    def append(self, assistant: bool, text: str) -> None:
+        msg = ChatMessage(assistant, text)
+        self.messages.append(msg)
+        self.nbytes += self._size(msg)
+        while len(self.messages) > 1 and (
+            len(self.messages) > self.max_messages or self.nbytes > self.max_bytes
+        ):
+            self.nbytes -= self._size(self.messages.popleft())
+            self.dropped += 1
+
+    def window(self, n: int) -> List[ChatMessage]:
+        """Die letzten n Nachrichten (älteste zuerst)."""
+        return list(islice(self.messages, max(0, len(self.messages) - n), None))
+
+    def clear(self) -> None:
+        self.messages.clear()
+        self.nbytes = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+
+# alle lebenden Sessions des Prozesses (für die Speicher-Übersicht im Admin-Bereich)
+_SESSIONS: "weakref.WeakSet[ChatSession]" = weakref.WeakSet()
+
+
+class ChatSession:
+    """Zustand eines Gesprächs: gemerktes Ziel, Session-Statistik und Verlauf."""
+
+    def __init__(self):
+        self.goal: Optional[str] = None
+        self.stats: Dict[str, object] = {"intents": {}, "fallback": 0}
+        self.history = ChatHistory()
+        # Token-Bucket des Rate-Limits (siehe RATE-LIMIT); None = voll
+        self.rate_tokens: Optional[float] = None
+        self.rate_stamp = 0.0
+        self.rate_limited = 0
+        _SESSIONS.add(self)
+
+    def reset(self) -> None:
+        # Rate-Limit-Bucket bleibt: "Neues Gespräch" darf das Limit nicht zurücksetzen
+        self.goal = None
+        self.stats = {"intents": {}, "fallback": 0}
+        self.history.clear()
+
+
+def session_memory_report(top: int = 10) -> Dict[str, object]:
+    """Anzahl Sessions, Verlaufsgröße gesamt und die größten Sessions."""
+    rows = [
+        {"session": f"{id(s):x}", "messages": len(s.history), "bytes": s.history.nbytes, "dropped": s.history.dropped}
+        for s in list(_SESSIONS)
+    ]
+    rows.sort(key=lambda r: r["bytes"], reverse=True)
+    return {"sessions": len(rows), "bytes": sum(r["bytes"] for r in rows), "top": rows[:top]}
+
+
+def goal_phrase(goal: Optional[str]) -> str:
+    return f"Da Ihr Ziel „{goal}“ ist, " if goal else ""
+
+
+# =========================================================
+# Ziel-Erkennung
+# =========================================================
+GOAL_PATTERNS: List[Tuple[str, List[str]]] = []  # aus KNOWLEDGE_FILE
+
+
+def infer_goal(text_norm: str) -> Optional[str]:
+    return get_intent_router().goal(text_norm)
+
+
+def recommend_for_goal(goal: str) -> List[str]:
+    if goal == "abnehmen":
+        return ["Jumping", "Bauch, Beine, Po", "Fitness-Dance"]
+    if goal == "muskelaufbau":
+        return ["Freihantelbereich (Technik & Progression mit Betreuung)", "Körperanalyse zur Verlaufskontrolle"]
+    if goal == "rücken stärken":
+        return ["Vibrationstraining (ruhiger Einstieg)", "Geräte-Training mit Fokus auf saubere Ausführung (angepasst)"]
+    if goal == "allgemeine fitness":
+        return ["Fitness-Dance", "Jumping", "Vibrationstraining"]
+    return []
+
+
+# =========================================================
+# Antwort-Handler
+# =========================================================
+# Handler sind reine Funktionen des (Session-)Ziels und der Stammdaten eines
+# Studios (Knowledge.data) – ohne Session-Zugriff – und werden pro (Intent,
+# Ziel) einmal vorgerendert (siehe ANTWORT-VORLAGEN).
+def answer_unsicherheit(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Das ist überhaupt kein Problem.\n\n"
+        "Wir legen großen Wert auf einen ruhigen, gut betreuten Einstieg und passen das Training individuell an – ohne Überforderung.\n\n"
+        "Ein persönliches Beratungsgespräch oder ein kostenloses Probetraining ist dafür ideal.\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+def answer_orientierung(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Das geht vielen so – und ist überhaupt kein Problem.\n\n"
+        "Wir unterstützen Sie dabei, einen passenden Einstieg zu finden: ruhig, strukturiert und mit persönlicher Betreuung.\n\n"
+        "Am besten eignet sich dafür ein persönliches Beratungsgespräch oder ein kostenloses Probetraining.\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+def answer_preise(goal: Optional[str], data: Dict[str, object]) -> str:
+    parts = [
+        "Die Mitgliedsbeiträge können je nach Laufzeit und Trainingsumfang variieren.",
+        "Am sinnvollsten ist ein kurzes persönliches Beratungsgespräch oder ein kostenloses Probetraining, "
+        "damit wir gemeinsam das passende Angebot für Sie finden.",
+    ]
+    if goal:
+        parts.append(f"{goal_phrase(goal)}können wir im Probetraining/Beratungsgespräch genau passend starten.")
+
+    parts.append(probetraining_block(data["probetraining"]))
+    parts.append("Für die Anmeldung melden Sie sich am besten kurz telefonisch.")
+    parts.append(cta_full(data["studio"]))
+    return "\n\n".join(parts)
+
+
+def answer_medizin(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Bei Beschwerden ist ein gut betreuter Einstieg besonders wichtig.\n\n"
+        "Hinweis: Ich kann keine medizinische Einschätzung geben. Wenn Sie akute oder starke Beschwerden haben, "
+        "lassen Sie das bitte ärztlich abklären.\n\n"
+        "Am besten eignet sich dafür ein persönliches Beratungsgespräch oder ein kostenloses Probetraining – "
+        "dann können wir in Ruhe besprechen, wie ein sinnvoller Einstieg aussehen kann.\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+def answer_infos(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Gern – hier die wichtigsten Infos:\n\n"
+        f"📍 Adresse: {data['studio']['address']}\n\n"
+        f"🕒 Öffnungszeiten:\n{data['studio']['opening_hours']}\n\n"
+        f"🚗 Parken: {data['studio']['parking']}\n\n"
+        "Wenn Sie möchten, können Sie direkt ein persönliches Beratungsgespräch oder ein kostenloses Probetraining vereinbaren.\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+def answer_probetraining(_goal: Optional[str], data: Dict[str, object]) -> str:
+    parts = [
+        "Sehr gern – ein kostenloses Probetraining ist ideal, um unser Studio kennenzulernen.",
+        probetraining_block(data["probetraining"]),
+        "Wenn Sie möchten, kann das Probetraining auch als kurzes Beratungsgespräch genutzt werden, um den passenden Start zu planen.",
+        "Für die Anmeldung melden Sie sich am besten kurz telefonisch.",
+        cta_full(data["studio"]),
+    ]
+    return "\n\n".join(parts)
+
+
+def answer_features(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Gern – hier ein Überblick über unsere Ausstattung/Angebote:\n\n"
+        "• " + "\n• ".join(data["features"]) + "\n\n"
+        "Wenn Sie möchten, können Sie das bei einem persönlichen Beratungsgespräch oder einem kostenlosen Probetraining in Ruhe kennenlernen.\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+def answer_kurse(goal: Optional[str], data: Dict[str, object]) -> str:
+    parts = [
+        "Gern – hier unser aktueller Kursplan:",
+        course_plan_text(data["course_plan"]),
+    ]
+    rec = recommend_for_goal(goal) if goal else []
+    if rec:
+        parts.append(f"{goal_phrase(goal)}würden sich z. B. diese Optionen anbieten: " + ", ".join(rec) + ".")
+    parts += [
+        "Wenn Sie möchten, können Sie Kurse auch im Rahmen eines kostenlosen Probetrainings ausprobieren.",
+        "Für die Anmeldung melden Sie sich am besten kurz telefonisch.",
+        cta_short(data["studio"]),
+    ]
+    return "\n\n".join(parts)
+
+
+def answer_facilities(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Gern – bei uns gibt es:\n\n"
+        "• Duschen\n"
+        "• Umkleiden\n"
+        "• Spinde/Schließfächer\n"
+        "• Getränke (vor Ort verfügbar)\n\n"
+        "Wenn Sie möchten, können Sie das alles bei einem persönlichen Beratungsgespräch oder einem kostenlosen Probetraining in Ruhe kennenlernen.\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+def answer_wellness(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Gern – bei uns gibt es Wellness-Angebote wie:\n\n"
+        "• Infrarot\n"
+        "• Massagesessel\n\n"
+        "Wenn Sie möchten, erklären wir Ihnen im persönlichen Beratungsgespräch oder beim kostenlosen Probetraining, wie Sie das sinnvoll nutzen können.\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+def answer_payment(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Hinweis zur Zahlung: Aktuell bieten wir keine Kartenzahlung an.\n\n"
+        "Wenn Sie dazu Fragen haben oder ein kostenloses Probetraining / Beratungsgespräch vereinbaren möchten, melden Sie sich am besten kurz telefonisch.\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+def answer_age(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Zum Mindestalter: Das ist bei uns nach Absprache möglich.\n\n"
+        "Am besten klären wir das kurz telefonisch – dann können wir direkt sagen, was in Ihrem Fall passt.\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+def answer_accessibility(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Hinweis zur Barrierefreiheit: Aktuell ist das Studio nicht barrierefrei.\n\n"
+        "Wenn Sie mir kurz sagen, was genau Sie benötigen (z. B. Stufen, Zugang, Begleitung), klären wir das gern telefonisch und finden eine passende Lösung.\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+def answer_default(_goal: Optional[str], data: Dict[str, object]) -> str:
+    return (
+        "Gern helfe ich Ihnen weiter. Geht es bei Ihnen eher um Probetraining/Beratung, Kurse, Öffnungszeiten/Anfahrt oder Mitgliedschaft?\n\n"
+        f"{cta_short(data['studio'])}"
+    )
+
+
+# =========================================================
+# WISSENSBASIS (Stammdaten, Ziele, INTENTS – Reihenfolge = Priorität)
+# =========================================================
+# KNOWLEDGE_FILE ist die versionierte Quelle; Handler werden per Name
+# referenziert. Router und Antwort-Vorlagen werden pro DATA_VERSION einmal
+# gebaut, als `Knowledge`-Snapshot veröffentlicht (eine Zuweisung = atomarer
+# Tausch für alle Sessions) und in KNOWLEDGE_CACHE auf Platte gespeichert –
+# als JSON neben KNOWLEDGE_FILE: Laden führt keinen Code aus, und wer die
+# Datei schreiben kann, könnte ebenso gut die Wissensbasis ändern.
+KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ptc_knowledge.json")
+KNOWLEDGE_CACHE = os.path.join(os.path.dirname(KNOWLEDGE_FILE), "ptc_knowledge.cache")
+KNOWLEDGE_FORMAT = 1
+KNOWLEDGE_POLL_INTERVAL = 5.0  # Sekunden zwischen zwei mtime-Prüfungen
+INTENT_NAME_MAX_BYTES = 64     # UTF-8; feste Namensbreite der Shared-Stats-Tabelle (ptc_storage)
+
+HANDLERS = {
+    f.__name__: f
+    for f in (
+        answer_unsicherheit, answer_orientierung, answer_preise, answer_medizin, answer_infos,
+        answer_probetraining, answer_features, answer_kurse, answer_facilities, answer_wellness,
+        answer_payment, answer_age, answer_accessibility, answer_default,
+    )
+}
+
+INTENTS: List[Dict[str, object]] = []  # aus KNOWLEDGE_FILE
+DATA_VERSION = ""  # Schlüssel für Router, Vorlagen und Routing-Cache (setzt _apply_knowledge)
+
+
+class KnowledgeError(ValueError):
+    """Ungültige Wissensbasis (JSON, Struktur, Handler oder Regex) – wird nicht übernommen."""
+
+
+def _str_list(value: object, where: str) -> List[str]:
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise KnowledgeError(f"{where}: Liste von Strings erwartet")
+    return list(value)
+
+
+def _str_dict(value: object, where: str) -> Dict[str, str]:
+    if not isinstance(value, dict) or not all(isinstance(v, str) for v in value.values()):
+        raise KnowledgeError(f"{where}: Objekt mit String-Werten erwartet")
+    return dict(value)
+
+
+def parse_knowledge(raw: bytes) -> Dict[str, object]:
+    """Prüft und wandelt den Inhalt von KNOWLEDGE_FILE; Regexe prüft erst der Router."""
+    try:
+        doc = json.loads(raw)
+    except ValueError as e:
+        raise KnowledgeError(f"kein gültiges JSON: {e}") from None
+    return parse_knowledge_doc(doc)
+
+
+def parse_knowledge_doc(doc: object) -> Dict[str, object]:
+    """Wie parse_knowledge(), für ein schon geladenes JSON-Objekt (z. B. Basis + Mandant)."""
+    if not isinstance(doc, dict) or doc.get("format") != KNOWLEDGE_FORMAT:
+        raise KnowledgeError(f"format {KNOWLEDGE_FORMAT} erwartet")
+
+    plan = doc.get("course_plan")
+    if not isinstance(plan, dict):
+        raise KnowledgeError("course_plan: Objekt erwartet")
+    course_plan: Dict[str, List[Tuple[str, str]]] = {}
+    for day, items in plan.items():
+        if not isinstance(items, list) or not all(
+            isinstance(it, list) and len(it) == 2 and all(isinstance(x, str) for x in it) for it in items
+        ):
+            raise KnowledgeError(f"course_plan.{day}: Liste von [Zeit, Kurs] erwartet")
+        course_plan[day] = [(t, title) for t, title in items]
+
+    goal_patterns: List[Tuple[str, List[str]]] = []
+    for n, entry in enumerate(doc.get("goal_patterns") or []):
+        if not isinstance(entry, list) or len(entry) != 2 or not isinstance(entry[0], str):
+            raise KnowledgeError(f"goal_patterns[{n}]: [Ziel, [Patterns]] erwartet")
+        goal_patterns.append((entry[0], _str_list(entry[1], f"goal_patterns[{n}]")))
+
+    intents: List[Dict[str, object]] = []
+    for n, entry in enumerate(doc.get("intents") or []):
+        if not isinstance(entry, dict) or not isinstance(entry.get("name"), str):
+            raise KnowledgeError(f"intents[{n}]: Objekt mit name erwartet")
+        if len(entry["name"].encode("utf-8")) > INTENT_NAME_MAX_BYTES:
+            raise KnowledgeError(f"intents[{n}] ({entry['name'][:20]}…): Name länger als {INTENT_NAME_MAX_BYTES} Bytes")
+        handler = HANDLERS.get(str(entry.get("handler")))
+        if handler is None:
+            raise KnowledgeError(f"intents[{n}] ({entry['name']}): unbekannter Handler {entry.get('handler')!r}")
+        intents.append({
+            "name": entry["name"],
+            "patterns": _str_list(entry.get("patterns"), f"intents[{n}].patterns"),
+            "handler": handler,
+        })
+
+    return {
+        "studio": _str_dict(doc.get("studio"), "studio"),
+        "probetraining": _str_dict(doc.get("probetraining"), "probetraining"),
+        "course_plan": course_plan,
+        "features": _str_list(doc.get("features"), "features"),
+        "goal_patterns": goal_patterns,
+        "intents": intents,
+    }
+
+
+# Die Stammdaten-Globals werden unter diesem Lock gemeinsam gesetzt und gelesen.
+_data_lock = Lock()
+
+
+def _current_data() -> Dict[str, object]:
+    with _data_lock:
+        return {
+            "studio": STUDIO, "probetraining": PROBETRAINING, "course_plan": COURSE_PLAN,
+            "features": FEATURES, "goal_patterns": GOAL_PATTERNS, "intents": INTENTS,
+        }
+
+
+def data_version(data: Optional[Dict[str, object]] = None) -> str:
+    """Fingerprint der Stammdaten und Patterns – ändert sich bei jeder Anpassung."""
+    d = data if data is not None else _current_data()
+    payload = json.dumps(
+        [
+            d["studio"], d["probetraining"], d["course_plan"], d["features"], d["goal_patterns"],
+            [(i.get("name"), i.get("patterns"), getattr(i.get("handler"), "__name__", None)) for i in d["intents"]],
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def _apply_knowledge(data: Dict[str, object]) -> None:
+    global STUDIO, PROBETRAINING, COURSE_PLAN, FEATURES, GOAL_PATTERNS, INTENTS, DATA_VERSION
+    with _data_lock:
+        STUDIO = data["studio"]
+        PROBETRAINING = data["probetraining"]
+        COURSE_PLAN = data["course_plan"]
+        FEATURES = data["features"]
+        GOAL_PATTERNS = data["goal_patterns"]
+        INTENTS = data["intents"]
+    DATA_VERSION = data_version(data)
+
+
+class Knowledge:
+    """Unveränderlicher Snapshot: alles, was handle_message() für eine Version braucht."""
+
+    __slots__ = ("version", "intents", "router", "templates", "source", "loaded_at", "data", "routes")
+
+    def __init__(self, version: str, intents: List[Dict[str, object]], router: "IntentRouter",
+                 templates: Dict[Tuple[str, Optional[str]], str], source: str,
+                 data: Dict[str, object], routes: Optional["LRUCache"] = None):
+        self.version = version
+        self.intents = intents
+        self.router = router
+        self.templates = templates
+        self.source = source  # "cache" oder "build"
+        self.loaded_at = time.time()
+        self.data = data      # Stammdaten dieser Version (studio, course_plan, …)
+        self.routes = routes  # eigener Routing-Cache; None = prozessweiter ResponseCache
+
+    def render(self, handler, goal: Optional[str]) -> str:
+        """Antwort außerhalb der Vorlagen (z. B. Ziel aus einer älteren Version) mit den eigenen Stammdaten."""
+        return handler(goal, self.data)
+
+
+def _compile_router(intents: List[Dict[str, object]], goal_patterns: List[Tuple[str, List[str]]]) -> "IntentRouter":
+    router = IntentRouter(intents, goal_patterns)
+    if router.errors:
+        raise KnowledgeError("; ".join(router.errors))
+    return router
+
+
+def _cache_key(version: str) -> str:
+    # Vorlagen hängen auch vom Handler-Code ab -> Quelltext mit in den Schlüssel
+    with open(__file__, "rb") as f:
+        return version + ":" + hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def _read_cache(key: str) -> Optional[Tuple["IntentRouter", Dict[Tuple[str, Optional[str]], str]]]:
+    try:
+        with open(KNOWLEDGE_CACHE, "rb") as f:
+            cached = json.loads(f.read())
+        if cached.get("key") == key:
+            templates: Dict[Tuple[str, Optional[str]], str] = {}
+            texts: Dict[str, str] = {}  # gleiche Antworten wie in build_answer_templates() nur einmal halten
+            for name, goal, text in cached["templates"]:
+                text = str(text)
+                templates[(str(name), None if goal is None else str(goal))] = texts.setdefault(text, text)
+            return IntentRouter.from_json(cached["router"]), templates
+    except Exception:
+        pass  # fehlt, veraltet oder kaputt -> neu bauen
+    return None
+
+
+def _write_cache(key: str, router: "IntentRouter", templates: Dict[Tuple[str, Optional[str]], str]) -> None:
+    tmp = KNOWLEDGE_CACHE + ".tmp"
+    payload = {
+        "key": key,
+        "router": router.to_json(),
+        "templates": [(name, goal, text) for (name, goal), text in templates.items()],
+    }
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, KNOWLEDGE_CACHE)
+    except OSError:
+        pass  # nur ein Beschleuniger
+
+
+def _build_knowledge(router: Optional["IntentRouter"] = None) -> Knowledge:
+    """Snapshot für die aktuell geladenen Daten – aus KNOWLEDGE_CACHE oder neu gebaut."""
+    data = _current_data()
+    key = _cache_key(DATA_VERSION)
+    cached = None if router is not None else _read_cache(key)
+    if cached is not None:
+        return Knowledge(DATA_VERSION, data["intents"], cached[0], cached[1], "cache", data)
+    if router is None:
+        router = _compile_router(data["intents"], data["goal_patterns"])
+    templates = build_answer_templates(data)
+    _write_cache(key, router, templates)
+    return Knowledge(DATA_VERSION, data["intents"], router, templates, "build", data)
+
+
+def build_knowledge(data: Dict[str, object]) -> Knowledge:
+    """
+    Snapshot für einen beliebigen Datensatz (z. B. einen Mandanten, siehe
+    ptc_tenants) – ohne die Modul-Globals oder KNOWLEDGE_CACHE anzufassen.
+    Router mit denselben Patterns teilen sich Regel-Indizes und Routing-Cache.
+    """
+    router = _compile_router(data["intents"], data["goal_patterns"])
+    return Knowledge(
+        data_version(data), data["intents"], router, build_answer_templates(data), "build", data,
+        shared_route_cache(router),
+    )
+
+
+def _read_knowledge_file(path: str) -> Tuple[Dict[str, object], int]:
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError as e:
+        raise KnowledgeError(f"{path} nicht lesbar: {e}") from None
+    return parse_knowledge(raw), mtime
+
+
+_data, _knowledge_mtime = _read_knowledge_file(KNOWLEDGE_FILE)
+_apply_knowledge(_data)  # ungültige Datei -> KnowledgeError schon beim Import
+del _data
+
+_knowledge: Optional[Knowledge] = None   # wird beim ersten Zugriff gebaut
+_knowledge_error: Optional[str] = None   # letzter abgelehnter Reload
+_knowledge_lock = Lock()
+
+
+def get_knowledge() -> Knowledge:
+    kb = _knowledge
+    if kb is None:
+        with _knowledge_lock:
+            kb = _knowledge
+            if kb is None:
+                kb = _publish(_build_knowledge())
+    return kb
+
+
+def _publish(kb: Knowledge) -> Knowledge:
+    global _knowledge
+    _knowledge = kb
+    return kb
+
+
+def reload_knowledge(path: str = KNOWLEDGE_FILE, force: bool = False) -> bool:
+    """
+    Lädt KNOWLEDGE_FILE neu, wenn sich die mtime (oder mit force immer)
+    geändert hat. Ungültige Dateien werden abgelehnt (KnowledgeError, der
+    bisherige Stand bleibt aktiv). True, wenn eine neue Version aktiv ist.
+    """
+    global _knowledge_mtime, _knowledge_error
+    with _knowledge_lock:
+        try:
+            if not force and os.stat(path).st_mtime_ns == _knowledge_mtime:
+                return False
+            data, mtime = _read_knowledge_file(path)
+            # Router vorab bauen: ungültige Regexe scheitern hier, bevor sich etwas ändert
+            router = _compile_router(data["intents"], data["goal_patterns"])
+        except (KnowledgeError, OSError) as e:
+            _knowledge_error = str(e)
+            raise KnowledgeError(str(e)) from None
+        _knowledge_mtime = mtime
+        _knowledge_error = None
+        old_version = DATA_VERSION
+        _apply_knowledge(data)
+        if _knowledge is not None and DATA_VERSION == old_version:
+            return False
+        _publish(_build_knowledge(router))
+        return True
+
+
+def knowledge_status() -> Dict[str, object]:
+    kb = _knowledge
+    return {
+        "path": KNOWLEDGE_FILE,
+        "version": kb.version if kb is not None else DATA_VERSION,
+        "source": kb.source if kb is not None else None,
+        "loaded_at": kb.loaded_at if kb is not None else None,
+        "error": _knowledge_error,
+    }
+
+
+_watcher_started = False
+
+
+def _watch_knowledge(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            reload_knowledge()
+        except KnowledgeError:
+            pass  # steht in knowledge_status()["error"]; alter Stand bleibt aktiv
+
+
+def start_knowledge_watcher(interval: float = KNOWLEDGE_POLL_INTERVAL) -> None:
+    """Prüft KNOWLEDGE_FILE im Hintergrund und tauscht bei Änderungen (idempotent)."""
+    global _watcher_started
+    with _knowledge_lock:
+        if _watcher_started:
+            return
+        _watcher_started = True
+    Thread(target=_watch_knowledge, args=(interval,), name="ptc-knowledge-watcher", daemon=True).start()
+
+
+def get_intent_router() -> "IntentRouter":
+    return get_knowledge().router
+
+
+# =========================================================
+# ROUTING-CACHE
+# =========================================================
+RESPONSE_CACHE_SIZE = 4096
+
+
+class LRUCache:
+    """Threadsicherer LRU-Cache mit Treffer-/Fehl-/Verdrängungszählern."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[object, object]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: object) -> Optional[object]:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: object, value: object) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ResponseCache:
+    """
+    routes: normalisierter Text -> (Intent-Index, erkanntes Ziel)
+    Wird geleert, sobald sich DATA_VERSION ändert.
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE):
+        self.routes = LRUCache(maxsize)
+        self.version: Optional[str] = None
+
+    def check_version(self, version: str) -> None:
+        if version != self.version:
+            self.routes.clear()
+            self.version = version
+
+
+_RESPONSE_CACHE = ResponseCache()
+_ROUTE_CACHES: "weakref.WeakValueDictionary[str, LRUCache]" = weakref.WeakValueDictionary()
+
+
+def get_response_cache() -> ResponseCache:
+    return _RESPONSE_CACHE
+
+
+def shared_route_cache(router: IntentRouter) -> LRUCache:
+    """Routing-Cache für Snapshots aus build_knowledge(): einer pro Pattern-Satz, nicht pro Mandant."""
+    key = router.pattern_key
+    cache = _ROUTE_CACHES.get(key)
+    if cache is None:
+        cache = _ROUTE_CACHES.setdefault(key, LRUCache(RESPONSE_CACHE_SIZE))
+    return cache
+
+
+# =========================================================
+# ANTWORT-VORLAGEN (einmal pro DATA_VERSION gerendert, siehe WISSENSBASIS)
+# =========================================================
+def build_answer_templates(data: Optional[Dict[str, object]] = None) -> Dict[Tuple[str, Optional[str]], str]:
+    """Alle Antworten je (Intent-Name, Ziel) inkl. Fallback unter "fallback" – für `data` oder den geladenen Stand."""
+    if data is None:
+        data = _current_data()
+    goals: List[Optional[str]] = [None] + [g for g, _ in data["goal_patterns"]]
+    templates: Dict[Tuple[str, Optional[str]], str] = {}
+    texts: Dict[str, str] = {}  # viele Handler ignorieren das Ziel -> gleiche Texte nur einmal halten
+    for intent in data["intents"]:
+        handler = intent.get("handler")
+        if callable(handler):
+            name = str(intent.get("name", "unknown"))
+            for goal in goals:
+                text = handler(goal, data)
+                templates[(name, goal)] = texts.setdefault(text, text)
+    for goal in goals:
+        text = answer_default(goal, data)
+        templates[("fallback", goal)] = texts.setdefault(text, text)
+    return templates
+
+
+def get_answer_templates() -> Dict[Tuple[str, Optional[str]], str]:
+    return get_knowledge().templates
+
+
+# =========================================================
+# RATE-LIMIT (Token-Bucket pro Session und Client-IP)
+# =========================================================
+# Greift in handle_message() vor Normalisierung, Routing, Stats und Log.
+# Der Session-Bucket steckt in der ChatSession (lebt und stirbt mit ihr, ohne
+# Lock), die IP-Buckets in einer LRU-Tabelle, aus der untätige Einträge beim
+# nächsten Zugriff fallen – nach RATE_IDLE_TTL wäre der Bucket ohnehin wieder
+# voll. Abgelehnte Nachrichten bekommen eine feste Antwort und werden nur
+# gezählt, nicht geloggt.
+# Die Grenzen sind großzügig gewählt, damit kein Mensch sie beim normalen
+# Chatten erreicht (auch nicht mehrere Geräte hinter einem Studio-WLAN);
+# sie bremsen nur Skripte, die Stats und Log fluten. ptc_api schaltet das
+# Limit mit --no-rate-limit ab, load_test und bench_routing für ihre Messung.
+RATE_LIMIT_ENABLED = True
+RATE_SESSION_PER_MIN = 30.0     # Nachfüllrate pro Session
+RATE_SESSION_BURST = 20         # so viele Nachrichten am Stück
+RATE_CLIENT_PER_MIN = 120.0     # Nachfüllrate pro Client-IP (alle Sessions zusammen)
+RATE_CLIENT_BURST = 60
+RATE_IDLE_TTL = 600.0           # Sekunden ohne Nachricht -> IP-Bucket fällt weg
+RATE_MAX_CLIENTS = 100_000      # harte Obergrenze der IP-Tabelle
+RATE_LIMITED_INTENT = "rate_limited"
+RATE_LIMIT_TEXT = (
+    "Sie schreiben gerade sehr schnell – bitte warten Sie einen Moment "
+    "und stellen Sie Ihre Frage dann noch einmal."
+)
+
+
+class RateLimiter:
+    """Token-Buckets pro Session und pro Client-IP mit Ablehnungszählern."""
+
+    def __init__(
+        self,
+        enabled: bool = RATE_LIMIT_ENABLED,
+        session_per_min: float = RATE_SESSION_PER_MIN,
+        session_burst: int = RATE_SESSION_BURST,
+        client_per_min: float = RATE_CLIENT_PER_MIN,
+        client_burst: int = RATE_CLIENT_BURST,
+        idle_ttl: float = RATE_IDLE_TTL,
+        max_clients: int = RATE_MAX_CLIENTS,
+    ):
+        self.enabled = enabled
+        self.session_rate = session_per_min / 60.0
+        self.session_burst = float(session_burst)
+        self.client_rate = client_per_min / 60.0
+        self.client_burst = float(client_burst)
+        self.idle_ttl = max(idle_ttl, client_burst / max(self.client_rate, 1e-9))
+        self.max_clients = max_clients
+        self.limited_session = 0
+        self.limited_client = 0
+        self.evicted = 0
+        self._next_sweep = 0.0
+        # IP -> [Tokens, letzter Zugriff, abgelehnt]; älteste Zugriffe vorn
+        self._clients: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = Lock()
+
+    def allow(self, session: ChatSession, client: Optional[str] = None, now: Optional[float] = None) -> bool:
+        """Nimmt ein Token aus Session- und ggf. IP-Bucket; False = abgelehnt."""
+        if now is None:
+            now = time.monotonic()
+        tokens = session.rate_tokens
+        if tokens is None:
+            tokens = self.session_burst
+        else:
+            tokens = min(self.session_burst, tokens + (now - session.rate_stamp) * self.session_rate)
+        session.rate_stamp = now
+        if tokens < 1.0:
+            session.rate_tokens = tokens
+            session.rate_limited += 1
+            with self._lock:
+                self.limited_session += 1
+            return False
+        session.rate_tokens = tokens - 1.0
+        if client is None or self._take_client(client, now):
+            return True
+        session.rate_tokens = tokens  # Session-Token zurück, abgelehnt hat die IP
+        return False
+
+    def _take_client(self, client: str, now: float) -> bool:
+        clients = self._clients
+        with self._lock:
+            bucket = clients.get(client)
+            if bucket is None:
+                bucket = clients[client] = [self.client_burst, now, 0]
+            else:
+                clients.move_to_end(client)
+                bucket[0] = min(self.client_burst, bucket[0] + (now - bucket[1]) * self.client_rate)
+                bucket[1] = now
+            if now >= self._next_sweep or len(clients) > self.max_clients:
+                self._sweep(now)
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                self.limited_client += 1
+                return False
+            bucket[0] -= 1.0
+            return True
+
+    def _sweep(self, now: float) -> None:
+        # untätige Buckets vorn abräumen; Aufruf nur unter self._lock, höchstens einmal pro Sekunde
+        clients = self._clients
+        while clients:
+            oldest = next(iter(clients.values()))
+            if now - oldest[1] < self.idle_ttl and len(clients) <= self.max_clients:
+                break
+            clients.popitem(last=False)
+            self.evicted += 1
+        self._next_sweep = now + 1.0
+
+    def stats(self, top: int = 10) -> Dict[str, object]:
+        """Zähler und die IPs mit den meisten Ablehnungen (für den Admin-Bereich)."""
+        with self._lock:
+            offenders = [(ip, int(b[2])) for ip, b in self._clients.items() if b[2]]
+            clients = len(self._clients)
+        offenders.sort(key=lambda r: r[1], reverse=True)
+        return {
+            "enabled": self.enabled,
+            "limited_session": self.limited_session,
+            "limited_client": self.limited_client,
+            "clients": clients,
+            "evicted": self.evicted,
+            "top_clients": offenders[:top],
+        }
+
+
+_RATE_LIMITER = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    return _RATE_LIMITER
+
+
+# =========================================================
+# Routing
+# =========================================================
+# Latenz-Histogramme (ptc_metrics): einmal geholt, pro Nachricht nur observe()
+_clock = time.perf_counter_ns
+_M_RATE_LIMIT = stage("rate_limit")
+_M_NORMALIZE = stage("normalize")
+_M_ROUTE = stage("route")             # Cache-Lookup + ggf. Intent-/Ziel-Matching
+_M_INTENT = stage("intent_match")     # nur bei Cache-Fehlgriffen
+_M_GOAL = stage("infer_goal")         # nur bei Cache-Fehlgriffen
+_M_STATS = stage("stats_inc")
+_M_LOG = stage("log_question")
+_M_TOTAL = stage("total")
+_M_HANDLERS: Dict[str, Histogram] = {}
+
+
+def _handler_metric(name: str) -> Histogram:
+    h = _M_HANDLERS[name] = histogram("ptc_handler_seconds", name)
+    return h
+
+
+class StatsSink(Protocol):
+    def inc_intent(self, name: str) -> None: ...
+
+    def inc_fallback(self) -> None: ...
+
+    def log_question(self, raw_text: str, intent: str, goal: Optional[str]) -> None: ...
+
+
+class Reply(NamedTuple):
+    intent: str            # Intent-Name oder "fallback"
+    goal: Optional[str]    # gemerktes Ziel nach dieser Nachricht
+    text: str
+
+
+def handle_message(
+    user_text: str,
+    session: ChatSession,
+    sink: Optional[StatsSink] = None,
+    client: Optional[str] = None,
+    knowledge: Optional[Knowledge] = None,
+) -> Reply:
+    t_start = t0 = _clock()
+    limiter = _RATE_LIMITER
+    if limiter.enabled:
+        allowed = limiter.allow(session, client)
+        t1 = _clock()
+        _M_RATE_LIMIT.observe(t1 - t0)
+        if not allowed:
+            return Reply(RATE_LIMITED_INTENT, session.goal, RATE_LIMIT_TEXT)
+        t0 = t1
+
+    t_norm = normalize(user_text)
+    t1 = _clock()
+    _M_NORMALIZE.observe(t1 - t0)
+
+    kb = knowledge if knowledge is not None else get_knowledge()  # ein Snapshot für die ganze Nachricht
+    routes = kb.routes
+    if routes is None:
+        cache = get_response_cache()
+        cache.check_version(kb.version)
+        routes = cache.routes
+    routed = routes.get(t_norm)
+    if routed is None:
+        routed = kb.router.route(t_norm)
+        routes.put(t_norm, routed)
+    idx, g = routed
+    if g:
+        session.goal = g
+    goal = session.goal
+    t2 = _clock()
+    _M_ROUTE.observe(t2 - t1)
+
+    # Intent gefunden
+    if idx is not None:
+        intent = kb.intents[idx]
+        name = str(intent.get("name", "unknown"))
+
+        # Session-Stats
+        stats = session.stats["intents"]
+        stats[name] = stats.get(name, 0) + 1
+
+        if sink is not None:
+            # Global-Stats + ALLE FRAGEN loggen (mit Intent)
+            sink.inc_intent(name)
+            t3 = _clock()
+            _M_STATS.observe(t3 - t2)
+            sink.log_question(user_text, name, goal)
+            t2 = _clock()
+            _M_LOG.observe(t2 - t3)
+
+        handler = intent.get("handler")
+        if callable(handler):
+            answer = kb.templates.get((name, goal))
+            if answer is None:
+                answer = kb.render(handler, goal)
+            t3 = _clock()
+            (_M_HANDLERS.get(name) or _handler_metric(name)).observe(t3 - t2)
+            _M_TOTAL.observe(t3 - t_start)
+            return Reply(name, goal, answer)
+
+    # Fallback
+    session.stats["fallback"] += 1
+    if sink is not None:
+        sink.inc_fallback()
+        t3 = _clock()
+        _M_STATS.observe(t3 - t2)
+        # Fallback-Phrasen zählt der Log-Writer aus dem maskierten Text (ptc_storage)
+        sink.log_question(user_text, "fallback", goal)
+        t2 = _clock()
+        _M_LOG.observe(t2 - t3)
+
+    answer = kb.templates.get(("fallback", goal))
+    if answer is None:
+        answer = kb.render(answer_default, goal)
+    t3 = _clock()
+    (_M_HANDLERS.get("fallback") or _handler_metric("fallback")).observe(t3 - t2)
+    _M_TOTAL.observe(t3 - t_start)
+    return Reply("fallback", goal, answer)
+
+
+def route_and_answer(
+    user_text: str,
+    session: ChatSession,
+    sink: Optional[StatsSink] = None,
+    client: Optional[str] = None,
+    knowledge: Optional[Knowledge] = None,
+) -> str:
+    return handle_message(user_text, session, sink, client, knowledge).text
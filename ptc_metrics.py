@@ -0,0 +1,255 @@
+"""
+PTC Online-Beratung – Latenz-Metriken (immer aktiv).
+
+Histogramme mit festen Buckets pro Verarbeitungsstufe, pro Handler und für
+Warte-/Haltezeit der Locks. `observe()` zählt nur in eine vorab angelegte
+Liste (keine Objekte pro Aufruf, kein Lock – unter Last kann vereinzelt ein
+Zähler verloren gehen, das ist für Metriken in Ordnung). Export im
+Prometheus-Textformat als Datei (node_exporter textfile collector) und
+optional über einen lokalen HTTP-Endpunkt.
+"""
+import os
+import time
+from bisect import bisect_left
+from threading import Lock, Thread
+from typing import Optional, List, Dict, Tuple
+
+
+# =========================================================
+# KONFIG
+# =========================================================
+LATENCY_BUCKETS_US = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500,
+    1_000, 2_500, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 1_000_000,
+)
+METRICS_FILE = "ptc_metrics.prom"
+METRICS_WRITE_INTERVAL = 15.0          # Sekunden; 0 = keine Datei schreiben
+METRICS_HTTP_PORT: Optional[int] = None  # z. B. 9464 -> http://127.0.0.1:9464/metrics
+METRICS_HTTP_HOST = "127.0.0.1"
+
+# Familie -> (Label-Name, Hilfetext)
+FAMILIES: Dict[str, Tuple[str, str]] = {
+    "ptc_stage_seconds": ("stage", "Latenz pro Verarbeitungsstufe einer Chat-Nachricht"),
+    "ptc_handler_seconds": ("intent", "Latenz der Antwort-Erzeugung pro Intent"),
+    "ptc_lock_wait_seconds": ("lock", "Wartezeit auf einen Lock"),
+    "ptc_lock_hold_seconds": ("lock", "Haltezeit eines Locks"),
+}
+
+_clock = time.perf_counter_ns
+
+
+# =========================================================
+# HISTOGRAMME
+# =========================================================
+class Histogram:
+    """Feste Buckets (obere Grenzen in ns, letzter Bucket = +Inf)."""
+
+    __slots__ = ("family", "label", "_bounds_ns", "counts", "sum_ns", "max_ns")
+
+    def __init__(self, family: str, label: str, buckets_us: Tuple[int, ...] = LATENCY_BUCKETS_US):
+        self.family = family
+        self.label = label
+        self._bounds_ns = tuple(b * 1000 for b in buckets_us)
+        self.counts = [0] * (len(buckets_us) + 1)
+        self.sum_ns = 0
+        self.max_ns = 0
+
+    def observe(self, ns: int) -> None:
+        self.counts[bisect_left(self._bounds_ns, ns)] += 1
+        self.sum_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile_us(self, q: float) -> float:
+        """Obere Bucket-Grenze, in der das q-Quantil liegt (max_ns für +Inf)."""
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank and c:
+                bound = self._bounds_ns[i] if i < len(self._bounds_ns) else self.max_ns
+                return min(bound, self.max_ns) / 1000.0
+        return self.max_ns / 1000.0
+
+
+_registry: Dict[Tuple[str, str], Histogram] = {}
+_registry_lock = Lock()
+
+
+def histogram(family: str, label: str) -> Histogram:
+    """Liefert (und legt einmalig an) das Histogramm; beim Import/Aufbau holen, nicht pro Aufruf."""
+    key = (family, label)
+    h = _registry.get(key)
+    if h is None:
+        with _registry_lock:
+            h = _registry.setdefault(key, Histogram(family, label))
+    return h
+
+
+def stage(name: str) -> Histogram:
+    return histogram("ptc_stage_seconds", name)
+
+
+class TimedLock:
+    """
+    Drop-in für threading.Lock, das Warte- und Haltezeit in
+    ptc_lock_wait_seconds / ptc_lock_hold_seconds{lock=name} zählt.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = Lock()
+        self._wait = histogram("ptc_lock_wait_seconds", name)
+        self._hold = histogram("ptc_lock_hold_seconds", name)
+        self._acquired_at = 0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        lock = self._lock
+        if lock.acquire(False):
+            self._wait.counts[0] += 1  # unkontendiert: Wartezeit ~0, kein Zeitstempel nötig
+        elif not blocking:
+            return False
+        else:
+            t0 = _clock()
+            if not lock.acquire(True, timeout):
+                return False
+            self._wait.observe(_clock() - t0)
+        # ab hier gehört der Lock uns -> _acquired_at ohne weitere Synchronisation
+        self._acquired_at = _clock()
+        return True
+
+    def release(self) -> None:
+        self._hold.observe(_clock() - self._acquired_at)
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc) -> None:
+        self._hold.observe(_clock() - self._acquired_at)
+        self._lock.release()
+
+
+# =========================================================
+# EXPORT
+# =========================================================
+def _fmt_le(bound_ns: int) -> str:
+    return repr(bound_ns / 1e9)
+
+
+def render_prometheus() -> str:
+    """Alle Histogramme im Prometheus-Textformat (Version 0.0.4)."""
+    with _registry_lock:
+        hists = sorted(_registry.values(), key=lambda h: (h.family, h.label))
+    out: List[str] = []
+    family = None
+    for h in hists:
+        if h.family != family:
+            family = h.family
+            label_name, help_text = FAMILIES.get(family, ("name", family))
+            out.append(f"# HELP {family} {help_text}")
+            out.append(f"# TYPE {family} histogram")
+        label = h.label.replace("\\", "\\\\").replace('"', '\\"')
+        counts = list(h.counts)
+        cumulative = 0
+        for bound_ns, c in zip(h._bounds_ns, counts):
+            cumulative += c
+            out.append(f'{family}_bucket{{{label_name}="{label}",le="{_fmt_le(bound_ns)}"}} {cumulative}')
+        cumulative += counts[-1]
+        out.append(f'{family}_bucket{{{label_name}="{label}",le="+Inf"}} {cumulative}')
+        out.append(f'{family}_sum{{{label_name}="{label}"}} {h.sum_ns / 1e9!r}')
+        out.append(f'{family}_count{{{label_name}="{label}"}} {cumulative}')
+    return "\n".join(out) + "\n"
+
+
+def write_prometheus(path: str = METRICS_FILE) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, path)  # atomar, der Collector sieht nie eine halbe Datei
+
+
+def summary() -> List[Dict[str, object]]:
+    """Eine Zeile pro Histogramm (µs) für die Admin-Tabelle."""
+    with _registry_lock:
+        hists = sorted(_registry.values(), key=lambda h: (h.family, h.label))
+    rows = []
+    for h in hists:
+        n = h.count
+        rows.append({
+            "family": h.family,
+            "label": h.label,
+            "count": n,
+            "mean_us": h.sum_ns / n / 1000.0 if n else 0.0,
+            "p50_us": h.quantile_us(0.50),
+            "p95_us": h.quantile_us(0.95),
+            "p99_us": h.quantile_us(0.99),
+            "max_us": h.max_ns / 1000.0,
+        })
+    return rows
+
+
+def _metrics_server(port: int):
+    # http.server erst hier importieren – hält den Import von ptc_core schlank
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    return ThreadingHTTPServer((METRICS_HTTP_HOST, port), MetricsHandler)
+
+
+_exporter_started = False
+_exporter_lock = Lock()
+
+
+def _write_loop(path: str, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            write_prometheus(path)
+        except OSError:
+            pass  # nächster Versuch im nächsten Intervall
+
+
+def start_exporter(
+    path: str = METRICS_FILE,
+    interval: float = METRICS_WRITE_INTERVAL,
+    port: Optional[int] = METRICS_HTTP_PORT,
+) -> None:
+    """Startet Datei-Export und ggf. HTTP-Endpunkt einmal pro Prozess (idempotent)."""
+    global _exporter_started
+    if _exporter_started:
+        return
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        if interval > 0:
+            Thread(target=_write_loop, args=(path, interval), name="ptc-metrics-writer", daemon=True).start()
+        if port:
+            server = _metrics_server(port)
+            server.daemon_threads = True
+            Thread(target=server.serve_forever, name="ptc-metrics-http", daemon=True).start()
+        _exporter_started = True
@@ -0,0 +1,262 @@
+"""
+PTC Online-Beratung – Maskierung personenbezogener Daten im Fragen-Log.
+
+Ein einziger vorkompilierter Ausdruck findet in einem Durchlauf E-Mails,
+IBANs, Daten mit Jahreszahl (Geburtsdaten), Telefonnummern, Adressen
+(Straße + Hausnummer), Namen nach typischen Einleitungen ("ich heiße …",
+"Frau …", Grußformel) und Gesundheitsangaben und ersetzt sie durch
+Platzhalter wie "[email]". `scrub()` liefert den maskierten Text und die
+Treffer pro Kategorie; `scrub_jsonl()` filtert Log-Dateien zeilenweise,
+ohne sie in den Speicher zu laden (siehe scrub_log.py).
+
+Die Muster sind bewusst eher zu gierig als zu knapp: lieber ein Datum zu
+viel maskiert als ein Geburtsdatum im Log. Sie kommen ohne atomare Gruppen
+und possessive Quantoren aus (erst ab Python 3.11).
+"""
+import json
+import re
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+
+# =========================================================
+# KATEGORIEN & MUSTER
+# =========================================================
+# Reihenfolge = Priorität, wenn mehrere Muster an derselben Stelle passen
+# (z. B. IBAN vor Telefonnummer, Datum vor Telefonnummer).
+PII_CATEGORIES = ("email", "iban", "datum", "telefon", "adresse", "name", "gesundheit")
+
+_W = r"[A-Za-zÄÖÜäöüß]"          # Buchstabe (ohne Ziffern/Unterstrich)
+_UPPER_WORD = r"[A-ZÄÖÜ][a-zäöüß]+(?:-[A-ZÄÖÜ][a-zäöüß]+)?"
+_MONTHS = (
+    "januar|februar|märz|maerz|april|mai|juni|juli|august|september|oktober|november|dezember"
+    "|jan|feb|mär|apr|jun|jul|aug|sept?|okt|nov|dez"
+)
+
+# Gesundheitsangaben: Wortanfänge (klein geschrieben), das ganze Wort wird
+# maskiert ("Rückenschmerzen", "Bandscheibenvorfall", "schwanger"). Komposita
+# aus Körperteil + Beschwerde ("Kniearthrose") kommen aus den beiden Listen.
+_BODY_PARTS = (
+    "rücken", "ruecken", "knie", "kopf", "nacken", "schulter", "gelenk", "hüft", "hueft",
+    "bauch", "hand", "fuß", "fuss", "ellenbogen", "wirbel", "sprunggelenk", "achilles",
+)
+_CONDITIONS = ("schmerz", "arthrose", "verletz", "prellung", "bruch", "entzündung", "operation", "sehnenriss")
+HEALTH_STEMS = (
+    "schmerz", "bandscheib", "kreuzband", "meniskus", "bänderriss", "fraktur", "verletz", "operiert",
+    "operation", "diabet", "insulin", "bluthochdruck", "blutdruck", "herzinfarkt", "herzschwäche",
+    "herzrhythmus", "herzfehler", "schlaganfall", "thrombose", "krebs", "tumor", "chemo", "asthma",
+    "copd", "arthrose", "arthritis", "rheuma", "osteopor", "skoliose", "migräne", "epilep",
+    "parkinson", "demenz", "sklerose", "depressi", "burnout", "burn-out", "angststörung",
+    "panikattacke", "essstörung", "magersucht", "bulimie", "adipositas", "schwanger", "krank",
+    "erkrank", "beschwerden", "medikament", "physio", "reha", "arzt", "ärzt",
+) + tuple(part + cond for part in _BODY_PARTS for cond in _CONDITIONS)
+# Nur als ganzes Wort: als Wortanfang träfen sie "Rückenkurs" bzw. "herzlich".
+HEALTH_WORDS = ("rücken", "ruecken", "knie", "herz")
+
+# Fragen mit diesen Intents sind als Ganzes Gesundheitsangaben und werden
+# vollständig durch "[gesundheit]" ersetzt, nicht nur die erkannten Wörter.
+HEALTH_INTENTS = ("medizin_beschwerden",)
+
+
+def _trie_branches(words: Iterable[str]) -> List[str]:
+    """
+    Präfixbaum als Liste von Ästen, je einer pro Anfangsbuchstabe
+    ("[bB](?:andscheib|ulimie|…)"). Der erste Buchstabe darf groß sein.
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        alts = [re.escape(ch) + build(node[ch]) for ch in sorted(node) if ch]
+        if "" in node:  # Wort endet hier -> Rest optional
+            return f"(?:{'|'.join(alts)})?" if alts else ""
+        return alts[0] if len(alts) == 1 else f"(?:{'|'.join(alts)})"
+
+    return [f"[{ch}{ch.upper()}]" + build(trie[ch]) for ch in sorted(trie)]
+
+
+# Jeder Eintrag ist ein eigener Ast der obersten Alternation und beginnt mit
+# einem Literal oder einer Zeichenklasse – dann verwirft sre den Ast ohne ihn
+# zu betreten, wenn schon das erste Zeichen nicht passt. Die Kategorie
+# markiert eine leere Gruppe am Ende des Asts (m.lastgroup). Bei "name" wird
+# nur die Gruppe "who" maskiert, die Einleitung bleibt stehen.
+# E-Mail beginnt nur am Anfang eines [\w.+-]-Laufs: "@" liegt nicht in der
+# Klasse, ein späterer Start im selben Lauf kann also nicht mehr treffen.
+# Titel vor dem Namen bleiben stehen ("Herr Dr. [name]"); der Name selbst
+# darf kein Titel sein, sonst träfe ein zweiter Durchlauf "Dr" als Namen.
+_TITLE = r"(?:(?:[Dd]r|[Pp]rof)\.? |med\. |Dipl\.-[A-ZÄÖÜa-zäöüß]+\.? )*"
+_NOT_TITLE = r"(?!(?:[Dd]r|[Pp]rof|Dipl)\b|med\.)"
+_NAME = rf"{_TITLE}(?P<who>{_NOT_TITLE}(?:{_UPPER_WORD}|[a-zäöüß]+)(?: {_UPPER_WORD})?)"
+_UPPER_NAME = rf"{_TITLE}(?P<who>{_NOT_TITLE}{_UPPER_WORD}(?: {_UPPER_WORD})?)"
+_PATTERNS: List[Tuple[str, str]] = [
+    ("email", r"(?<![.+-])[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,}"),
+    ("iban", r"[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b"),
+    ("iban", r"[Dd][Ee]\d{2}(?: ?\d{4}){4} ?\d{2}\b"),
+    ("datum", r"\d\d?[./-]\d\d?[./-](?:19|20)?\d\d\b"),
+    ("datum", r"[12]\d{3}-[01]\d-[0-3]\d\b"),
+    ("datum", rf"\d\d?\.? ?(?i:{_MONTHS})\.? (?:19|20)\d\d\b"),
+    ("datum", r"[Gg]eb(?:oren(?: (?:am|im|in))?|\.) ?(?:19|20)\d\d\b"),
+    ("datum", r"[Jj]ahrgang ?(?:19|20)\d\d\b"),
+    ("telefon", r"\+\d[\d \t/()-]{7,}\d\b"),
+    ("telefon", r"\d[\d \t/()-]{7,}\d\b"),
+    # Straße + Hausnummer (+ PLZ Ort); der Lookahead verwirft Wörter ohne folgende Zahl
+    ("adresse",
+     rf"{_W}(?=[\w.-]*? ?\d)"
+     rf"(?:(?<=[A-ZÄÖÜ]){_W}*(?:weg|ring|damm|platz|ufer|allee|gasse|chaussee|pfad|steig)"
+     r"|[\w-]*(?:[Ss]traße|[Ss]trasse|[Ss]tr\.))"
+     r" ?\d{1,4}(?: ?[a-zA-Z](?!\w)|\b)(?:,? ?\d{5} [A-ZÄÖÜa-zäöüß][\w-]*)?"),
+    # Namen nur nach eindeutiger Einleitung
+    ("name", rf"[Ii]ch hei(?:ß|ss)e {_NAME}"),
+    ("name", rf"[Mm]ein [Nn]ame ist {_NAME}"),
+    ("name", rf"[Nn]ame ?: {_NAME}"),
+    ("name", rf"(?:Herr|Hr\.|Frau|Fr\.) {_UPPER_NAME}"),
+    ("name", rf"(?:Grüße|Gruß|Gruss|LG|VG|MfG),? {_UPPER_NAME}"),
+    ("gesundheit", r"[Oo][Pp]s?(?!\w)"),  # "OP", "Herz-OP", nicht "optimal"
+] + [("gesundheit", branch + r"[\w-]*") for branch in _trie_branches(HEALTH_STEMS)] + [
+    ("gesundheit", branch + r"(?!\w)") for branch in _trie_branches(HEALTH_WORDS)
+]
+
+_CATEGORY = {f"_{i}": category for i, (category, _) in enumerate(_PATTERNS)}
+
+_WHO = {f"_{i}": f"who{i}" for i, (_, rx) in enumerate(_PATTERNS) if "(?P<who>" in rx}
+
+# Alle Kategorien außer Namen und Gesundheit brauchen eine Ziffer bzw. ein "@".
+# Fehlen beide (die meisten Fragen), reicht ein kleinerer Ausdruck ohne die
+# Äste für E-Mail und Adresse, die sonst jedes Wort bis zum Ende abtasten.
+_WORD_CATEGORIES = ("name", "gesundheit")
+_NEEDS_FULL = re.compile(r"[\d@]")
+
+
+def _source(word_only: bool) -> str:
+    # Alle Muster beginnen an einem Wortanfang: das gemeinsame (?<!\w) verwirft
+    # Positionen mitten im Wort mit einer einzigen Prüfung. Gruppennamen bleiben
+    # in beiden Ausdrücken gleich (_CATEGORY, _WHO).
+    return r"(?<!\w)(?:" + "|".join(
+        rx.replace("(?P<who>", f"(?P<who{i}>") + f"(?P<_{i}>)"
+        for i, (category, rx) in enumerate(_PATTERNS)
+        if not word_only or category in _WORD_CATEGORIES
+    ) + ")"
+
+
+_PII: "Optional[Tuple[re.Pattern[str], re.Pattern[str]]]" = None
+
+
+def _pattern(text: str) -> "re.Pattern[str]":
+    """Passender Ausdruck für `text`; kompiliert beim ersten Aufruf statt beim Import."""
+    global _PII
+    if _PII is None:
+        _PII = (re.compile(_source(False)), re.compile(_source(True)))
+    return _PII[0] if _NEEDS_FULL.search(text) else _PII[1]
+
+
+# =========================================================
+# MASKIEREN
+# =========================================================
+def _mask(m: "re.Match[str]", marker: str) -> str:
+    who = _WHO.get(marker)
+    if who is None:
+        return f"[{_CATEGORY[marker]}]"
+    return m.string[m.start():m.start(who)] + "[name]"
+
+
+class _Counter:
+    """Ersetzungs-Callback für re.sub, zählt die Treffer pro Kategorie mit."""
+
+    __slots__ = ("counts",)
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+
+    def __call__(self, m: "re.Match[str]") -> str:
+        marker = m.lastgroup
+        category = _CATEGORY[marker]
+        self.counts[category] = self.counts.get(category, 0) + 1
+        return _mask(m, marker)
+
+
+def scrub(text: str) -> Tuple[str, Dict[str, int]]:
+    """Maskierter Text und Treffer pro Kategorie (nur Kategorien mit Treffern)."""
+    counter = _Counter()
+    return _pattern(text).sub(counter, text), counter.counts
+
+
+def scrub_text(text: str) -> str:
+    """Nur der maskierte Text (ohne Zählung)."""
+    return _pattern(text).sub(lambda m: _mask(m, m.lastgroup), text)
+
+
+LOG_TEXT_MAX = 800        # Zeichen pro Log-Eintrag
+_SCRUB_WINDOW = 900       # erst maskieren, dann kürzen: keine angeschnittene E-Mail am Ende
+
+
+_HEALTH_MASK = "[gesundheit]"
+
+
+def sanitize_for_log(text: str, intent: Optional[str] = None) -> str:
+    """
+    Minimales Hardening:
+    - Länge begrenzen (verhindert Abuse)
+    - personenbezogene Daten maskieren (alle Kategorien aus PII_CATEGORIES)
+    - Fragen mit einem Intent aus HEALTH_INTENTS ganz maskieren
+    """
+    if intent in HEALTH_INTENTS:
+        return _HEALTH_MASK
+    t = (text or "").strip()
+    return scrub_text(t[:_SCRUB_WINDOW])[:LOG_TEXT_MAX]
+
+
+def scrub_row(text: str, intent: Optional[str] = None) -> Tuple[str, Dict[str, int]]:
+    """scrub() für eine gespeicherte Frage samt Intent (scrub_log.py), idempotent."""
+    if intent in HEALTH_INTENTS:
+        return _HEALTH_MASK, ({"gesundheit": 1} if text != _HEALTH_MASK else {})
+    return scrub(text)
+
+
+# =========================================================
+# STREAMING (JSONL-Logs)
+# =========================================================
+def count_hits(counts: Dict[str, int], hits: Dict[str, int]) -> None:
+    """Schreibt `counts` fort: "lines", "changed" und Treffer pro Kategorie."""
+    counts["lines"] = counts.get("lines", 0) + 1
+    if hits:
+        counts["changed"] = counts.get("changed", 0) + 1
+        for category, n in hits.items():
+            counts[category] = counts.get(category, 0) + n
+
+
+def scrub_jsonl_line(line: bytes, counts: Dict[str, int]) -> bytes:
+    """
+    Maskiert das Feld "text" einer Log-Zeile; alle anderen Felder bleiben.
+    Nicht lesbare Zeilen werden als Ganzes maskiert statt verworfen.
+    Unveränderte Zeilen kommen byte-identisch zurück.
+    """
+    if not line.strip():
+        return line
+    eol = b"\n" if line.endswith(b"\n") else b""
+    try:
+        row = json.loads(line)
+        if not isinstance(row, dict):
+            raise ValueError("keine JSON-Zeile")
+    except ValueError:
+        text, hits = scrub(line.decode("utf-8", "replace").rstrip("\n"))
+        out = text.encode("utf-8") + eol if hits else line
+    else:
+        text, hits = scrub_row(str(row.get("text", "")), row.get("intent"))
+        if hits:
+            row["text"] = text
+            out = json.dumps(row, ensure_ascii=False).encode("utf-8") + eol
+        else:
+            out = line
+    count_hits(counts, hits)
+    return out
+
+
+def scrub_jsonl(src: BinaryIO, dst: BinaryIO) -> Dict[str, int]:
+    """Filtert `src` zeilenweise nach `dst`; liefert Zeilen, geänderte Zeilen und Treffer."""
+    counts: Dict[str, int] = {}
+    for line in src:
+        dst.write(scrub_jsonl_line(line, counts))
+    return counts
@@ -0,0 +1,1869 @@
+"""
+PTC Online-Beratung – Persistenz: Gesamt-Statistik und Fragen-Log.
+
+Ohne Streamlit-Abhängigkeit; die Objekte sind prozessweit (Modul-Singletons)
+und überleben damit die Reruns des Streamlit-Skripts.
+"""
+import re
+import io
+import os
+import gzip
+import hashlib
+import json
+import time
+import heapq
+import atexit
+import struct
+import sqlite3
+import weakref
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread, local
+from typing import Optional, List, Dict, Tuple, Iterator, BinaryIO, Callable
+
+try:
+    import zstandard  # optional: kompaktere Log-Segmente
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl  # Shared-Memory-Zähler nur auf POSIX
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    fcntl = shared_memory = None
+
+from ptc_core import INTENT_NAME_MAX_BYTES, IntentRouter, normalize
+from ptc_metrics import TimedLock
+from ptc_pii import sanitize_for_log  # maskiert jede Frage im Writer-Thread, nie im Request
+
+
+# =========================================================
+# GLOBAL STATS (für alle Nutzer) – einfache Gesamtauswertung
+# =========================================================
+STATS_FILE = "ptc_global_stats.json"
+STATS_JOURNAL = "ptc_global_stats.journal"
+
+# Write-behind: Zählungen landen zuerst im Speicher, ein Hintergrund-Thread
+# schreibt sie als Delta ins Journal (append-only) und regelmäßig als
+# kompakten Snapshot. Mit False wird – wie früher – bei jedem Event gespeichert.
+STATS_WRITE_BEHIND = True
+STATS_FLUSH_INTERVAL = 5.0   # Sekunden zwischen zwei Flushes
+STATS_FLUSH_EVERY = 100      # spätestens nach so vielen Events flushen
+STATS_SNAPSHOT_EVERY = 12    # jeder n-te Flush schreibt einen Snapshot
+
+
+def _apply_stats_delta(data: Dict[str, object], delta: Dict[str, object]) -> None:
+    intents = data["intents"]
+    for name, n in delta.get("intents", {}).items():
+        intents[name] = int(intents.get(name, 0)) + int(n)
+    data["fallback"] = int(data.get("fallback", 0)) + int(delta.get("fallback", 0))
+
+
+def _load_global_stats() -> Dict[str, object]:
+    data: Dict[str, object] = {"intents": {}, "fallback": 0, "updated_at": None}
+    if os.path.exists(STATS_FILE):
+        try:
+            with open(STATS_FILE, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+            if "intents" not in loaded or "fallback" not in loaded:
+                raise ValueError("Invalid stats shape")
+            data = loaded
+        except Exception:
+            pass
+
+    # Deltas nach dem letzten Snapshot nachspielen (z. B. nach einem Absturz)
+    seq = int(data.get("journal_seq", 0))
+    if os.path.exists(STATS_JOURNAL):
+        with open(STATS_JOURNAL, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    delta = json.loads(line)
+                    if int(delta["seq"]) <= seq:
+                        continue
+                    _apply_stats_delta(data, delta)
+                    seq = int(delta["seq"])
+                except Exception:
+                    continue  # abgeschnittene letzte Zeile
+    data["journal_seq"] = seq
+    return data
+
+
+def _save_global_stats(data: Dict[str, object]) -> None:
+    data["updated_at"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    _write_stats_snapshot(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+
+
+def _write_stats_snapshot(payload: str) -> None:
+    tmp = STATS_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, STATS_FILE)
+
+
+class GlobalStatsStore:
+    """
+    Prozessweite Gesamt-Statistik. Im Write-behind-Modus hält der Request-Pfad
+    den Lock nur für das Hochzählen im Speicher; Journal/Snapshot schreibt der
+    Flusher-Thread (Intervall, nach N Events und beim Beenden via atexit).
+    """
+
+    def __init__(self, write_behind: bool = STATS_WRITE_BEHIND):
+        self.lock = TimedLock("stats")
+        self.data = _load_global_stats()
+        self.write_behind = write_behind
+        self._seq = int(self.data["journal_seq"])
+        self._pending: Dict[str, object] = {"intents": {}, "fallback": 0}
+        self._pending_events = 0
+        self._flushes = 0
+        self._io_lock = Lock()
+        self._wake = Event()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self.phrases: Optional["FallbackPhrases"] = None  # wird mit jedem Snapshot gespeichert
+        if write_behind:
+            self._thread = Thread(target=self._run, name="ptc-stats-flusher", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def inc_intent(self, name: str) -> None:
+        with self.lock:
+            intents = self.data["intents"]
+            intents[name] = int(intents.get(name, 0)) + 1
+            pending = self._pending["intents"]
+            pending[name] = pending.get(name, 0) + 1
+            self._after_inc()
+
+    def inc_fallback(self) -> None:
+        with self.lock:
+            self.data["fallback"] = int(self.data.get("fallback", 0)) + 1
+            self._pending["fallback"] = int(self._pending["fallback"]) + 1
+            self._after_inc()
+
+    def _after_inc(self) -> None:
+        # Aufruf nur mit gehaltenem self.lock
+        if not self.write_behind:
+            self._pending = {"intents": {}, "fallback": 0}
+            _save_global_stats(self.data)
+            if self.phrases is not None and self.phrases.dirty:
+                save_fallback_phrases(self.phrases)
+            return
+        self._pending_events += 1
+        if self._pending_events >= STATS_FLUSH_EVERY:
+            self._wake.set()
+
+    def snapshot(self) -> Dict[str, object]:
+        with self.lock:
+            return json.loads(json.dumps(self.data))
+
+    def flush(self, force_snapshot: bool = False) -> None:
+        with self._io_lock:
+            with self.lock:
+                if not self._pending_events and not force_snapshot:
+                    return
+                delta = self._pending
+                events = self._pending_events
+                self._pending = {"intents": {}, "fallback": 0}
+                self._pending_events = 0
+                if events:
+                    self._seq += 1
+                    delta["seq"] = self._seq
+                self._flushes += 1
+                self.data["updated_at"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+                self.data["journal_seq"] = self._seq
+                payload = None
+                if force_snapshot or self._flushes % STATS_SNAPSHOT_EVERY == 0:
+                    payload = json.dumps(self.data, ensure_ascii=False, separators=(",", ":"))
+
+            if events:
+                with open(STATS_JOURNAL, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(delta, ensure_ascii=False, separators=(",", ":")) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            if payload is not None:
+                _write_stats_snapshot(payload)
+                # alles bis journal_seq steckt jetzt im Snapshot
+                open(STATS_JOURNAL, "w", encoding="utf-8").close()
+                if self.phrases is not None and self.phrases.dirty:
+                    save_fallback_phrases(self.phrases)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(STATS_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # nächster Versuch im nächsten Intervall; Daten bleiben im Speicher
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=STATS_FLUSH_INTERVAL)
+        self.flush(force_snapshot=True)
+
+
+# =========================================================
+# GLOBAL STATS – prozessübergreifend über Shared Memory
+# =========================================================
+# Eine Zählertabelle in multiprocessing.shared_memory, die sich alle Prozesse
+# teilen, die dieselbe STATS_FILE nutzen. Jeder Thread schreibt in eine eigene
+# Zeile ("Stripe") – ein += auf einem memoryview, ohne Lock und ohne Syscall.
+# Stripes sind Teilsummen: sie werden nie geleert, nur summiert, und nach dem
+# Ende eines Threads bzw. Prozesses an den nächsten weitergegeben. Zeile 0 hält
+# den Stand aus der Datei beim Anlegen der Tabelle. Ein gewählter Prozess
+# schreibt die Summe regelmäßig als Snapshot nach STATS_FILE. Dateisperren
+# (fcntl) gibt es nur beim Anmelden, Abmelden und für neue Intent-Namen.
+# Namen, die nicht in die Tabelle passen (voll oder zu lang), zählt jeder
+# Prozess lokal; in den Snapshot kommen davon nur die des schreibenden Prozesses.
+STATS_SHARED_MEMORY = True
+SHARED_MAX_SLOTS = 256          # Intent-Namen (+ fallback) pro Tabelle
+SHARED_MAX_STRIPES = 64         # gleichzeitig schreibende Threads über alle Prozesse
+SHARED_NAME_BYTES = INTENT_NAME_MAX_BYTES  # längere Namen lehnt schon parse_knowledge ab
+_SHARED_MAGIC = 0x50544353_54415431  # "PTCSTAT1"
+_HDR_WORDS = 4                  # magic, belegte Slots, journal_seq, reserviert
+
+
+def _shared_layout() -> Tuple[int, int, int, int]:
+    """Offsets (in 8-Byte-Worten) von Namen, Besitzern, Zählern und die Gesamtgröße."""
+    names = _HDR_WORDS
+    owners = names + SHARED_MAX_SLOTS * SHARED_NAME_BYTES // 8
+    counters = owners + SHARED_MAX_STRIPES
+    return names, owners, counters, counters + SHARED_MAX_STRIPES * SHARED_MAX_SLOTS
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Stripe:
+    """Zeile eines Threads; gibt sie beim Aufräumen des thread-lokalen Speichers zurück."""
+
+    __slots__ = ("base", "_pool")
+
+    def __init__(self, base: int, pool: List[int]):
+        self.base = base
+        self._pool = pool
+
+    def __del__(self):
+        self._pool.append(self.base)
+
+
+class SharedStatsStore:
+    """
+    Gleiche Schnittstelle wie GlobalStatsStore (inc_intent, inc_fallback,
+    snapshot, flush, close), aber mit einer Tabelle für alle Prozesse.
+    """
+
+    def __init__(self):
+        self.phrases: Optional["FallbackPhrases"] = None  # speichert der Snapshot-Prozess mit
+        self._lock_file = open(STATS_FILE + ".lock", "a+b")
+        self._names_off, self._owners_off, self._counters_off, words = _shared_layout()
+        shm_name = "ptc_stats_" + hashlib.sha1(os.path.abspath(STATS_FILE).encode("utf-8")).hexdigest()[:16]
+        self._reset_process_state()
+
+        with self._file_lock():
+            try:
+                self._shm = shared_memory.SharedMemory(shm_name, create=True, size=words * 8)
+                created = True
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(shm_name)
+                created = False
+            # der resource_tracker würde die Tabelle beim Ende *dieses* Prozesses löschen
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+            self._words = self._shm.buf.cast("Q")
+            if created or self._words[0] != _SHARED_MAGIC:
+                self._init_table(_load_global_stats())
+            self._load_names()
+            self._pool.append(self._claim_stripe_locked())  # meldet den Prozess an
+
+        self._start_thread()
+        atexit.register(self.close)
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._after_fork())
+
+    def _reset_process_state(self) -> None:
+        self._local_lock = Lock()        # fcntl-Sperren gelten pro Prozess, nicht pro Thread
+        self._slots: Dict[str, int] = {}
+        self._overflow: Dict[str, int] = {}  # Namen ohne Slot, nur in diesem Prozess gezählt
+        self._overflow_lock = Lock()     # nicht _local_lock: close() summiert unter _file_lock()
+        self._pool: List[int] = []       # freie Stripes dieses Prozesses (Zeilen-Offsets)
+        self._stripes: List[int] = []    # alle Stripes dieses Prozesses
+        self._tls = local()
+        self._leader = False
+        self._last_total = -1
+
+    def _start_thread(self) -> None:
+        self._wake = Event()
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="ptc-stats-snapshot", daemon=True)
+        self._thread.start()
+
+    def _after_fork(self) -> None:
+        # Stripes und Sperren gehören dem Elternprozess -> im Kind neu anmelden
+        if self._words is None:
+            return
+        slots = self._slots
+        self._reset_process_state()
+        self._slots = slots
+        with self._file_lock():
+            self._pool.append(self._claim_stripe_locked())
+        self._start_thread()
+
+    # ---- Sperren / Tabelle ----
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with self._local_lock:
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX, 1, 0)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_file, fcntl.LOCK_UN, 1, 0)
+
+    def _init_table(self, data: Dict[str, object]) -> None:
+        # Aufruf nur unter _file_lock()
+        w = self._words
+        for i in range(1, len(w)):
+            w[i] = 0
+        w[2] = int(data.get("journal_seq", 0))
+        w[self._counters_off + self._slot_locked("fallback")] = int(data.get("fallback", 0))
+        for name, n in dict(data.get("intents", {})).items():
+            slot = self._slot_locked(name)
+            if slot is None:
+                self._overflow[name] = int(n)
+            else:
+                w[self._counters_off + slot] = int(n)
+        w[self._owners_off] = 1  # Zeile 0 = Basis, gehört niemandem
+        w[0] = _SHARED_MAGIC
+
+    def _name_at(self, i: int) -> str:
+        off = self._names_off * 8 + i * SHARED_NAME_BYTES
+        return bytes(self._shm.buf[off:off + SHARED_NAME_BYTES]).rstrip(b"\x00").decode("utf-8", "replace")
+
+    def _load_names(self) -> None:
+        self._slots = {self._name_at(i): i for i in range(int(self._words[1]))}
+
+    def _slot_locked(self, name: str) -> Optional[int]:
+        """Slot für `name` (neu belegt, falls nötig); None, wenn er nicht in die Tabelle passt."""
+        raw = name.encode("utf-8")
+        if len(raw) > SHARED_NAME_BYTES:
+            return None  # gekürzt wäre er beim nächsten Nachschlagen nicht wiederzufinden
+        used = int(self._words[1])
+        for i in range(used):
+            if self._name_at(i) == name:
+                return i
+        if used >= SHARED_MAX_SLOTS:
+            return None
+        off = self._names_off * 8 + used * SHARED_NAME_BYTES
+        self._shm.buf[off:off + len(raw)] = raw
+        self._words[1] = used + 1  # erst nach dem Namen sichtbar machen
+        return used
+
+    def _slot(self, name: str) -> Optional[int]:
+        slot = self._slots.get(name)
+        if slot is None and name not in self._overflow:
+            with self._file_lock():
+                slot = self._slot_locked(name)
+                self._load_names()
+        return slot
+
+    def _claim_stripe_locked(self) -> int:
+        w, pid = self._words, os.getpid()
+        for i in range(1, SHARED_MAX_STRIPES):
+            owner = int(w[self._owners_off + i])
+            if owner == 0 or (owner != pid and not _pid_alive(owner)):
+                w[self._owners_off + i] = pid
+                base = self._counters_off + i * SHARED_MAX_SLOTS
+                self._stripes.append(base)
+                return base
+        raise RuntimeError("keine freie Shared-Stats-Zeile (SHARED_MAX_STRIPES)")
+
+    def _stripe(self) -> int:
+        try:
+            return self._tls.stripe.base
+        except AttributeError:
+            pass
+        try:
+            base = self._pool.pop()
+        except IndexError:
+            with self._file_lock():
+                base = self._claim_stripe_locked()
+        self._tls.stripe = _Stripe(base, self._pool)
+        return base
+
+    # ---- Zählen ----
+    def inc_intent(self, name: str) -> None:
+        slot = self._slots.get(name)
+        if slot is None:
+            slot = self._slot(name)
+            if slot is None:
+                with self._overflow_lock:
+                    self._overflow[name] = self._overflow.get(name, 0) + 1
+                return
+        self._words[self._stripe() + slot] += 1
+
+    def inc_fallback(self) -> None:
+        slot = self._slots.get("fallback")
+        if slot is None:
+            slot = self._slot("fallback")  # "fallback" belegt beim Anlegen immer Slot 0
+        self._words[self._stripe() + slot] += 1
+
+    # ---- Lesen / Snapshot ----
+    def totals(self) -> Tuple[Dict[str, int], int]:
+        """Summe über alle Stripes: (Intents, Fallback)."""
+        w, off = self._words, self._counters_off
+        used = int(w[1])
+        slots = self._slots
+        if max(slots.values(), default=-1) + 1 != used:
+            self._load_names()
+            slots = self._slots
+        used = max(slots.values(), default=-1) + 1  # nie mehr summieren, als Namen bekannt sind
+        sums = [0] * used
+        for i in range(SHARED_MAX_STRIPES):
+            row = off + i * SHARED_MAX_SLOTS
+            for j, v in enumerate(w[row:row + used]):
+                sums[j] += v
+        intents = {name: sums[i] for name, i in slots.items() if name != "fallback" and sums[i]}
+        with self._overflow_lock:
+            for name, n in self._overflow.items():
+                intents[name] = intents.get(name, 0) + n
+        fallback = slots.get("fallback")
+        return intents, sums[fallback] if fallback is not None else 0
+
+    def snapshot(self) -> Dict[str, object]:
+        intents, fallback = self.totals()
+        return {
+            "intents": intents,
+            "fallback": fallback,
+            "updated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        }
+
+    def flush(self, force_snapshot: bool = False) -> None:
+        """Schreibt den Snapshot, wenn sich etwas geändert hat – nur im gewählten Prozess."""
+        if not self._leader:
+            with self._local_lock:
+                try:
+                    # Byte 1 bleibt gesperrt, solange der Prozess lebt
+                    fcntl.lockf(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, 1)
+                except OSError:
+                    return
+            self._leader = True
+        data = self.snapshot()
+        total = sum(data["intents"].values()) + data["fallback"]
+        if total == self._last_total and not force_snapshot:
+            return
+        data["journal_seq"] = int(self._words[2])
+        _write_stats_snapshot(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        # Deltas eines früheren GlobalStatsStore stecken jetzt im Snapshot
+        if os.path.exists(STATS_JOURNAL):
+            open(STATS_JOURNAL, "w", encoding="utf-8").close()
+        self._last_total = total
+        if self.phrases is not None and self.phrases.dirty:
+            save_fallback_phrases(self.phrases)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(STATS_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # nächster Versuch im nächsten Intervall; Zähler liegen im Shared Memory
+
+    def close(self) -> None:
+        """Meldet den Prozess ab; der letzte schreibt den Snapshot und gibt die Tabelle frei."""
+        if self._words is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=STATS_FLUSH_INTERVAL)
+        w, pid = self._words, os.getpid()
+        with self._file_lock():
+            for base in self._stripes:
+                w[self._owners_off + (base - self._counters_off) // SHARED_MAX_SLOTS] = 0
+            last = not any(
+                owner > 1 and owner != pid and _pid_alive(owner)
+                for owner in w[self._owners_off + 1:self._owners_off + SHARED_MAX_STRIPES]
+            )
+            if last or self._leader:
+                self._leader = True
+                self.flush(force_snapshot=True)
+            self._words = None
+            w.release()
+            self._shm.close()
+            if last:
+                resource_tracker.register(self._shm._name, "shared_memory")  # unlink() meldet ab
+                self._shm.unlink()
+        self._lock_file.close()
+
+
+def new_stats_store() -> object:
+    """SharedStatsStore, wenn möglich und aktiviert – sonst GlobalStatsStore."""
+    if STATS_SHARED_MEMORY and shared_memory is not None and STATS_WRITE_BEHIND:
+        return SharedStatsStore()
+    return GlobalStatsStore()
+
+
+# =========================================================
+# FALLBACK-PHRASEN – häufigste n-Gramme ohne Treffer
+# =========================================================
+# Space-Saving pro n-Gramm-Länge: feste Anzahl Zähler, die kleinsten werden
+# verdrängt (Zähler = Obergrenze, Zähler - Fehler = Untergrenze). Gefüttert nur
+# vom Log-Writer mit den maskierten, normalisierten Fallback-Fragen; welche
+# Intents dieselben Phrasen haben, liefert die Volltextsuche (ptc_analytics).
+PHRASES_FILE = "ptc_fallback_phrases.json"
+PHRASES_MAX_N = 3
+PHRASES_CAPACITY = 1000       # Zähler pro n-Gramm-Länge
+PHRASES_MAX_TOKENS = 32       # längere Fragen nur am Anfang auswerten
+PHRASES_STOPWORDS = frozenset((
+    "ich", "du", "sie", "wir", "ihr", "es", "man", "mir", "mich", "euch", "uns",
+    "der", "die", "das", "den", "dem", "des", "ein", "eine", "einen", "einem", "einer",
+    "und", "oder", "aber", "auch", "noch", "nur", "schon", "mal", "ja", "nein", "nicht",
+    "ist", "sind", "bin", "hat", "habe", "haben", "kann", "muss", "gibt", "wird", "war",
+    "in", "im", "an", "am", "auf", "bei", "mit", "zu", "zum", "zur", "fur", "von", "vom", "aus",
+    "was", "wie", "wo", "wann", "wer", "welche", "welcher", "welches", "so", "da", "hier",
+    "bitte", "danke", "hallo", "hi", "moin", "mein", "meine", "euer", "eure", "dein",
+))
+
+
+class _SpaceSaving:
+    """
+    Top-k-Zähler mit fester Größe. Der Heap hält genau einen Eintrag pro Phrase;
+    Erhöhungen aktualisieren ihn nicht – erst wenn ein veralteter Eintrag oben
+    liegt, wird er mit dem aktuellen Zähler neu einsortiert.
+    """
+
+    __slots__ = ("capacity", "counts", "_heap")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, List[int]] = {}   # Phrase -> [Zähler, Fehler]
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, key: str) -> None:
+        counts = self.counts
+        entry = counts.get(key)
+        if entry is not None:
+            entry[0] += 1
+        elif len(counts) < self.capacity:
+            counts[key] = [1, 0]
+            heapq.heappush(self._heap, (1, key))
+        else:
+            heap = self._heap
+            while True:
+                c, victim = heap[0]
+                current = counts[victim][0]
+                if current == c:
+                    break
+                heapq.heapreplace(heap, (current, victim))
+            del counts[victim]
+            counts[key] = [c + 1, c]
+            heapq.heapreplace(heap, (c + 1, key))
+
+    def load(self, counts: Dict[str, List[int]]) -> None:
+        for key, (c, err) in sorted(counts.items(), key=lambda kv: -kv[1][0])[:self.capacity]:
+            self.counts[key] = [int(c), int(err)]
+        self._heap = [(v[0], k) for k, v in self.counts.items()]
+        heapq.heapify(self._heap)
+
+
+class FallbackPhrases:
+    """Prozessweite Heavy-Hitter der Fallback-Fragen (threadsicher, feste Größe)."""
+
+    def __init__(self, capacity: int = PHRASES_CAPACITY, max_n: int = PHRASES_MAX_N):
+        self.lock = TimedLock("phrases")
+        self.max_n = max_n
+        self.summaries = [_SpaceSaving(capacity) for _ in range(max_n)]
+        self.fallbacks = 0
+        self.dirty = False
+
+    def ngrams(self, tokens: List[str]) -> List[List[str]]:
+        """Pro Länge 1..max_n die n-Gramme einer Frage (ohne Stoppwort am Rand, je einmal)."""
+        tokens = tokens[:PHRASES_MAX_TOKENS]
+        keep = [t not in PHRASES_STOPWORDS for t in tokens]
+        out = [list(dict.fromkeys([t for t, k in zip(tokens, keep) if k]))]
+        for n in range(2, self.max_n + 1):
+            out.append(list(dict.fromkeys([
+                " ".join(gram)
+                for gram, first, last in zip(zip(*(tokens[i:] for i in range(n))), keep, keep[n - 1:])
+                if first and last
+            ])))
+        return out
+
+    def observe_text(self, text: str) -> None:
+        """Eine (schon maskierte) Fallback-Frage, zerlegt wie im Routing."""
+        self.observe(IntentRouter.tokenize(normalize(text)))
+
+    def observe(self, tokens: List[str]) -> None:
+        grams = self.ngrams(tokens)
+        with self.lock:
+            self.fallbacks += 1
+            for summary, phrases in zip(self.summaries, grams):
+                for phrase in phrases:
+                    summary.add(phrase)
+            self.dirty = True
+
+    def top(self, n: int, limit: int = 20) -> List[Dict[str, object]]:
+        with self.lock:
+            items = sorted(self.summaries[n - 1].counts.items(), key=lambda kv: (-kv[1][0], kv[0]))[:limit]
+        return [{"phrase": phrase, "count": c, "error": err} for phrase, (c, err) in items]
+
+    def to_json(self) -> str:
+        with self.lock:
+            self.dirty = False
+            return json.dumps({
+                "max_n": self.max_n,
+                "fallbacks": self.fallbacks,
+                "ngrams": [s.counts for s in self.summaries],
+                "updated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            }, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, payload: Optional[str]) -> "FallbackPhrases":
+        phrases = cls()
+        if payload:
+            try:
+                data = json.loads(payload)
+                for summary, counts in zip(phrases.summaries, data["ngrams"]):
+                    summary.load(counts)
+                phrases.fallbacks = int(data.get("fallbacks", 0))
+            except Exception:
+                phrases = cls()  # kaputt -> leer starten, lässt sich aus dem Log neu aufbauen
+        return phrases
+
+    def replace(self, other: "FallbackPhrases") -> None:
+        """Übernimmt den Stand von `other` (z. B. nach einem Neuaufbau aus dem Log)."""
+        with self.lock:
+            self.summaries, self.fallbacks = other.summaries, other.fallbacks
+            self.dirty = True
+
+
+def load_fallback_phrases(path: str = PHRASES_FILE) -> FallbackPhrases:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return FallbackPhrases.from_json(f.read())
+    except OSError:
+        return FallbackPhrases()
+
+
+def save_fallback_phrases(phrases: FallbackPhrases, path: str = PHRASES_FILE) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(phrases.to_json())
+    os.replace(tmp, path)
+
+
+# =========================================================
+# LOGGING – ALLE FRAGEN (global)
+# =========================================================
+QUESTIONS_LOG = "ptc_questions_log.jsonl"
+
+
+# Sparse-Offset-Index (Sidecar): für jede LOG_INDEX_EVERY-te Zeile ein
+# Datensatz fester Länge (Zeilennummer, Byte-Offset, ts). Der Writer-Thread
+# hängt neue Datensätze beim Schreiben an; Leser springen per seek() direkt
+# an die passende Stelle statt die ganze Datei zu parsen.
+QUESTIONS_LOG_INDEX = "ptc_questions_log.idx"
+LOG_INDEX_EVERY = 256
+_INDEX_REC = struct.Struct("<QQ20s")
+
+
+class LogIndex:
+    def __init__(self, log_path: str = QUESTIONS_LOG, index_path: str = QUESTIONS_LOG_INDEX):
+        self.log_path = log_path
+        self.index_path = index_path
+
+    # --- Lesen -------------------------------------------------------
+    def _count(self) -> int:
+        try:
+            return os.path.getsize(self.index_path) // _INDEX_REC.size
+        except OSError:
+            return 0
+
+    def _record(self, f, i: int) -> Tuple[int, int, str]:
+        f.seek(i * _INDEX_REC.size)
+        line_no, offset, ts = _INDEX_REC.unpack(f.read(_INDEX_REC.size))
+        return line_no, offset, ts.rstrip(b"\0").decode("ascii")
+
+    def _last_record(self) -> Tuple[int, int]:
+        n = self._count()
+        if not n:
+            return 0, 0
+        with open(self.index_path, "rb") as f:
+            line_no, offset, _ = self._record(f, n - 1)
+        return line_no, offset
+
+    def line_count(self) -> int:
+        """Anzahl vollständiger Zeilen (liest nur ab dem letzten Index-Punkt)."""
+        line_no, offset = self._last_record()
+        with open(self.log_path, "rb") as f:
+            f.seek(offset)
+            for chunk in iter(lambda: f.read(65536), b""):
+                line_no += chunk.count(b"\n")
+        return line_no
+
+    def offset_of_line(self, target: int) -> int:
+        """Byte-Offset, an dem Zeile `target` (0-basiert) beginnt."""
+        i = target // LOG_INDEX_EVERY
+        line_no, offset = 0, 0
+        if i and self._count():
+            with open(self.index_path, "rb") as f:
+                line_no, offset, _ = self._record(f, min(i, self._count() - 1))
+        with open(self.log_path, "rb") as f:
+            f.seek(offset)
+            while line_no < target:
+                line = f.readline()
+                if not line:
+                    break
+                offset += len(line)
+                line_no += 1
+        return offset
+
+    def offset_after_ts(self, ts: str) -> Optional[int]:
+        """Offset des ersten Index-Punkts mit ts > `ts` (None = Dateiende)."""
+        lo, hi = 0, self._count()
+        if not hi:
+            return None
+        with open(self.index_path, "rb") as f:
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._record(f, mid)[2] <= ts:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return self._record(f, lo)[1] if lo < self._count() else None
+
+    # --- Schreiben (nur Writer-Thread) -------------------------------
+    def sync(self) -> Tuple[int, int]:
+        """
+        Prüft den Index gegen das Log (baut ihn notfalls in einem Durchlauf
+        neu auf) und liefert (Zeilenanzahl, Dateigröße) für weitere Appends.
+        """
+        if not os.path.exists(self.log_path):
+            open(self.index_path, "wb").close()
+            return 0, 0
+        size = os.path.getsize(self.log_path)
+        n = self._count()
+        valid = False
+        if n:
+            with open(self.index_path, "rb") as f:
+                _, offset, _ = self._record(f, n - 1)
+            if offset < size:
+                with open(self.log_path, "rb") as f:
+                    f.seek(max(offset - 1, 0))
+                    valid = offset == 0 or f.read(1) == b"\n"
+        if valid:
+            os.truncate(self.index_path, n * _INDEX_REC.size)  # halber Datensatz
+        else:
+            self.rebuild()
+        return self.line_count(), size
+
+    def rebuild(self) -> None:
+        with open(self.log_path, "rb") as log, open(self.index_path + ".tmp", "wb") as out:
+            offset = 0
+            for line_no, line in enumerate(log):
+                if line_no % LOG_INDEX_EVERY == 0:
+                    row = _parse_log_line(line) or {}
+                    out.write(self.pack(line_no, offset, str(row.get("ts", ""))))
+                offset += len(line)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    @staticmethod
+    def pack(line_no: int, offset: int, ts: str) -> bytes:
+        return _INDEX_REC.pack(line_no, offset, ts.encode("ascii", "replace")[:20])
+
+
+# Rotation: das aktive Log wird ab LOG_ROTATE_BYTES bzw. beim Tageswechsel
+# in ein komprimiertes Segment verschoben (zstd, falls installiert, sonst gzip).
+# Das Manifest listet die Segmente (älteste zuerst) mit ts-Spanne und Zeilen.
+# Segmente bestehen aus unabhängig lesbaren Blöcken (je ein gzip-Member bzw.
+# zstd-Frame ab einer Zeilengrenze); "blocks" im Manifest hält pro Block
+# [unkomprimierter, komprimierter Offset], damit read_refs() einzelne Zeilen
+# liest, ohne das Segment von vorn zu entpacken.
+LOG_SEGMENT_DIR = "ptc_log_segments"
+LOG_MANIFEST = os.path.join(LOG_SEGMENT_DIR, "manifest.json")
+LOG_ROTATE_BYTES = 64 * 1024 * 1024   # 0 = keine größenbasierte Rotation
+LOG_ROTATE_DAILY = True
+LOG_COMPRESSION = "zstd" if zstandard is not None else "gzip"
+LOG_BLOCK_BYTES = 256 * 1024          # unkomprimiert pro Block
+LOG_REF_SHIFT = 40                    # Referenz = Segment-Nr. << 40 | Byte-Offset der Zeile
+
+
+def load_log_manifest() -> List[Dict[str, object]]:
+    try:
+        with open(LOG_MANIFEST, "r", encoding="utf-8") as f:
+            segments = json.load(f)
+        return segments if isinstance(segments, list) else []
+    except Exception:
+        return []
+
+
+def _save_log_manifest(segments: List[Dict[str, object]]) -> None:
+    tmp = LOG_MANIFEST + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(segments, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, LOG_MANIFEST)
+
+
+def _open_segment(entry: Dict[str, object], offset: int = 0) -> BinaryIO:
+    """Entpackt ein Segment ab dem komprimierten `offset` (Blockanfang) bis zum Ende."""
+    path = os.path.join(LOG_SEGMENT_DIR, str(entry["file"]))
+    if entry.get("codec") == "zstd" and zstandard is None:
+        raise RuntimeError(f"{path}: zstandard ist nicht installiert")
+    raw = open(path, "rb")
+    raw.seek(offset)
+    if entry.get("codec") == "zstd":
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader)
+    f = gzip.GzipFile(fileobj=raw, mode="rb")
+    f.myfileobj = raw  # wie gzip.open(): close() schließt auch die Datei
+    return f
+
+
+def _iter_segment_lines(entry: Dict[str, object]) -> Iterator[bytes]:
+    with _open_segment(entry) as f:
+        for line in f:
+            if line.strip():
+                yield line.rstrip(b"\n")
+
+
+def _segment_writer(raw: BinaryIO, codec: str) -> BinaryIO:
+    """Komprimierender Writer über `raw` (bleibt offen) im Codec eines Segments."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard ist nicht installiert")
+        return zstandard.ZstdCompressor(level=6).stream_writer(raw, closefd=False)
+    return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+
+
+class SegmentBlockWriter:
+    """
+    Schreibt JSONL gestreamt als Segment aus Blöcken: nach je LOG_BLOCK_BYTES
+    beginnt an der nächsten Zeilengrenze ein neuer gzip-Member bzw. zstd-Frame.
+    `blocks` ist danach der Manifest-Eintrag dazu.
+    """
+
+    def __init__(self, raw: BinaryIO, codec: str):
+        self.raw = raw
+        self.codec = codec
+        self.blocks: List[List[int]] = []
+        self.pos = 0  # unkomprimiert geschriebene Bytes
+        self._out: Optional[BinaryIO] = None
+
+    def write(self, data: bytes) -> int:
+        view = memoryview(data)
+        while view:
+            if self._out is None:
+                self.blocks.append([self.pos, self.raw.tell()])
+                self._out = _segment_writer(self.raw, self.codec)
+            room = self.blocks[-1][0] + LOG_BLOCK_BYTES - self.pos
+            cut = -1 if len(view) <= room else bytes(view[max(room - 1, 0):]).find(b"\n")
+            if cut < 0:
+                self._out.write(view)
+                self.pos += len(view)
+                break
+            cut += max(room - 1, 0) + 1
+            self._out.write(view[:cut])
+            self.pos += cut
+            self._end_block()
+            view = view[cut:]
+        return len(data)
+
+    def _end_block(self) -> None:
+        if self._out is not None:
+            self._out.close()  # schließt nur Member/Frame, `raw` bleibt offen
+            self._out = None
+
+    def close(self) -> None:
+        self._end_block()
+
+    def __enter__(self) -> "SegmentBlockWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _compress_log_file(src: str, seq: int) -> Dict[str, object]:
+    """Komprimiert `src` gestreamt in ein neues Segment und liefert den Manifest-Eintrag."""
+    with open(src, "rb") as f:
+        first = _parse_log_line(f.readline()) or {}
+    last: Dict[str, object] = {}
+    for line in _reverse_lines(src):
+        last = _parse_log_line(line) or {}
+        break
+    first_ts = str(first.get("ts", ""))
+    stamp = re.sub(r"\D", "", first_ts)[:14] or datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    ext = "zst" if LOG_COMPRESSION == "zstd" else "gz"
+    name = f"ptc_questions_log-{seq:06d}-{stamp}.jsonl.{ext}"
+    dst = os.path.join(LOG_SEGMENT_DIR, name)
+
+    lines = 0
+    with open(src, "rb") as fin, open(dst + ".tmp", "wb") as raw:
+        with SegmentBlockWriter(raw, LOG_COMPRESSION) as out:
+            for chunk in iter(lambda: fin.read(1024 * 1024), b""):
+                lines += chunk.count(b"\n")
+                out.write(chunk)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(dst + ".tmp", dst)
+    return {
+        "file": name,
+        "codec": LOG_COMPRESSION,
+        "first_ts": first_ts,
+        "last_ts": str(last.get("ts", first_ts)),
+        "lines": lines,
+        "bytes": os.path.getsize(src),
+        "blocks": out.blocks,
+    }
+
+
+def rotate_questions_log(path: str = QUESTIONS_LOG, index_path: str = QUESTIONS_LOG_INDEX) -> None:
+    """
+    Verschiebt das aktive Log in ein Segment. Nur aus dem Writer-Thread bzw.
+    bei gestopptem Logger aufrufen. Eine unterbrochene Rotation (.rotating)
+    wird beim nächsten Aufruf abgeschlossen.
+    """
+    os.makedirs(LOG_SEGMENT_DIR, exist_ok=True)
+    rotating = path + ".rotating"
+    if not os.path.exists(rotating):
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return
+        os.replace(path, rotating)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    segments = load_log_manifest()
+    segments.append(_compress_log_file(rotating, len(segments) + 1))
+    _save_log_manifest(segments)
+    os.remove(rotating)
+
+
+# Asynchrones Logging: der Request-Pfad legt nur ein Tupel in die Queue,
+# ein Writer-Thread maskiert, bündelt und schreibt über ein offenes Handle.
+LOG_QUEUE_SIZE = 10000
+LOG_QUEUE_FULL = "drop"      # "drop" = verwerfen & zählen, "block" = warten
+LOG_BATCH_SIZE = 500         # max. Einträge pro write()
+LOG_FSYNC = "interval"       # "always" (jeder Batch), "interval" oder "never"
+LOG_FSYNC_INTERVAL = 2.0     # Sekunden, für LOG_FSYNC = "interval"
+
+
+class BatchWriter:
+    """
+    Hintergrund-Writer mit begrenzter Queue. Unterklassen implementieren
+    `_write_batch(entries)` (läuft im Writer-Thread unter `self.lock`) und
+    `_close_resources()`; sie rufen am Ende ihres __init__ `_start()` auf.
+    `counters` enthält written/dropped/errors/batches und Flush-Latenzen (ms),
+    `depth()` die aktuelle Queue-Länge. Nach close() schreibt enqueue()
+    synchron selbst (Ressourcen kurz öffnen, schreiben, schließen) – auch
+    verspätete Aufrufe gehen nicht verloren.
+    """
+
+    def __init__(self, name: str, maxsize: int = LOG_QUEUE_SIZE, on_full: str = LOG_QUEUE_FULL):
+        self.on_full = on_full
+        self.queue: Queue = Queue(maxsize=maxsize)
+        self.lock = TimedLock(name)  # schützt die Writer-Ressourcen (Thread vs. close)
+        self.counters: Dict[str, float] = {
+            "written": 0, "dropped": 0, "errors": 0, "batches": 0,
+            "flush_ms_last": 0.0, "flush_ms_max": 0.0, "flush_ms_total": 0.0,
+        }
+        self._drop_lock = Lock()
+        self._closed = False
+        self._thread = Thread(target=self._run, name=name, daemon=True)
+
+    def _start(self) -> None:
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, item: tuple, block: Optional[bool] = None) -> bool:
+        if self._closed:
+            # z. B. Mandanten-Storage aus dem LRU gefallen, der Aufruf war schon
+            # unterwegs: ohne Writer-Thread selbst schreiben statt verwerfen
+            self._write_closed([item])
+            return True
+        if block if block is not None else self.on_full == "block":
+            self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except Full:
+                with self._drop_lock:
+                    self.counters["dropped"] += 1
+                return False
+        if self._closed:
+            # close() lief zwischen Prüfung und put: der Eintrag liegt evtl. hinter
+            # dem Stopp-Signal. Erst das Thread-Ende abwarten, sonst nähme _drain()
+            # dem Writer das Signal weg.
+            self._thread.join(timeout=5.0)
+            self._drain()
+        return True
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def flush(self) -> None:
+        """Wartet, bis alle bisher eingereihten Einträge geschrieben sind."""
+        self.queue.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            while item is not None and len(batch) < LOG_BATCH_SIZE:
+                try:
+                    item = self.queue.get_nowait()
+                except Empty:
+                    break
+                batch.append(item)
+
+            stop = batch[-1] is None
+            entries = [x for x in batch if x is not None]
+            if entries:
+                self._timed_write(entries)
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _timed_write(self, entries: List[tuple]) -> None:
+        t0 = time.perf_counter()
+        with self.lock:
+            try:
+                self._write_batch(entries)
+            except Exception:
+                self.counters["errors"] += len(entries)
+                self._close_resources()
+                return
+        ms = (time.perf_counter() - t0) * 1000.0
+        c = self.counters
+        c["written"] += len(entries)
+        c["batches"] += 1
+        c["flush_ms_last"] = ms
+        c["flush_ms_max"] = max(c["flush_ms_max"], ms)
+        c["flush_ms_total"] += ms
+
+    def _write_batch(self, entries: List[tuple]) -> None:
+        raise NotImplementedError
+
+    def _close_resources(self) -> None:
+        pass
+
+    def _drain(self) -> None:
+        """Schreibt, was nach dem Stopp-Signal noch in der Queue liegt."""
+        entries = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Empty:
+                break
+            if item is not None:
+                entries.append(item)
+            self.queue.task_done()
+        if entries:
+            self._write_closed(entries)
+
+    def _write_closed(self, entries: List[tuple]) -> None:
+        """Schreiben nach close(): Ressourcen öffnen, schreiben und gleich wieder schließen."""
+        self._timed_write(entries)
+        with self.lock:
+            self._close_resources()
+
+    def close(self) -> None:
+        self._closed = True
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=5.0)
+        self._drain()
+        with self.lock:
+            self._close_resources()
+
+
+def _observe_fallbacks(phrases: Optional[FallbackPhrases], rows: Iterator[Tuple[str, str]]) -> None:
+    """Fallback-Phrasen aus (Intent, maskierter Text) – zählt, was auch im Log steht."""
+    if phrases is not None:
+        for intent, text in rows:
+            if intent == "fallback":
+                phrases.observe_text(text)
+
+
+class QuestionLogger(BatchWriter):
+    """Schreibt QUESTIONS_LOG (+ Sparse-Index, Rotation) über ein offenes Handle."""
+
+    def __init__(
+        self,
+        path: str = QUESTIONS_LOG,
+        index_path: str = QUESTIONS_LOG_INDEX,
+        maxsize: int = LOG_QUEUE_SIZE,
+        on_full: str = LOG_QUEUE_FULL,
+        phrases: Optional[FallbackPhrases] = None,
+    ):
+        super().__init__("ptc-question-logger", maxsize, on_full)
+        self.path = path
+        self.phrases = phrases
+        self._index = LogIndex(path, index_path)
+        self._file = None
+        self._index_file = None
+        self._lines = 0
+        self._offset = 0
+        self._day: Optional[str] = None
+        self._last_fsync = time.monotonic()
+        self._start()
+
+    def submit(self, raw_text: str, intent: str, goal: Optional[str]) -> bool:
+        return self.enqueue((datetime.utcnow().isoformat(timespec="seconds") + "Z", intent, goal, raw_text))
+
+    def _open(self) -> None:
+        if os.path.exists(self.path + ".rotating"):
+            rotate_questions_log(self.path, self._index.index_path)
+        # Index prüfen/reparieren und Position für die Appends bestimmen
+        self._lines, self._offset = self._index.sync()
+        self._day = None
+        if self._offset:
+            with open(self.path, "rb") as f:
+                self._day = str((_parse_log_line(f.readline()) or {}).get("ts", ""))[:10] or None
+        self._file = open(self.path, "ab")
+        self._index_file = open(self._index.index_path, "ab")
+        if self._offset:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset - 1)
+                torn = f.read(1) != b"\n"
+            if torn:
+                # abgeschnittene letzte Zeile abschließen, damit Offsets stimmen
+                self._file.write(b"\n")
+                self._lines += 1
+                self._offset += 1
+
+    def _write_batch(self, entries: List[Tuple[str, str, Optional[str], str]]) -> None:
+        texts = [sanitize_for_log(raw, intent) for _, intent, _, raw in entries]
+        lines = [
+            (json.dumps({"ts": ts, "intent": intent, "goal": goal, "text": text}, ensure_ascii=False) + "\n").encode(
+                "utf-8"
+            )
+            for (ts, intent, goal, _), text in zip(entries, texts)
+        ]
+        if self._file is None:
+            self._open()
+        if self._needs_rotation(entries[0][0]):
+            self._close_resources()
+            rotate_questions_log(self.path, self._index.index_path)
+            self._open()
+        if self._day is None:
+            self._day = entries[0][0][:10]
+        records = []
+        for (ts, _, _, _), line in zip(entries, lines):
+            if self._lines % LOG_INDEX_EVERY == 0:
+                records.append(LogIndex.pack(self._lines, self._offset, ts))
+            self._lines += 1
+            self._offset += len(line)
+        self._file.write(b"".join(lines))
+        self._file.flush()
+        if records:
+            # erst nach den Daten, damit der Index nie ins Leere zeigt
+            self._index_file.write(b"".join(records))
+            self._index_file.flush()
+        now = time.monotonic()
+        if LOG_FSYNC == "always" or (LOG_FSYNC == "interval" and now - self._last_fsync >= LOG_FSYNC_INTERVAL):
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+        _observe_fallbacks(self.phrases, zip((e[1] for e in entries), texts))
+
+    def _needs_rotation(self, ts: str) -> bool:
+        if not self._offset:
+            return False
+        if LOG_ROTATE_BYTES and self._offset >= LOG_ROTATE_BYTES:
+            return True
+        return LOG_ROTATE_DAILY and self._day is not None and ts[:10] != self._day
+
+    def _close_resources(self) -> None:
+        for f in (self._file, self._index_file):
+            if f is None:
+                continue
+            try:
+                if f is self._file and LOG_FSYNC != "never":
+                    f.flush()
+                    os.fsync(f.fileno())
+                f.close()
+            except OSError:
+                pass
+        self._file = None
+        self._index_file = None
+
+
+def _parse_log_line(line: bytes) -> Optional[Dict[str, object]]:
+    try:
+        row = json.loads(line)
+    except Exception:
+        return None
+    return row if isinstance(row, dict) else None
+
+
+def _reverse_lines(path: str, end: Optional[int] = None, chunk: int = 65536) -> Iterator[bytes]:
+    """Liefert die Zeilen vor Byte-Offset `end` (Default: Dateiende) rückwärts."""
+    with open(path, "rb") as f:
+        if end is None:
+            end = f.seek(0, os.SEEK_END)
+        pos = end
+        buf = b""
+        while pos > 0:
+            step = min(chunk, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+            lines = buf.split(b"\n")
+            buf = lines[0]
+            for line in reversed(lines[1:]):
+                if line.strip():
+                    yield line
+        if buf.strip():
+            yield buf
+
+
+def _segment_tail(entry: Dict[str, object], n: int) -> List[bytes]:
+    """Letzte `n` Zeilen eines Segments (gestreamt, begrenzter Speicher)."""
+    return list(deque(_iter_segment_lines(entry), maxlen=n)) if n > 0 else []
+
+
+def _jsonl_read_tail(limit: int = 200) -> List[Dict[str, object]]:
+    rows: List[Dict[str, object]] = []
+    # letzte zuerst – vom aktiven Log nur das Dateiende, dann ältere Segmente
+    if os.path.exists(QUESTIONS_LOG):
+        for line in _reverse_lines(QUESTIONS_LOG):
+            row = _parse_log_line(line)
+            if row is not None:
+                rows.append(row)
+                if len(rows) >= limit:
+                    return rows
+    for entry in reversed(load_log_manifest()):
+        for line in reversed(_segment_tail(entry, limit - len(rows))):
+            row = _parse_log_line(line)
+            if row is not None:
+                rows.append(row)
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def _jsonl_read_page(page: int, size: int = 200) -> List[Dict[str, object]]:
+    """Seite `page` (0 = neueste) mit `size` Zeilen, neueste zuerst – über alle Segmente."""
+    skip = page * size
+    lines: List[bytes] = []
+    if os.path.exists(QUESTIONS_LOG):
+        index = LogIndex()
+        end_line = index.line_count() - skip
+        if end_line > 0:
+            end = index.offset_of_line(end_line)
+            for line in _reverse_lines(QUESTIONS_LOG, end):
+                if len(lines) >= min(size, end_line):
+                    break
+                lines.append(line)
+            skip = 0
+        else:
+            skip = -end_line
+
+    for entry in reversed(load_log_manifest()):
+        need = size - len(lines)
+        if need <= 0:
+            break
+        n = int(entry.get("lines", 0))
+        if skip >= n:
+            skip -= n
+            continue
+        lo, hi = max(0, n - skip - need), n - skip
+        chunk = [line for i, line in enumerate(islice(_iter_segment_lines(entry), hi)) if i >= lo]
+        lines += reversed(chunk)
+        skip = 0
+
+    return [row for row in map(_parse_log_line, lines) if row is not None]
+
+
+def _jsonl_read_between(ts_from: str, ts_to: str, limit: int = 200) -> List[Dict[str, object]]:
+    """Einträge mit ts_from <= ts <= ts_to (ISO-Strings), neueste zuerst."""
+    rows: List[Dict[str, object]] = []
+    if os.path.exists(QUESTIONS_LOG):
+        end = LogIndex().offset_after_ts(ts_to)
+        for line in _reverse_lines(QUESTIONS_LOG, end):
+            row = _parse_log_line(line)
+            if row is None:
+                continue
+            ts = str(row.get("ts", ""))
+            if ts > ts_to:
+                continue
+            if ts < ts_from:
+                return rows
+            rows.append(row)
+            if len(rows) >= limit:
+                return rows
+
+    for entry in reversed(load_log_manifest()):
+        if str(entry.get("last_ts", "")) < ts_from:
+            break
+        if str(entry.get("first_ts", "")) > ts_to:
+            continue
+        hits: deque = deque(maxlen=limit - len(rows))
+        for line in _iter_segment_lines(entry):
+            row = _parse_log_line(line)
+            if row is not None and ts_from <= str(row.get("ts", "")) <= ts_to:
+                hits.append(row)
+        rows += reversed(hits)
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def _jsonl_iter_export(
+    intent: Optional[str] = None,
+    ts_from: Optional[str] = None,
+    ts_to: Optional[str] = None,
+    chunk_size: int = 1024 * 1024,
+) -> Iterator[bytes]:
+    """
+    Streamt das komplette Log (Segmente, dann aktives Log) als JSONL-Chunks,
+    optional gefiltert nach Intent und ts-Spanne. Speicherbedarf ~ chunk_size.
+    """
+    sources: List[Callable[[], BinaryIO]] = []
+    for entry in load_log_manifest():
+        if ts_from and str(entry.get("last_ts", "")) < ts_from:
+            continue
+        if ts_to and str(entry.get("first_ts", "")) > ts_to:
+            continue
+        sources.append(lambda e=entry: _open_segment(e))
+    if os.path.exists(QUESTIONS_LOG):
+        sources.append(lambda: open(QUESTIONS_LOG, "rb"))
+
+    filtered = intent is not None or ts_from is not None or ts_to is not None
+    for open_source in sources:
+        with open_source() as f:
+            if not filtered:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    yield chunk
+                continue
+            buf: List[bytes] = []
+            size = 0
+            for line in f:
+                row = _parse_log_line(line)
+                if row is None:
+                    continue
+                ts = str(row.get("ts", ""))
+                if intent is not None and row.get("intent") != intent:
+                    continue
+                if (ts_from and ts < ts_from) or (ts_to and ts > ts_to):
+                    continue
+                buf.append(line if line.endswith(b"\n") else line + b"\n")
+                size += len(line)
+                if size >= chunk_size:
+                    yield b"".join(buf)
+                    buf, size = [], 0
+            if buf:
+                yield b"".join(buf)
+
+
+def _jsonl_iter_since(cursor: Dict[str, object]) -> Iterator[Dict[str, object]]:
+    """
+    Liest ab Cursor {"segments", "offset", "inode"} weiter: erst neu
+    rotierte Segmente (das erste davon ist das zuletzt teilweise gelesene
+    aktive Log), dann das aktive Log – nur vollständige Zeilen.
+    """
+    while True:
+        segments = load_log_manifest()
+        done = int(cursor.get("segments", 0))
+        for seg_no, entry in enumerate(segments[done:], start=done):
+            skip = int(cursor.get("offset", 0))
+            pos = 0
+            with _open_segment(entry) as f:
+                for line in f:
+                    pos += len(line)
+                    if pos <= skip:
+                        continue
+                    row = _parse_log_line(line)
+                    if row is not None:
+                        row["ref"] = seg_no << LOG_REF_SHIFT | (pos - len(line))
+                        yield row
+            cursor.update(segments=seg_no + 1, offset=0, inode=None)
+
+        if not os.path.exists(QUESTIONS_LOG):
+            return
+        with open(QUESTIONS_LOG, "rb") as f:
+            if len(load_log_manifest()) != len(segments):
+                continue  # zwischendurch rotiert -> erst das neue Segment
+            inode = os.fstat(f.fileno()).st_ino
+            if cursor.get("inode") != inode:
+                cursor.update(offset=0, inode=inode)
+            offset = int(cursor.get("offset", 0))
+            f.seek(offset)
+            active = len(segments) << LOG_REF_SHIFT  # wird beim Rotieren zu Segment len(segments)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Zeile wird gerade geschrieben
+                row = _parse_log_line(line)
+                if row is not None:
+                    row["ref"] = active | offset
+                offset += len(line)
+                cursor["offset"] = offset
+                if row is not None:
+                    yield row
+        return
+
+
+def _read_segment_refs(entry: Dict[str, object], offsets: List[int]) -> Dict[int, bytes]:
+    """Zeilen ab den (aufsteigenden) unkomprimierten `offsets` eines Segments, je Block ein Entpacken."""
+    blocks = entry.get("blocks") or [[0, 0]]  # ältere Segmente: ein Block ab Dateianfang
+    starts = [int(b[0]) for b in blocks]
+    out: Dict[int, bytes] = {}
+    f: Optional[BinaryIO] = None
+    block = pos = -1
+    try:
+        for off in offsets:
+            i = bisect_right(starts, off) - 1
+            if f is None or i != block or off < pos:
+                if f is not None:
+                    f.close()
+                block, pos = i, starts[i]
+                f = _open_segment(entry, int(blocks[i][1]))
+            while pos < off:
+                skipped = len(f.read(min(off - pos, 1024 * 1024)))
+                if not skipped:
+                    break
+                pos += skipped
+            line = f.readline()
+            pos += len(line)
+            out[off] = line
+    finally:
+        if f is not None:
+            f.close()
+    return out
+
+
+def _jsonl_read_refs(refs: List[int]) -> List[Optional[Dict[str, object]]]:
+    mask = (1 << LOG_REF_SHIFT) - 1
+    wanted: Dict[int, List[int]] = {}
+    for ref in refs:
+        wanted.setdefault(ref >> LOG_REF_SHIFT, []).append(ref & mask)
+    lines: Dict[int, bytes] = {}
+    while True:
+        segments = load_log_manifest()
+        for seg_no, offsets in wanted.items():
+            if seg_no < len(segments):
+                found = _read_segment_refs(segments[seg_no], sorted(set(offsets)))
+                lines.update((seg_no << LOG_REF_SHIFT | off, line) for off, line in found.items())
+        active = wanted.get(len(segments))
+        if not active:
+            break
+        f = None
+        for path in (QUESTIONS_LOG + ".rotating", QUESTIONS_LOG):  # mitten in der Rotation liegt es unter .rotating
+            try:
+                f = open(path, "rb")
+                break
+            except OSError:
+                pass
+        if f is None:
+            break
+        with f:
+            if len(load_log_manifest()) != len(segments):
+                continue  # zwischendurch rotiert -> Zeilen stehen jetzt im neuen Segment
+            for off in sorted(set(active)):
+                f.seek(off)
+                lines[len(segments) << LOG_REF_SHIFT | off] = f.readline()
+        break
+    out: List[Optional[Dict[str, object]]] = []
+    for ref in refs:
+        row = _parse_log_line(lines.get(ref, b""))
+        if row is not None:
+            row["ref"] = ref
+        out.append(row)
+    return out
+
+
+# =========================================================
+# STORAGE-BACKENDS (Stats + Fragen-Log)
+# =========================================================
+# "jsonl": Standard, Stats-JSON + JSONL-Log pro Prozess (siehe oben).
+# "sqlite": eine SQLite-Datenbank im WAL-Modus – korrekte Zählungen und Logs,
+# auch wenn mehrere Streamlit-Prozesse auf demselben Host laufen.
+STORAGE_BACKEND = "jsonl"
+SQLITE_PATH = "ptc_analytics.sqlite3"
+
+
+class StorageBackend:
+    """Schnittstelle hinter inc_global_*, log_question und read_questions_log*; schließen mit close_storage()."""
+
+    name = "base"
+    writer: Optional[BatchWriter] = None
+    phrases: Optional[FallbackPhrases] = None
+
+    def inc_intent(self, name: str) -> None:
+        raise NotImplementedError
+
+    def inc_fallback(self) -> None:
+        raise NotImplementedError
+
+    def stats_snapshot(self) -> Dict[str, object]:
+        raise NotImplementedError
+
+    def log_question(self, raw_text: str, intent: str, goal: Optional[str]) -> None:
+        """Reiht die Frage ein; der Writer maskiert sie und zählt Fallback-Phrasen (FallbackPhrases)."""
+        raise NotImplementedError
+
+    def read_tail(self, limit: int) -> List[Dict[str, object]]:
+        raise NotImplementedError
+
+    def read_page(self, page: int, size: int) -> List[Dict[str, object]]:
+        raise NotImplementedError
+
+    def read_between(self, ts_from: str, ts_to: str, limit: int) -> List[Dict[str, object]]:
+        raise NotImplementedError
+
+    def iter_export(
+        self, intent: Optional[str], ts_from: Optional[str], ts_to: Optional[str]
+    ) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def iter_since(self, cursor: Dict[str, object]) -> Iterator[Dict[str, object]]:
+        """
+        Alle Einträge nach `cursor` (ältere zuerst); `cursor` wird dabei
+        fortgeschrieben. Jeder Eintrag trägt unter "ref" seine Position für read_refs().
+        """
+        raise NotImplementedError
+
+    def read_refs(self, refs: List[int]) -> List[Optional[Dict[str, object]]]:
+        """Einträge zu "ref"-Werten aus iter_since(), in derselben Reihenfolge; None, wenn nicht mehr vorhanden."""
+        raise NotImplementedError
+
+    def log_segments(self) -> int:
+        """Anzahl rotierter Log-Segmente dieses Backends (0, wenn es nicht rotiert)."""
+        return 0
+
+
+class JsonlStorage(StorageBackend):
+    name = "jsonl"
+
+    def __init__(self):
+        self.stats = new_stats_store()
+        self.stats.phrases = self.phrases = load_fallback_phrases()
+        self.writer = QuestionLogger(phrases=self.phrases)
+
+    def inc_intent(self, name: str) -> None:
+        self.stats.inc_intent(name)
+
+    def inc_fallback(self) -> None:
+        self.stats.inc_fallback()
+
+    def stats_snapshot(self) -> Dict[str, object]:
+        return self.stats.snapshot()
+
+    def log_question(self, raw_text: str, intent: str, goal: Optional[str]) -> None:
+        self.writer.submit(raw_text, intent, goal)
+
+    def read_tail(self, limit: int) -> List[Dict[str, object]]:
+        return _jsonl_read_tail(limit)
+
+    def log_segments(self) -> int:
+        return len(load_log_manifest())
+
+    def read_page(self, page: int, size: int) -> List[Dict[str, object]]:
+        return _jsonl_read_page(page, size)
+
+    def read_between(self, ts_from: str, ts_to: str, limit: int) -> List[Dict[str, object]]:
+        return _jsonl_read_between(ts_from, ts_to, limit)
+
+    def iter_export(
+        self, intent: Optional[str], ts_from: Optional[str], ts_to: Optional[str]
+    ) -> Iterator[bytes]:
+        return _jsonl_iter_export(intent, ts_from, ts_to)
+
+    def iter_since(self, cursor: Dict[str, object]) -> Iterator[Dict[str, object]]:
+        return _jsonl_iter_since(cursor)
+
+    def read_refs(self, refs: List[int]) -> List[Optional[Dict[str, object]]]:
+        return _jsonl_read_refs(refs)
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, name)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    intent TEXT NOT NULL,
+    goal TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS questions_ts ON questions (ts);
+CREATE INDEX IF NOT EXISTS questions_intent_ts ON questions (intent, ts);
+CREATE INDEX IF NOT EXISTS questions_goal_ts ON questions (goal, ts);
+"""
+_SQL_INSERT_QUESTION = "INSERT INTO questions (ts, intent, goal, text) VALUES (?, ?, ?, ?)"
+_SQL_UPSERT_COUNTER = (
+    "INSERT INTO counters (kind, name, n) VALUES (?, ?, ?) "
+    "ON CONFLICT (kind, name) DO UPDATE SET n = n + excluded.n"
+)
+_SQL_SET_UPDATED = "INSERT OR REPLACE INTO meta (key, value) VALUES ('updated_at', ?)"
+# Bei mehreren Prozessen gewinnt der zuletzt schreibende; Neuaufbau aus dem Log gibt die Gesamtsicht.
+_SQL_SET_PHRASES = "INSERT OR REPLACE INTO meta (key, value) VALUES ('fallback_phrases', ?)"
+
+
+def _sqlite_connect(path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class _SQLiteWriter(BatchWriter):
+    """Schreibt Zähler und Fragen gebündelt – eine Transaktion pro Batch."""
+
+    def __init__(self, path: str, phrases: Optional[FallbackPhrases] = None):
+        super().__init__("ptc-sqlite-writer")
+        self.path = path
+        self.phrases = phrases
+        self._phrases_saved = time.monotonic()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._start()
+
+    def _write_batch(self, entries: List[tuple]) -> None:
+        questions = []
+        counts: Dict[Tuple[str, str], int] = {}
+        for e in entries:
+            if e[0] == "q":
+                _, ts, intent, goal, raw = e
+                questions.append((ts, intent, goal, sanitize_for_log(raw, intent)))
+            else:
+                key = (e[0], e[1])
+                counts[key] = counts.get(key, 0) + 1
+
+        if self._conn is None:
+            # close() kann aus einem anderen Thread kommen; Zugriff ist über self.lock serialisiert
+            self._conn = _sqlite_connect(self.path, check_same_thread=False)
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if questions:
+                conn.executemany(_SQL_INSERT_QUESTION, questions)
+            if counts:
+                conn.executemany(_SQL_UPSERT_COUNTER, [(k, n, c) for (k, n), c in counts.items()])
+                conn.execute(_SQL_SET_UPDATED, (datetime.utcnow().isoformat(timespec="seconds") + "Z",))
+            phrases = self.phrases
+            if phrases is not None and phrases.dirty and (
+                time.monotonic() - self._phrases_saved >= STATS_FLUSH_INTERVAL * STATS_SNAPSHOT_EVERY
+            ):
+                conn.execute(_SQL_SET_PHRASES, (phrases.to_json(),))
+                self._phrases_saved = time.monotonic()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        _observe_fallbacks(self.phrases, ((intent, text) for _, intent, _, text in questions))
+
+    def _close_resources(self) -> None:
+        if self.phrases is not None and self.phrases.dirty:
+            try:
+                if self._conn is None:  # z. B. Neuaufbau der Phrasen ohne neue Log-Einträge
+                    self._conn = _sqlite_connect(self.path, check_same_thread=False)
+                self._conn.execute(_SQL_SET_PHRASES, (self.phrases.to_json(),))
+            except sqlite3.Error:
+                pass
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class SQLiteStorage(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._local = local()
+        conn = self._conn()
+        conn.executescript(_SQLITE_SCHEMA)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'fallback_phrases'").fetchone()
+        self.phrases = FallbackPhrases.from_json(row[0] if row else None)
+        self.writer = _SQLiteWriter(path, self.phrases)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3-Verbindungen sind threadgebunden -> eine Leseverbindung pro Thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _sqlite_connect(self.path)
+        return conn
+
+    def inc_intent(self, name: str) -> None:
+        # Zähler dürfen nicht verworfen werden -> blockierend einreihen
+        self.writer.enqueue(("intent", name), block=True)
+
+    def inc_fallback(self) -> None:
+        self.writer.enqueue(("fallback", ""), block=True)
+
+    def log_question(self, raw_text: str, intent: str, goal: Optional[str]) -> None:
+        self.writer.enqueue(("q", datetime.utcnow().isoformat(timespec="seconds") + "Z", intent, goal, raw_text))
+
+    def stats_snapshot(self) -> Dict[str, object]:
+        conn = self._conn()
+        data: Dict[str, object] = {"intents": {}, "fallback": 0, "updated_at": None}
+        for kind, name, n in conn.execute("SELECT kind, name, n FROM counters"):
+            if kind == "intent":
+                data["intents"][name] = n
+            elif kind == "fallback":
+                data["fallback"] = n
+        row = conn.execute("SELECT value FROM meta WHERE key = 'updated_at'").fetchone()
+        data["updated_at"] = row[0] if row else None
+        return data
+
+    @staticmethod
+    def _rows(cur: sqlite3.Cursor) -> List[Dict[str, object]]:
+        return [{"ts": ts, "intent": intent, "goal": goal, "text": text} for ts, intent, goal, text in cur]
+
+    def read_tail(self, limit: int) -> List[Dict[str, object]]:
+        return self._rows(self._conn().execute(
+            "SELECT ts, intent, goal, text FROM questions ORDER BY id DESC LIMIT ?", (limit,)
+        ))
+
+    def read_page(self, page: int, size: int) -> List[Dict[str, object]]:
+        return self._rows(self._conn().execute(
+            "SELECT ts, intent, goal, text FROM questions ORDER BY id DESC LIMIT ? OFFSET ?", (size, page * size)
+        ))
+
+    def read_between(self, ts_from: str, ts_to: str, limit: int) -> List[Dict[str, object]]:
+        return self._rows(self._conn().execute(
+            "SELECT ts, intent, goal, text FROM questions WHERE ts BETWEEN ? AND ? "
+            "ORDER BY ts DESC, id DESC LIMIT ?",
+            (ts_from, ts_to, limit),
+        ))
+
+    def iter_export(
+        self, intent: Optional[str], ts_from: Optional[str], ts_to: Optional[str]
+    ) -> Iterator[bytes]:
+        where, args = [], []
+        if intent is not None:
+            where.append("intent = ?")
+            args.append(intent)
+        if ts_from is not None:
+            where.append("ts >= ?")
+            args.append(ts_from)
+        if ts_to is not None:
+            where.append("ts <= ?")
+            args.append(ts_to)
+        sql = "SELECT ts, intent, goal, text FROM questions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # eigene Verbindung: der Generator kann über mehrere Reruns leben
+        conn = _sqlite_connect(self.path)
+        try:
+            cur = conn.execute(sql + " ORDER BY id", args)
+            while True:
+                batch = cur.fetchmany(5000)
+                if not batch:
+                    break
+                yield "".join(
+                    json.dumps({"ts": ts, "intent": i, "goal": g, "text": t}, ensure_ascii=False) + "\n"
+                    for ts, i, g, t in batch
+                ).encode("utf-8")
+        finally:
+            conn.close()
+
+    def iter_since(self, cursor: Dict[str, object]) -> Iterator[Dict[str, object]]:
+        conn = _sqlite_connect(self.path)
+        try:
+            cur = conn.execute(
+                "SELECT id, ts, intent, goal, text FROM questions WHERE id > ? ORDER BY id",
+                (int(cursor.get("id", 0)),),
+            )
+            while True:
+                batch = cur.fetchmany(5000)
+                if not batch:
+                    break
+                for row_id, ts, intent, goal, text in batch:
+                    cursor["id"] = row_id
+                    yield {"ts": ts, "intent": intent, "goal": goal, "text": text, "ref": row_id}
+        finally:
+            conn.close()
+
+    def read_refs(self, refs: List[int]) -> List[Optional[Dict[str, object]]]:
+        rows: Dict[int, Dict[str, object]] = {}
+        conn = _sqlite_connect(self.path)
+        try:
+            ids = sorted(set(refs))
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                cur = conn.execute(
+                    f"SELECT id, ts, intent, goal, text FROM questions WHERE id IN ({','.join('?' * len(part))})",
+                    part,
+                )
+                for row_id, ts, intent, goal, text in cur:
+                    rows[row_id] = {"ts": ts, "intent": intent, "goal": goal, "text": text, "ref": row_id}
+        finally:
+            conn.close()
+        return [rows.get(ref) for ref in refs]
+
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = Lock()
+
+
+def get_storage() -> StorageBackend:
+    """Prozessweites Backend (lazy, threadsicher) gemäß STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = SQLiteStorage(SQLITE_PATH) if STORAGE_BACKEND == "sqlite" else JsonlStorage()
+    return _storage
+
+
+def close_storage(storage: StorageBackend) -> None:
+    """Schreibt Queue und Zähler weg und beendet die Threads; ohne atexit-Eintrag danach."""
+    stats = getattr(storage, "stats", None)
+    for closer in ([storage.writer.close] if storage.writer is not None else []) + (
+        [stats.close] if stats is not None else []
+    ):
+        closer()
+        atexit.unregister(closer)
+
+
+def inc_global_intent(name: str) -> None:
+    get_storage().inc_intent(name)
+
+
+def inc_global_fallback() -> None:
+    get_storage().inc_fallback()
+
+
+def log_question(raw_text: str, intent: str, goal: Optional[str]) -> None:
+    get_storage().log_question(raw_text, intent, goal)
+
+
+def read_questions_log(limit: int = 200) -> List[Dict[str, object]]:
+    return get_storage().read_tail(limit)
+
+
+def read_questions_log_page(page: int, size: int = 200) -> List[Dict[str, object]]:
+    """Seite `page` (0 = neueste) mit `size` Einträgen, neueste zuerst."""
+    return get_storage().read_page(page, size)
+
+
+def read_questions_log_between(ts_from: str, ts_to: str, limit: int = 200) -> List[Dict[str, object]]:
+    """Einträge mit ts_from <= ts <= ts_to (ISO-Strings), neueste zuerst."""
+    return get_storage().read_between(ts_from, ts_to, limit)
+
+
+def iter_questions_log_export(
+    intent: Optional[str] = None, ts_from: Optional[str] = None, ts_to: Optional[str] = None
+) -> Iterator[bytes]:
+    """Streamt das Log als JSONL-Chunks, optional gefiltert nach Intent/Zeitraum."""
+    return get_storage().iter_export(intent, ts_from, ts_to)
@@ -0,0 +1,319 @@
+"""
+PTC Online-Beratung – mehrere Studios (Mandanten) in einem Deployment.
+
+Ein Mandant ist eine Datei tenants/<id>.json, die Abschnitte der
+Wissensbasis (ptc_knowledge.json) überschreibt. "studio" und "probetraining"
+werden schlüsselweise gemischt – meist reichen Name, Telefon und Adresse –,
+alle anderen Abschnitte ersetzen den der Basis ganz:
+
+    {"studio": {"name": "PTC Hannover", "phone_display": "0511 123456",
+                "phone_tel": "tel:+49511123456", "address": "…"},
+     "course_plan": {"Montag": [["18:00", "Zumba"]]}}
+
+Ausgewählt wird der Mandant über ?studio=<id> (bzw. "studio" im API-Body)
+oder den Host-Namen (tenants/hosts.json: {"hannover.example.de": "hannover"});
+ohne beides gilt das Basis-Studio (DEFAULT_TENANT) mit der Wissensbasis aus
+ptc_core.
+
+Pro Mandant entsteht ein eigener Snapshot (ptc_core.build_knowledge) mit
+vorgerenderten Antworten. Die TenantRegistry hält die zuletzt benutzten
+TENANT_CACHE_SIZE Snapshots im Speicher, kalte fallen heraus und werden beim
+nächsten Zugriff neu gebaut. Gleiche Pattern-Listen werden nur einmal
+kompiliert (ptc_core teilt Regel-Indizes und Routing-Cache), nicht
+überschriebene Abschnitte und gleichlautende Antworten teilen sich die
+Objekte der Basis – ein weiterer Mandant kostet im Wesentlichen seine
+eigenen Antworttexte (siehe bench_tenants.py).
+
+Zähler, Fragen-Log und Fallback-Phrasen liegen pro Mandant in einer eigenen
+SQLite-Datenbank unter TENANT_DATA_DIR/<id>/ (die JSONL-Dateien des
+Basis-Studios sind prozessweit fest verdrahtet). Offen bleiben höchstens
+TENANT_CACHE_SIZE Storages (LRU, je ein Writer-Thread); ein herausfallendes
+wird geschlossen (Queue leeren, Phrasen sichern) und beim nächsten Zugriff
+neu geöffnet. Wer es noch hält (Sink der API, laufender Streamlit-Run),
+schreibt danach synchron in dieselbe Datenbank (BatchWriter.enqueue) –
+Zähler gehen dabei nicht verloren.
+"""
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, List, Dict, Tuple
+
+import ptc_storage
+from ptc_core import (
+    KNOWLEDGE_FILE,
+    KNOWLEDGE_POLL_INTERVAL,
+    Knowledge,
+    KnowledgeError,
+    build_knowledge,
+    get_knowledge,
+    parse_knowledge_doc,
+)
+
+
+# =========================================================
+# KONFIG
+# =========================================================
+TENANTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tenants")
+TENANT_HOSTS_FILE = "hosts.json"      # in TENANTS_DIR: Host-Name -> Mandant
+TENANT_DATA_DIR = "ptc_tenant_data"   # Stats/Logs pro Mandant: <dir>/<id>/
+TENANT_CACHE_SIZE = 64                # kompilierte Mandanten im Speicher
+TENANT_PARAM = "studio"               # Query-Parameter bzw. Feld im API-Body
+DEFAULT_TENANT = ""                   # Basis-Studio aus ptc_knowledge.json
+
+_TENANT_ID = re.compile(r"[a-z0-9][a-z0-9_-]{0,39}")
+_MERGED_SECTIONS = ("studio", "probetraining")
+
+
+class TenantError(LookupError):
+    """Unbekannter oder ungültiger Mandant."""
+
+
+def merge_tenant_doc(base: Dict[str, object], overlay: Dict[str, object]) -> Dict[str, object]:
+    """Mandanten-Datei über die Basis legen (siehe Modul-Docstring)."""
+    doc = dict(base)
+    for key, value in overlay.items():
+        if key in _MERGED_SECTIONS and isinstance(value, dict) and isinstance(base.get(key), dict):
+            doc[key] = {**base[key], **value}
+        else:
+            doc[key] = value
+    return doc
+
+
+def _read_json(path: str) -> object:
+    try:
+        with open(path, "rb") as f:
+            return json.loads(f.read())
+    except OSError as e:
+        raise KnowledgeError(f"{path} nicht lesbar: {e}") from None
+    except ValueError as e:
+        raise KnowledgeError(f"{path}: kein gültiges JSON: {e}") from None
+
+
+# =========================================================
+# REGISTRY
+# =========================================================
+class _Tenant:
+    __slots__ = ("knowledge", "mtimes", "checked")
+
+    def __init__(self, knowledge: Knowledge, mtimes: Tuple[int, int]):
+        self.knowledge = knowledge
+        self.mtimes = mtimes            # (Mandanten-Datei, Basis-Datei)
+        self.checked = time.monotonic()
+
+
+class TenantRegistry:
+    """
+    Mandant -> Snapshot (LRU) und Mandant -> Storage. Threadsicher; gebaut
+    wird außerhalb des Locks, schlimmstenfalls baut ein paralleler Zugriff
+    denselben Mandanten ein zweites Mal.
+    """
+
+    def __init__(self, path: str = TENANTS_DIR, maxsize: int = TENANT_CACHE_SIZE,
+                 data_dir: str = TENANT_DATA_DIR):
+        self.path = path
+        self.maxsize = maxsize
+        self.data_dir = data_dir
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.evictions = 0
+        self.storage_evictions = 0
+        self.errors: Dict[str, str] = {}  # letzter abgelehnter Reload pro Mandant
+        self._lock = Lock()
+        self._open_lock = Lock()
+        self._cache: "OrderedDict[str, _Tenant]" = OrderedDict()
+        self._storages: "OrderedDict[str, ptc_storage.StorageBackend]" = OrderedDict()
+        self._base: Optional[Tuple[int, Dict[str, object], Dict[str, object]]] = None
+        self._hosts: Tuple[int, Dict[str, str]] = (0, {})
+
+    # ---- Auswahl -------------------------------------------------------
+    def _file(self, tid: str) -> str:
+        return os.path.join(self.path, tid + ".json")
+
+    def _host_map(self) -> Dict[str, str]:
+        path = os.path.join(self.path, TENANT_HOSTS_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return {}
+        if mtime != self._hosts[0]:
+            hosts = _read_json(path)
+            if not isinstance(hosts, dict):
+                raise KnowledgeError(f"{path}: Objekt Host -> Studio erwartet")
+            self._hosts = (mtime, {str(h).lower(): str(t) for h, t in hosts.items()})
+        return self._hosts[1]
+
+    def resolve(self, param: Optional[str] = None, host: Optional[str] = None) -> str:
+        """Mandanten-ID aus Query-Parameter (Vorrang) oder Host-Header; TenantError, wenn unbekannt."""
+        if param:
+            tid = param.strip().lower()
+        elif host:
+            tid = self._host_map().get(host.rsplit(":", 1)[0].strip().lower(), DEFAULT_TENANT)
+        else:
+            tid = DEFAULT_TENANT
+        if tid != DEFAULT_TENANT and not (_TENANT_ID.fullmatch(tid) and os.path.isfile(self._file(tid))):
+            raise TenantError(tid)
+        return tid
+
+    def available(self) -> List[str]:
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return []
+        return sorted(
+            n[:-5] for n in names
+            if n.endswith(".json") and n != TENANT_HOSTS_FILE and _TENANT_ID.fullmatch(n[:-5])
+        )
+
+    # ---- Snapshots -----------------------------------------------------
+    def _mtimes(self, tid: str) -> Tuple[int, int]:
+        try:
+            own = os.stat(self._file(tid)).st_mtime_ns
+        except OSError:
+            raise TenantError(tid) from None
+        try:
+            return own, os.stat(KNOWLEDGE_FILE).st_mtime_ns
+        except OSError as e:
+            raise KnowledgeError(f"{KNOWLEDGE_FILE} nicht lesbar: {e}") from None
+
+    def _base_doc(self, mtime: int) -> Tuple[Dict[str, object], Dict[str, object]]:
+        base = self._base
+        if base is None or base[0] != mtime:
+            doc = _read_json(KNOWLEDGE_FILE)
+            base = self._base = (mtime, doc, parse_knowledge_doc(doc))
+        return base[1], base[2]
+
+    def _build(self, tid: str) -> _Tenant:
+        mtimes = self._mtimes(tid)
+        doc, base = self._base_doc(mtimes[1])
+        overlay = _read_json(self._file(tid))
+        if not isinstance(overlay, dict):
+            raise KnowledgeError(f"{self._file(tid)}: Objekt erwartet")
+        data = parse_knowledge_doc(merge_tenant_doc(doc, overlay))
+
+        # gleiche Abschnitte und Antworttexte teilen sich die Objekte des Basis-Studios
+        shared = get_knowledge()
+        for key, value in data.items():
+            if value == shared.data[key]:
+                data[key] = shared.data[key]
+            elif value == base[key]:
+                data[key] = base[key]
+        kb = build_knowledge(data)
+        texts = {text: text for text in shared.templates.values()}
+        for key, text in kb.templates.items():
+            kb.templates[key] = texts.get(text, text)
+        return _Tenant(kb, mtimes)
+
+    def knowledge(self, tid: str) -> Knowledge:
+        """
+        Snapshot für `tid`. Geänderte Dateien (Mandant oder Basis) werden
+        höchstens alle KNOWLEDGE_POLL_INTERVAL Sekunden bemerkt; ist die neue
+        Fassung ungültig, bleibt die alte aktiv (siehe `errors`).
+        """
+        if tid == DEFAULT_TENANT:
+            return get_knowledge()
+        now = time.monotonic()
+        with self._lock:
+            tenant = self._cache.get(tid)
+            if tenant is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(tid)
+                if now - tenant.checked < KNOWLEDGE_POLL_INTERVAL:
+                    return tenant.knowledge
+                tenant.checked = now
+
+        if tenant is None:
+            fresh = self._build(tid)
+        else:
+            try:
+                if self._mtimes(tid) == tenant.mtimes:
+                    return tenant.knowledge
+                fresh = self._build(tid)
+            except (KnowledgeError, TenantError) as e:
+                self.errors[tid] = str(e) or "Datei fehlt"
+                return tenant.knowledge
+
+        with self._lock:
+            self._cache[tid] = fresh
+            self._cache.move_to_end(tid)
+            self.builds += 1
+            self.errors.pop(tid, None)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return fresh.knowledge
+
+    # ---- Storage -------------------------------------------------------
+    def data_path(self, tid: str, name: str) -> str:
+        """Pfad einer Datei (Rollups, Suchindex, …) im Namensraum des Mandanten."""
+        if tid == DEFAULT_TENANT:
+            return name
+        return os.path.join(self.data_dir, tid, name)
+
+    def opened_storage(self, tid: str) -> Optional[ptc_storage.StorageBackend]:
+        """Storage von `tid`, falls schon offen – öffnet nichts (für den Event-Loop der API)."""
+        if tid == DEFAULT_TENANT:
+            return ptc_storage.get_storage()
+        with self._lock:
+            storage = self._storages.get(tid)
+            if storage is not None:
+                self._storages.move_to_end(tid)
+            return storage
+
+    def storage(self, tid: str) -> ptc_storage.StorageBackend:
+        """Storage von `tid`; öffnet es bei Bedarf und schließt dafür das am längsten ungenutzte."""
+        storage = self.opened_storage(tid)
+        if storage is not None:
+            return storage
+        evicted: List[ptc_storage.StorageBackend] = []
+        with self._open_lock:  # nur das Öffnen serialisieren, opened_storage() wartet nicht darauf
+            storage = self.opened_storage(tid)
+            if storage is not None:
+                return storage
+            os.makedirs(os.path.join(self.data_dir, tid), exist_ok=True)
+            storage = ptc_storage.SQLiteStorage(self.data_path(tid, os.path.basename(ptc_storage.SQLITE_PATH)))
+            with self._lock:
+                self._storages[tid] = storage
+                while len(self._storages) > self.maxsize:
+                    evicted.append(self._storages.popitem(last=False)[1])
+                    self.storage_evictions += 1
+        for old in evicted:  # außerhalb der Locks: close() wartet auf den Writer-Thread
+            ptc_storage.close_storage(old)
+        return storage
+
+    def storages(self) -> List[ptc_storage.StorageBackend]:
+        """Offene Mandanten-Storages (ohne das des Basis-Studios)."""
+        with self._lock:
+            return list(self._storages.values())
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "capacity": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "builds": self.builds,
+                "evictions": self.evictions,
+                "storages": len(self._storages),
+                "storage_evictions": self.storage_evictions,
+                "errors": dict(self.errors),
+            }
+
+
+_tenants: Optional[TenantRegistry] = None
+_tenants_lock = Lock()
+
+
+def get_tenants() -> TenantRegistry:
+    global _tenants
+    if _tenants is None:
+        with _tenants_lock:
+            if _tenants is None:
+                _tenants = TenantRegistry()
+    return _tenants
@@ -0,0 +1,311 @@
+"""
+Massen-Neuklassifizierung des Fragen-Logs gegen eine geänderte Wissensbasis.
+
+Streamt das Log (Segmente + aktives Log, explizite JSONL-Dateien oder die
+SQLite-Datenbank) in Chunks an einen Prozess-Pool. Jeder Worker baut zwei
+Router – Baseline (Standard: aktuelle ptc_knowledge.json) und Kandidat – und
+klassifiziert jede Frage mit beiden (gleiche Priorität wie im Chat, Ergebnisse
+pro Fragetext zwischengespeichert). Ergebnis: Bericht
+mit Intent-/Ziel-Deltas und den häufigsten Übergängen samt Beispielen,
+optional alle geänderten Zeilen als JSONL.
+
+    python reclassify_log.py --candidate neu.json [--baseline alt.json | --against-log]
+                             [--input log.jsonl[.gz] ...] [--sqlite ptc_analytics.sqlite3]
+                             [--out report.json] [--changes changes.jsonl] [--workers 4]
+
+Der Speicherbedarf ist durch Chunk-Größe × Anzahl laufender Chunks begrenzt.
+Ziele werden pro Nachricht verglichen; das geloggte `goal` ist dagegen das
+gemerkte Session-Ziel und wird bei --against-log daher nicht verglichen.
+
+Das Log speichert Gesundheitsangaben maskiert ("[gesundheit]", siehe
+ptc_pii); bei --against-log sieht der Router also nicht mehr die Wörter, an
+denen der geloggte Intent hing. Zeilen mit diesem Platzhalter werden normal
+mitgezählt und zusätzlich unter `masked` getrennt ausgewiesen, damit sich
+Deltas durch die Maskierung von echten Änderungen unterscheiden lassen.
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import ptc_storage
+from ptc_core import KNOWLEDGE_FILE, IntentRouter, KnowledgeError, _compile_router, normalize, parse_knowledge
+
+RECLASSIFY_CHUNK_LINES = 20000
+RECLASSIFY_SAMPLES = 5            # Beispiele pro Übergang
+RECLASSIFY_ROUTE_CACHE = 200_000  # Texte pro Worker, danach geleert
+RECLASSIFY_MASK = "[gesundheit]"  # Zeilen damit werden zusätzlich getrennt ausgewiesen
+
+Item = Union[bytes, Tuple[str, Optional[str], str]]  # JSONL-Zeile oder (intent, goal, text)
+
+
+# =========================================================
+# Quellen
+# =========================================================
+def _iter_files(paths: List[str]) -> Iterator[bytes]:
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            yield from f
+
+
+def _iter_jsonl_log() -> Iterator[bytes]:
+    for entry in ptc_storage.load_log_manifest():
+        yield from ptc_storage._iter_segment_lines(entry)
+    if os.path.exists(ptc_storage.QUESTIONS_LOG):
+        with open(ptc_storage.QUESTIONS_LOG, "rb") as f:
+            for line in f:
+                if line.endswith(b"\n"):  # unvollständige letzte Zeile wird gerade geschrieben
+                    yield line
+
+
+def _iter_sqlite(path: str) -> Iterator[Tuple[str, Optional[str], str]]:
+    conn = sqlite3.connect(path)
+    try:
+        cur = conn.execute("SELECT intent, goal, text FROM questions ORDER BY id")
+        while True:
+            rows = cur.fetchmany(5000)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        conn.close()
+
+
+def _chunks(items: Iterator[Item], size: int) -> Iterator[List[Item]]:
+    chunk: List[Item] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# =========================================================
+# Worker
+# =========================================================
+_routers: Dict[str, Optional[Tuple[IntentRouter, List[str]]]] = {}
+_cache: Dict[str, Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]] = {}  # Rohtext -> vorher/nachher
+
+
+def _load_router(path: str) -> Tuple[IntentRouter, List[str]]:
+    with open(path, "rb") as f:
+        data = parse_knowledge(f.read())
+    return _compile_router(data["intents"], data["goal_patterns"]), [str(i["name"]) for i in data["intents"]]
+
+
+def _init_worker(baseline: Optional[str], candidate: str) -> None:
+    _routers["baseline"] = _load_router(baseline) if baseline else None
+    _routers["candidate"] = _load_router(candidate)
+
+
+def _classify(router: IntentRouter, names: List[str], t_norm: str) -> Tuple[str, Optional[str]]:
+    idx, goal = router.route(t_norm)
+    return (names[idx] if idx is not None else "fallback"), goal
+
+
+def _classify_chunk(chunk: List[Item], want_changes: bool) -> Dict[str, object]:
+    base, cand = _routers["baseline"], _routers["candidate"]
+    intents: Dict[Tuple[str, str], int] = {}
+    goals: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+    samples: Dict[Tuple[str, str], List[str]] = {}
+    masked: Dict[Tuple[str, str], int] = {}
+    changes: List[Dict[str, object]] = []
+    bad = 0
+    loads = json.loads
+    for item in chunk:
+        if isinstance(item, bytes):
+            try:
+                row = loads(item.decode("utf-8"))  # str statt bytes spart die Encoding-Erkennung
+                logged, text, ts = str(row.get("intent", "")), str(row.get("text", "")), row.get("ts")
+            except (ValueError, AttributeError):
+                bad += 1
+                continue
+        else:
+            logged, text, ts = str(item[0]), str(item[2]), None
+        # Chat-Logs wiederholen sich stark -> Ergebnis pro Rohtext merken (spart auch normalize)
+        hit = _cache.get(text)
+        if hit is None:
+            if len(_cache) >= RECLASSIFY_ROUTE_CACHE:
+                _cache.clear()
+            t_norm = normalize(text)
+            new_intent, new_goal = _classify(cand[0], cand[1], t_norm)
+            old_intent, old_goal = _classify(base[0], base[1], t_norm) if base else (None, None)
+            hit = _cache[text] = (old_intent, old_goal, new_intent, new_goal)
+        old_intent, old_goal, new_intent, new_goal = hit
+        if base is None:
+            old_intent, old_goal = logged, new_goal  # Session-Ziel im Log ist nicht vergleichbar
+
+        key = (old_intent, new_intent)
+        intents[key] = intents.get(key, 0) + 1
+        if RECLASSIFY_MASK in text:
+            masked[key] = masked.get(key, 0) + 1
+        gkey = (old_goal, new_goal)
+        goals[gkey] = goals.get(gkey, 0) + 1
+        if old_intent != new_intent:
+            s = samples.setdefault(key, [])
+            if len(s) < RECLASSIFY_SAMPLES:
+                s.append(text[:200])
+        if want_changes and (old_intent != new_intent or old_goal != new_goal):
+            changes.append({"ts": ts, "text": text, "before": [old_intent, old_goal], "after": [new_intent, new_goal]})
+    return {"lines": len(chunk), "bad": bad, "masked": masked, "intents": intents, "goals": goals, "samples": samples, "changes": changes}
+
+
+# =========================================================
+# Bericht
+# =========================================================
+class Report:
+    def __init__(self):
+        self.lines = 0
+        self.bad = 0
+        self.masked: Dict[Tuple[str, str], int] = {}
+        self.intents: Dict[Tuple[str, str], int] = {}
+        self.goals: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+        self.samples: Dict[Tuple[str, str], List[str]] = {}
+
+    def merge(self, part: Dict[str, object]) -> None:
+        self.lines += int(part["lines"])
+        self.bad += int(part["bad"])
+        for key, n in part["masked"].items():
+            self.masked[key] = self.masked.get(key, 0) + n
+        for key, n in part["intents"].items():
+            self.intents[key] = self.intents.get(key, 0) + n
+        for key, n in part["goals"].items():
+            self.goals[key] = self.goals.get(key, 0) + n
+        for key, texts in part["samples"].items():
+            s = self.samples.setdefault(key, [])
+            s.extend(texts[:RECLASSIFY_SAMPLES - len(s)])
+
+    @staticmethod
+    def _deltas(pairs: Dict[Tuple[object, object], int]) -> Dict[str, Dict[str, int]]:
+        out: Dict[str, Dict[str, int]] = {}
+        for (before, after), n in pairs.items():
+            out.setdefault(str(before), {"before": 0, "after": 0})["before"] += n
+            out.setdefault(str(after), {"before": 0, "after": 0})["after"] += n
+        for d in out.values():
+            d["delta"] = d["after"] - d["before"]
+        return dict(sorted(out.items(), key=lambda kv: -abs(kv[1]["delta"])))
+
+    def to_dict(self) -> Dict[str, object]:
+        changed = sum(n for (a, b), n in self.intents.items() if a != b)
+        transitions = [
+            {"from": a, "to": b, "count": n, "samples": self.samples.get((a, b), [])}
+            for (a, b), n in sorted(self.intents.items(), key=lambda kv: -kv[1])
+            if a != b
+        ]
+        return {
+            "lines": self.lines,
+            "unparsable": self.bad,
+            "masked": {
+                "lines": sum(self.masked.values()),
+                "intent_changed": sum(n for (a, b), n in self.masked.items() if a != b),
+                "intents": self._deltas(self.masked),
+            },
+            "intent_changed": changed,
+            "goal_changed": sum(n for (a, b), n in self.goals.items() if a != b),
+            "intents": self._deltas(self.intents),
+            "goals": self._deltas(self.goals),
+            "transitions": transitions,
+        }
+
+
+def run(
+    items: Iterator[Item],
+    candidate: str,
+    baseline: Optional[str],
+    workers: int,
+    chunk_lines: int = RECLASSIFY_CHUNK_LINES,
+    changes_path: Optional[str] = None,
+) -> Dict[str, object]:
+    report = Report()
+    changes = open(changes_path, "w", encoding="utf-8") if changes_path else None
+    in_flight: "deque[Future]" = deque()
+    window = max(2, workers * 2)  # begrenzt den Speicher: nur so viele Chunks gleichzeitig
+
+    def collect(fut: Future) -> None:
+        part = fut.result()
+        report.merge(part)
+        if changes is not None:
+            for row in part["changes"]:
+                changes.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(baseline, candidate)) as pool:
+            for chunk in _chunks(items, chunk_lines):
+                in_flight.append(pool.submit(_classify_chunk, chunk, changes is not None))
+                if len(in_flight) >= window:
+                    collect(in_flight.popleft())
+            while in_flight:
+                collect(in_flight.popleft())
+    finally:
+        if changes is not None:
+            changes.close()
+    return report.to_dict()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--candidate", required=True, help="geänderte Wissensbasis (JSON wie ptc_knowledge.json)")
+    base = ap.add_mutually_exclusive_group()
+    base.add_argument("--baseline", default=KNOWLEDGE_FILE, help="Vergleichsstand (Standard: aktuelle Wissensbasis)")
+    base.add_argument("--against-log", action="store_true",
+                      help="gegen die im Log gespeicherten Intents vergleichen (ohne maskierte Gesundheitsfragen)")
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--input", nargs="+", help="JSONL-Dateien (auch .gz) statt des Logs im aktuellen Verzeichnis")
+    src.add_argument("--sqlite", help="Fragen aus dieser SQLite-Datenbank lesen")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk-lines", type=int, default=RECLASSIFY_CHUNK_LINES)
+    ap.add_argument("--out", help="Bericht als JSON schreiben")
+    ap.add_argument("--changes", help="alle geänderten Zeilen als JSONL schreiben")
+    args = ap.parse_args()
+
+    baseline = None if args.against_log else args.baseline
+    try:
+        for path in filter(None, (baseline, args.candidate)):
+            _load_router(path)  # früh scheitern, nicht erst in jedem Worker
+    except (OSError, KnowledgeError) as e:
+        print(f"FEHLER: {e}")
+        return 1
+
+    if args.sqlite:
+        items: Iterator[Item] = _iter_sqlite(args.sqlite)
+    elif args.input:
+        items = _iter_files(args.input)
+    else:
+        items = _iter_jsonl_log()
+
+    t0 = time.perf_counter()
+    report = run(items, args.candidate, baseline, max(1, args.workers), args.chunk_lines, args.changes)
+    secs = time.perf_counter() - t0
+    report["seconds"] = round(secs, 2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{report['lines']} Zeilen in {secs:.1f} s ({report['lines'] / max(secs, 1e-9):,.0f}/s), "
+          f"{report['unparsable']} unlesbar")
+    print(f"Intent geändert: {report['intent_changed']} · Ziel geändert: {report['goal_changed']}")
+    if report["masked"]["lines"]:
+        print(f"davon mit maskierten Gesundheitsangaben: {report['masked']['lines']} Zeilen, "
+              f"Intent geändert: {report['masked']['intent_changed']}")
+    print(f"\n{'Intent':<36}{'vorher':>10}{'nachher':>10}{'Delta':>10}")
+    for name, d in report["intents"].items():
+        if d["delta"]:
+            print(f"{name:<36}{d['before']:>10}{d['after']:>10}{d['delta']:>+10}")
+    for t in report["transitions"][:10]:
+        print(f"\n{t['from']} -> {t['to']}: {t['count']}")
+        for text in t["samples"]:
+            print(f"    {text}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
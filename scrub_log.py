@@ -0,0 +1,216 @@
+"""
+Nachträgliche PII-Maskierung bereits geschriebener Fragen-Logs (ptc_pii).
+
+Alle Dateien werden zeilenweise über eine temporäre Datei gestreamt und per
+os.replace ersetzt – auch große Logs landen nie ganz im Speicher. Fragen mit
+einem Intent aus ptc_pii.HEALTH_INTENTS werden als Ganzes maskiert.
+
+Ohne --input/--sqlite: das JSONL-Log im aktuellen Verzeichnis, d. h. alle
+rotierten Segmente (gleicher Codec, Manifest wird nachgeführt) und das aktive
+Log. Danach
+- wird der Sidecar-Index des aktiven Logs neu aufgebaut,
+- der Cursor der Rollups auf die neuen Byte-Offsets umgerechnet (Zählungen bleiben),
+- der Volltextindex (ptc_search, verweist per Byte-Offset ins Log) gelöscht;
+  er baut sich beim nächsten Aufruf neu auf,
+- und die Fallback-Phrasen aus dem maskierten Log neu aufgebaut.
+
+--sqlite maskiert die Spalte text der SQLite-Datenbank in Batches
+(secure_delete, damit die alten Texte nicht in freien Seiten liegen bleiben).
+--input filtert nur die angegebenen Dateien (auch .gz, "-" = stdin) nach
+--output ("-" = stdout) oder mit --in-place.
+
+App und API vorher stoppen: der Log-Writer hält das aktive Log offen.
+
+    python scrub_log.py [--sqlite ptc_analytics.sqlite3] [--out report.json]
+    python scrub_log.py --input alt.jsonl.gz --output neu.jsonl.gz
+    python scrub_log.py --input a.jsonl b.jsonl --in-place
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from typing import BinaryIO, Dict, Optional
+
+import ptc_analytics
+import ptc_storage
+from ptc_pii import PII_CATEGORIES, count_hits, scrub_jsonl, scrub_jsonl_line, scrub_row
+
+SCRUB_SQLITE_BATCH = 5000
+
+
+def _scrub_stream(src: BinaryIO, dst: BinaryIO, counts: Dict[str, int], mark: int = -1) -> Dict[str, int]:
+    """
+    Filtert `src` nach `dst`. Liefert die neue Größe und – falls `mark` ein
+    Zeilenende in `src` ist – die neue Position dieses Offsets.
+    """
+    old = new = 0
+    moved = -1 if mark > 0 else 0
+    for line in src:
+        out = scrub_jsonl_line(line, counts)
+        dst.write(out)
+        old += len(line)
+        new += len(out)
+        if old == mark:
+            moved = new
+    return {"bytes": new, "mark": moved}
+
+
+# =========================================================
+# JSONL-Log im aktuellen Verzeichnis
+# =========================================================
+def _scrub_segment(entry: Dict[str, object], counts: Dict[str, int], mark: int) -> int:
+    path = os.path.join(ptc_storage.LOG_SEGMENT_DIR, str(entry["file"]))
+    codec = str(entry.get("codec", "gzip"))
+    with ptc_storage._open_segment(entry) as src, open(path + ".tmp", "wb") as raw:
+        with ptc_storage.SegmentBlockWriter(raw, codec) as dst:
+            res = _scrub_stream(src, dst, counts, mark)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(path + ".tmp", path)
+    entry["bytes"] = res["bytes"]
+    entry["blocks"] = dst.blocks
+    return res["mark"]
+
+
+def _scrub_active_log(counts: Dict[str, int], mark: int) -> int:
+    path = ptc_storage.QUESTIONS_LOG
+    with open(path, "rb") as src, open(path + ".tmp", "wb") as dst:
+        res = _scrub_stream(src, dst, counts, mark)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(path + ".tmp", path)
+    return res["mark"]
+
+
+def scrub_jsonl_store() -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    rollups = ptc_analytics.IntentRollups()
+    cursor: Dict[str, object] = rollups.state["cursor"] if rollups.state.get("backend") == "jsonl" else {}
+    at, offset = int(cursor.get("segments", 0)), int(cursor.get("offset", 0))
+    moved = offset
+
+    segments = ptc_storage.load_log_manifest()
+    for i, entry in enumerate(segments):
+        m = _scrub_segment(entry, counts, offset if i == at else -1)
+        if i == at:
+            moved = m
+        ptc_storage._save_log_manifest(segments)  # nach jedem Segment: Abbruch lässt ein gültiges Manifest zurück
+
+    if os.path.exists(ptc_storage.QUESTIONS_LOG):
+        m = _scrub_active_log(counts, offset if at == len(segments) else -1)
+        if at == len(segments):
+            moved = m
+            cursor["inode"] = os.stat(ptc_storage.QUESTIONS_LOG).st_ino
+        ptc_storage.LogIndex().rebuild()
+
+    if cursor and offset:
+        if moved < 0:  # Cursor lag nicht auf einem Zeilenende -> Rollups komplett neu
+            rollups.state = {"backend": None, "cursor": {}, "hourly": {}, "daily": {}}
+        else:
+            cursor["offset"] = moved
+        rollups._save()
+    return counts
+
+
+# =========================================================
+# SQLite
+# =========================================================
+def scrub_sqlite(path: str) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA secure_delete = ON")
+        last = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, text, intent FROM questions WHERE id > ? ORDER BY id LIMIT ?", (last, SCRUB_SQLITE_BATCH)
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row_id, text, intent in rows:
+                masked, hits = scrub_row(text or "", intent)
+                count_hits(counts, hits)
+                if hits:
+                    updates.append((masked, row_id))
+            with conn:
+                conn.executemany("UPDATE questions SET text = ? WHERE id = ?", updates)
+            last = rows[-1][0]
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return counts
+
+
+# =========================================================
+# Einzelne Dateien
+# =========================================================
+def _open(path: str, mode: str) -> BinaryIO:
+    if path == "-":
+        return sys.stdin.buffer if "r" in mode else sys.stdout.buffer
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+def scrub_file(src: str, dst: str) -> Dict[str, int]:
+    with _open(src, "rb") as fin, _open(dst + ".tmp" if dst != "-" else dst, "wb") as fout:
+        counts = scrub_jsonl(fin, fout)
+    if dst != "-":
+        os.replace(dst + ".tmp", dst)
+    return counts
+
+
+def _merge(total: Dict[str, int], counts: Dict[str, int]) -> None:
+    for key, n in counts.items():
+        total[key] = total.get(key, 0) + n
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--input", nargs="+", help="JSONL-Dateien (auch .gz, '-' = stdin) statt des Logs")
+    src.add_argument("--sqlite", help="Fragen in dieser SQLite-Datenbank maskieren")
+    dst = ap.add_mutually_exclusive_group()
+    dst.add_argument("--output", help="Ziel für --input mit genau einer Datei ('-' = stdout)")
+    dst.add_argument("--in-place", action="store_true", help="--input-Dateien ersetzen")
+    ap.add_argument("--out", help="Bericht als JSON schreiben")
+    args = ap.parse_args()
+
+    if args.input and not (args.in_place or (args.output and len(args.input) == 1)):
+        ap.error("--input braucht --in-place oder --output (mit genau einer Eingabe)")
+    if args.in_place and "-" in args.input:
+        ap.error("stdin kann nicht --in-place maskiert werden")
+
+    t0 = time.perf_counter()
+    counts: Dict[str, int] = {}
+    rebuild: Optional[ptc_storage.StorageBackend] = None
+    if args.input:
+        for path in args.input:
+            _merge(counts, scrub_file(path, path if args.in_place else args.output))
+    elif args.sqlite:
+        counts = scrub_sqlite(args.sqlite)
+        rebuild = ptc_storage.SQLiteStorage(args.sqlite)
+    else:
+        counts = scrub_jsonl_store()
+        rebuild = ptc_storage.JsonlStorage()
+
+    if rebuild is not None:
+        shutil.rmtree(ptc_analytics.SEARCH_DIR, ignore_errors=True)
+        ptc_analytics.rebuild_fallback_phrases(rebuild)  # gespeichert beim Schließen (atexit)
+    secs = time.perf_counter() - t0
+
+    report = {"seconds": round(secs, 2), **{k: counts.get(k, 0) for k in ("lines", "changed") + PII_CATEGORIES}}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    log = sys.stderr if args.output == "-" else sys.stdout
+    print(f"{report['lines']} Zeilen in {secs:.1f} s, {report['changed']} maskiert", file=log)
+    print("Treffer: " + ", ".join(f"{c}={report[c]}" for c in PII_CATEGORIES), file=log)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,13 @@
+"""Import-Zeit-Budget des Routing-Kerns (siehe check_import_time.py)."""
+from check_import_time import FORBIDDEN, IMPORT_BUDGET_MS, MODULE, measure
+
+
+def test_core_does_not_import_streamlit():
+    _, packages = measure()
+    assert not [p for p in FORBIDDEN if p in packages]
+
+
+def test_core_import_within_budget():
+    # bestes von drei Läufen, wie check_import_time.py
+    ms = min(measure()[0] for _ in range(3))
+    assert ms <= IMPORT_BUDGET_MS, f"{MODULE}: {ms:.1f} ms > {IMPORT_BUDGET_MS:.0f} ms"
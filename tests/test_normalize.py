@@ -0,0 +1,17 @@
+"""Schnellpfad normalize() == Referenz normalize_full() (siehe bench_normalize.py)."""
+import pytest
+
+from bench_normalize import EXOTIC, WORDS, build_corpus
+from ptc_core import normalize, normalize_full
+
+FUZZ_TEXTS = 50_000
+
+
+@pytest.mark.parametrize("text", WORDS + EXOTIC + ["", "   ", "Größe  \t Straße\n„Jumping“ 30€"])
+def test_known_inputs(text):
+    assert normalize(text) == normalize_full(text)
+
+
+def test_fuzzed_corpus():
+    mismatches = [t for t in build_corpus(FUZZ_TEXTS) if normalize(t) != normalize_full(t)]
+    assert mismatches == []
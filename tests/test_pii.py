@@ -0,0 +1,45 @@
+"""PII-Maskierung: Golden-Korpus aus bench_pii.py, Intent-Maskierung und JSONL-Filter."""
+import json
+
+import pytest
+
+from bench_pii import GOLDEN
+from ptc_pii import HEALTH_INTENTS, LOG_TEXT_MAX, sanitize_for_log, scrub_jsonl_line, scrub_row
+
+
+@pytest.mark.parametrize("text,expected", GOLDEN)
+def test_golden(text, expected):
+    got = sanitize_for_log(text)
+    assert got == expected
+    assert sanitize_for_log(got) == got  # scrub_log.py darf mehrfach laufen
+
+
+@pytest.mark.parametrize("intent", HEALTH_INTENTS)
+def test_health_intent_masks_whole_text(intent):
+    assert sanitize_for_log("Was kostet das Abo?", intent) == "[gesundheit]"
+    assert scrub_row("Was kostet das Abo?", intent) == ("[gesundheit]", {"gesundheit": 1})
+    assert scrub_row("[gesundheit]", intent) == ("[gesundheit]", {})
+
+
+def test_truncates_after_masking():
+    text = "x" * (LOG_TEXT_MAX - 5) + " max.mustermann@gmail.com"
+    assert sanitize_for_log(text) == ("x" * (LOG_TEXT_MAX - 5) + " [email]")[:LOG_TEXT_MAX]
+
+
+def test_jsonl_line_keeps_other_fields():
+    counts = {}
+    row = {"ts": "2025-01-01T10:00:00Z", "intent": "preise", "goal": None, "text": "Tel 0171 1234567"}
+    out = json.loads(scrub_jsonl_line(json.dumps(row).encode("utf-8") + b"\n", counts))
+    assert out == dict(row, text="Tel [telefon]")
+    assert counts == {"lines": 1, "changed": 1, "telefon": 1}
+
+    clean = json.dumps(dict(row, text="Wann ist Yoga?")).encode("utf-8") + b"\n"
+    assert scrub_jsonl_line(clean, counts) == clean  # unverändert -> byte-identisch
+
+
+def test_jsonl_line_masks_health_intent():
+    counts = {}
+    row = {"ts": "2025-01-01T10:00:00Z", "intent": HEALTH_INTENTS[0], "goal": None, "text": "mir tut alles weh"}
+    out = json.loads(scrub_jsonl_line(json.dumps(row).encode("utf-8"), counts))
+    assert out["text"] == "[gesundheit]"
+    assert counts["gesundheit"] == 1
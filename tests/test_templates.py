@@ -0,0 +1,37 @@
+"""Vorgerenderte Antworten == direkt gerenderte, für alle Intents × Ziele (siehe check_templates.py)."""
+import pytest
+
+from check_templates import check_conversations, check_templates
+from ptc_core import get_knowledge
+from ptc_tenants import TenantRegistry, get_tenants
+
+SNAPSHOTS = [None] + get_tenants().available()  # None = Wissensbasis ohne Studio
+
+
+def _knowledge(tid):
+    return get_knowledge() if tid is None else get_tenants().knowledge(tid)
+
+
+@pytest.mark.parametrize("tid", SNAPSHOTS)
+def test_templates_match_handlers(tid):
+    kb = _knowledge(tid)
+    assert kb.templates
+    assert check_templates(kb) == []
+
+
+@pytest.mark.parametrize("tid", SNAPSHOTS)
+def test_conversations_match_rendering(tid):
+    assert check_conversations(_knowledge(tid)) == []
+
+
+def test_tenant_override_templates(tmp_path):
+    (tmp_path / "hannover.json").write_text(
+        '{"studio": {"name": "PTC Hannover", "phone_display": "0511 123456"},'
+        ' "course_plan": {"Montag": [["18:00", "Zumba"]]}}',
+        encoding="utf-8",
+    )
+    kb = TenantRegistry(path=str(tmp_path), data_dir=str(tmp_path / "data")).knowledge("hannover")
+    assert any("0511 123456" in text for text in kb.templates.values())
+    assert any("Zumba" in text for text in kb.templates.values())
+    assert check_templates(kb) == []
+    assert check_conversations(kb) == []
@@ -0,0 +1,61 @@
+"""Mandanten-Storages: Verdrängung aus dem LRU darf keine Zähler kosten."""
+import os
+from threading import Event
+
+import ptc_storage
+from ptc_api import QueueSink
+from ptc_tenants import TenantRegistry
+
+INCREMENTS = 2000
+
+
+def _reopened_stats(tenants: TenantRegistry, tid: str):
+    storage = ptc_storage.SQLiteStorage(tenants.data_path(tid, os.path.basename(ptc_storage.SQLITE_PATH)))
+    try:
+        return storage.stats_snapshot()
+    finally:
+        ptc_storage.close_storage(storage)
+
+
+def test_eviction_keeps_queued_increments(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tenants = TenantRegistry(maxsize=1, data_dir=str(tmp_path / "data"))
+    sink = QueueSink(ptc_storage.StorageBackend())  # Basis-Studio wird hier nicht benutzt
+    storage = tenants.storage("a")
+    tenant_sink = sink.for_storage("a", storage)
+    gate = Event()
+    sink.queue.put((gate.wait, ()))  # hält den Sink-Thread an, bis "a" verdrängt ist
+    for _ in range(INCREMENTS):
+        tenant_sink.inc_intent("preise")
+    tenant_sink.inc_fallback()
+
+    tenants.storage("b")  # verdrängt und schließt "a", die Aufrufe stehen noch in der Queue
+    assert tenants.opened_storage("a") is None
+    gate.set()
+    sink.close()
+    assert sink.errors == 0
+    for open_storage in tenants.storages():
+        ptc_storage.close_storage(open_storage)
+
+    stats = _reopened_stats(tenants, "a")
+    assert stats["intents"] == {"preise": INCREMENTS}
+    assert stats["fallback"] == 1
+    assert storage.writer.counters["dropped"] == 0
+
+
+def test_closed_storage_still_writes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tenants = TenantRegistry(maxsize=1, data_dir=str(tmp_path / "data"))
+    storage = tenants.storage("a")
+    tenants.storage("b")
+    storage.inc_intent("kurse")  # Aufruf eines Halters, der die Verdrängung nicht mitbekommen hat
+    storage.log_question("Wann ist Yoga?", "kurse", None)
+    for open_storage in tenants.storages():
+        ptc_storage.close_storage(open_storage)
+
+    assert _reopened_stats(tenants, "a")["intents"] == {"kurse": 1}
+    reopened = tenants.storage("a")
+    try:
+        assert [r["text"] for r in reopened.read_tail(10)] == ["Wann ist Yoga?"]
+    finally:
+        ptc_storage.close_storage(reopened)